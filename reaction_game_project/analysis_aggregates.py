@@ -0,0 +1,831 @@
+"""Vectorized aggregations shared by the analysis charts and the printed report
+
+Every function does a single groupby/bincount pass over the loaded frames
+and returns a tidy DataFrame (or a plain dict for scalar summaries), so
+the charts and the report draw from one compute_aggregates() result.
+"""
+import numpy as np
+import pandas as pd
+
+from analysis_report import LEVELS, MAX_REACTION_MS, ROLLUP_BAND_MS, ROLLUP_BANDS
+
+# Chart 3 buckets (right-closed, like pd.cut(..., include_lowest=True))
+REACTION_BINS = [0, 200, 300, 400, 500, 600, 800]
+REACTION_LABELS = ['<200ms', '200-300ms', '300-400ms', '400-500ms', '500-600ms', '>600ms']
+
+
+def successful_mask(rounds_df):
+    return (rounds_df['response_accuracy'] == True) & (rounds_df['reaction_time'] < MAX_REACTION_MS)
+
+
+def reaction_distribution(reactions):
+    """Count of successful reactions per millisecond value: [reaction_time, count]"""
+    values = np.asarray(reactions)
+    if len(values) and np.issubdtype(values.dtype, np.integer) and values.min() >= 0:
+        counts = np.bincount(values)
+        present = np.flatnonzero(counts)
+        return pd.DataFrame({'reaction_time': present, 'count': counts[present]})
+
+    counts = pd.Series(values).value_counts().sort_index()
+    return pd.DataFrame({'reaction_time': counts.index.to_numpy(), 'count': counts.to_numpy()})
+
+
+def distribution_summary(distribution):
+    """Count, mean, median, min, max and sample std computed from the per-value counts"""
+    values = distribution['reaction_time'].to_numpy(np.float64)
+    counts = distribution['count'].to_numpy(np.int64)
+    n = int(counts.sum())
+    if n == 0:
+        return {'count': 0}
+
+    mean = float((values * counts).sum() / n)
+    std = float(np.sqrt((counts * (values - mean) ** 2).sum() / (n - 1))) if n > 1 else float('nan')
+
+    # Median as pandas does: middle value, or the mean of the two middle values
+    cumulative = np.cumsum(counts)
+    lower = values[np.searchsorted(cumulative, (n - 1) // 2 + 1)]
+    upper = values[np.searchsorted(cumulative, n // 2 + 1)]
+
+    return {
+        'count': n,
+        'mean': mean,
+        'median': float((lower + upper) / 2),
+        'min': distribution['reaction_time'].iloc[0],
+        'max': distribution['reaction_time'].iloc[-1],
+        'std': std,
+    }
+
+
+def reaction_histogram(distribution):
+    """Fixed 1 ms histogram over [0, MAX_REACTION_MS): counts[t] is the number of reactions in [t, t + 1)"""
+    values = np.floor(distribution['reaction_time'].to_numpy(np.float64)).astype(np.int64)
+    keep = (values >= 0) & (values < MAX_REACTION_MS)
+    return np.bincount(values[keep], weights=distribution['count'].to_numpy()[keep],
+                       minlength=MAX_REACTION_MS).astype(np.int64)
+
+
+def binned_kde(histogram, count, std, bw_adjust=1.0, cut=0):
+    """Gaussian KDE of a 1 ms histogram, evaluated on a 1 ms grid: (grid, density)
+
+    The bandwidth is Scott's rule on the sample count and std, as in the
+    gaussian_kde behind seaborn's kde=True, and the kernel is convolved with
+    the histogram by FFT. The grid reaches cut bandwidths past the smallest
+    and largest occupied bins (0, the histplot default, stops at the data).
+    For whole-millisecond data this equals the KDE of the raw reactions, at a
+    cost set by the bin count rather than the sample count. Returns None when
+    there is no spread to estimate.
+    """
+    present = np.flatnonzero(histogram)
+    if count < 2 or not len(present) or not std > 0:
+        return None
+
+    bandwidth = std * count ** (-1 / 5) * bw_adjust
+    reach = int(np.ceil(cut * bandwidth))
+    first, last = present[0], present[-1]
+    grid = np.arange(first - reach, last + reach + 1)
+
+    # Kernel wide enough that every grid point sees every occupied bin
+    span = len(grid) - 1
+    offsets = np.arange(-span, span + 1)
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+
+    signal = np.asarray(histogram[first:last + 1], dtype=np.float64)
+    size = 1 << int(len(signal) + len(kernel) - 2).bit_length()
+    full = np.fft.irfft(np.fft.rfft(signal, size) * np.fft.rfft(kernel, size), size)
+    # full[t] is the density at first + t - span
+    start = grid[0] - first + span
+    density = np.clip(full[start:start + len(grid)], 0, None) / count
+    return grid, density
+
+
+def reaction_levels(distribution):
+    """Reaction level distribution for the report: [level, range, count, percent]"""
+    values = distribution['reaction_time'].to_numpy()
+    counts = distribution['count'].to_numpy()
+    total = counts.sum()
+
+    rows = []
+    for level, label, low, high in LEVELS:
+        mask = np.ones(len(values), dtype=bool)
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values < high
+        count = int(counts[mask].sum())
+        rows.append({'level': level, 'range': label, 'count': count,
+                     'percent': count / total * 100 if total else 0.0})
+    return pd.DataFrame(rows)
+
+
+def session_accuracy(sessions_df, rounds_df):
+    """Per-session accuracy for sessions that have rounds: [session_id, rounds, correct, accuracy]"""
+    rounds = rounds_df[rounds_df['session_id'].isin(sessions_df['id'])]
+    grouped = rounds.groupby('session_id')['response_accuracy'].agg(['size', 'sum'])
+    result = pd.DataFrame({
+        'session_id': grouped.index.to_numpy(),
+        'rounds': grouped['size'].to_numpy(),
+        'correct': grouped['sum'].to_numpy(),
+    })
+    result['accuracy'] = result['correct'] / result['rounds'] * 100
+    return result
+
+
+def reaction_category_codes(reaction_times):
+    """Index into REACTION_LABELS for each value, -1 outside the bins"""
+    values = np.asarray(reaction_times)
+    codes = np.searchsorted(REACTION_BINS, values, side='left') - 1
+    codes[values == REACTION_BINS[0]] = 0
+    codes[(values < REACTION_BINS[0]) | (values > REACTION_BINS[-1])] = -1
+    return codes
+
+
+def round_bucket_matrix(successful_rounds):
+    """Round number x reaction bucket counts (rows: observed rounds, columns: all buckets)"""
+    codes = reaction_category_codes(successful_rounds['reaction_time'].to_numpy())
+    keep = codes >= 0
+    round_index, rounds = pd.factorize(successful_rounds['round_number'].to_numpy()[keep], sort=True)
+
+    n_buckets = len(REACTION_LABELS)
+    flat = np.bincount(round_index * n_buckets + codes[keep], minlength=len(rounds) * n_buckets)
+    return pd.DataFrame(flat.reshape(len(rounds), n_buckets),
+                        index=pd.Index(rounds, name='round_number'),
+                        columns=pd.Index(REACTION_LABELS, name='reaction_category'))
+
+
+def user_summary(users_df, sessions_df, successful_rounds):
+    """Per-user play count and successful reaction stats, in users_df order:
+    [user_id, play_count, total_rounds, reaction_sum, avg_reaction_time]"""
+    play_count = sessions_df.groupby('user_id').size()
+    reactions = successful_rounds.groupby('user_id')['reaction_time'].agg(['size', 'sum'])
+
+    result = pd.DataFrame({'user_id': users_df['id'].to_numpy()})
+    result['play_count'] = play_count.reindex(result['user_id']).fillna(0).astype(np.int64).to_numpy()
+    result['total_rounds'] = reactions['size'].reindex(result['user_id']).fillna(0).astype(np.int64).to_numpy()
+    result['reaction_sum'] = reactions['sum'].reindex(result['user_id']).fillna(0).to_numpy()
+
+    result = result[(result['total_rounds'] > 0) & (result['play_count'] > 0)].reset_index(drop=True)
+    result['avg_reaction_time'] = result['reaction_sum'] / result['total_rounds']
+    return result
+
+
+def compute_aggregates(users_df, sessions_df, rounds_df):
+    """Run every aggregation once; charts and the report read from the result"""
+    has_rounds = (not rounds_df.empty and 'response_accuracy' in rounds_df.columns
+                  and 'reaction_time' in rounds_df.columns)
+
+    aggregates = {
+        'totals': {
+            'users': len(users_df),
+            'sessions': len(sessions_df),
+            'rounds': len(rounds_df),
+            'correct': int(rounds_df['response_accuracy'].sum()) if has_rounds else 0,
+        },
+        'distribution': None,
+        'summary': {'count': 0},
+        'levels': None,
+        'session_accuracy': None,
+        'round_buckets': None,
+        'user_stats': None,
+    }
+    if not has_rounds:
+        return aggregates
+
+    successful_rounds = rounds_df[successful_mask(rounds_df)]
+    distribution = reaction_distribution(successful_rounds['reaction_time'].to_numpy())
+
+    aggregates['distribution'] = distribution
+    aggregates['summary'] = distribution_summary(distribution)
+    aggregates['levels'] = reaction_levels(distribution)
+    if 'round_number' in successful_rounds.columns:
+        aggregates['round_buckets'] = round_bucket_matrix(successful_rounds)
+    if not sessions_df.empty:
+        aggregates['session_accuracy'] = session_accuracy(sessions_df, rounds_df)
+        if not users_df.empty and 'user_id' in rounds_df.columns:
+            aggregates['user_stats'] = user_summary(users_df, sessions_df, successful_rounds)
+    return aggregates
+
+
+def has_archive_column(conn, session_table):
+    schema, _, table = session_table.rpartition('.')
+    pragma = f"PRAGMA {schema + '.' if schema else ''}table_info({table})"
+    return any(row[1] == 'rounds_archive' for row in conn.execute(pragma))
+
+
+# Archived rounds are decoded about this many at a time, so the sql and stream
+# modes never hold more than one batch of them in memory
+ARCHIVE_BATCH_ROUNDS = 50000
+
+
+def _archived_frame(archives):
+    """Decode [(session_id, PackedRounds)] into one round frame (np.frombuffer, no per-row parsing)"""
+    packed = [p for _, p in archives]
+    reaction_time = np.concatenate([p.reaction_time for p in packed]).astype(np.int64)
+    nulls = np.concatenate([p.reaction_time_null for p in packed])
+    if nulls.any():
+        # NULL becomes NaN, as pandas does when reading the column from SQLite
+        reaction_time = reaction_time.astype(np.float64)
+        reaction_time[nulls] = np.nan
+    return pd.DataFrame({
+        'session_id': np.repeat([session_id for session_id, _ in archives], [len(p) for p in packed]),
+        'round_number': np.concatenate([p.round_number for p in packed]).astype(np.int64),
+        'stimulus_color': np.concatenate([p.stimulus_colors() for p in packed]),
+        'reaction_time': reaction_time,
+        'response_accuracy': np.concatenate([p.response_accuracy for p in packed]).astype(np.int64),
+    })
+
+
+def archived_round_batches(conn, session_table, batch_rounds=None):
+    """Rounds packed into game_session.rounds_archive by the app's archive job, in bounded batches
+
+    archive.iter_archives reads a few hundred blobs per query; each yielded frame
+    holds the rounds of whole sessions, about batch_rounds (default
+    ARCHIVE_BATCH_ROUNDS) of them:
+    [session_id, round_number, stimulus_color, reaction_time, response_accuracy].
+    Yields nothing when the database has no archived sessions.
+    """
+    # archive.py also imports SQLAlchemy; only pay for it when the table can hold archives
+    if not has_archive_column(conn, session_table):
+        return
+    from archive import iter_archives
+
+    batch_rounds = batch_rounds or ARCHIVE_BATCH_ROUNDS
+    batch, size = [], 0
+    for session_id, packed in iter_archives(conn, session_table=session_table):
+        batch.append((session_id, packed))
+        size += len(packed)
+        if size >= batch_rounds:
+            yield _archived_frame(batch)
+            batch, size = [], 0
+    if batch:
+        yield _archived_frame(batch)
+
+
+def archived_rounds_frame(conn, session_table):
+    """All archived rounds in one frame, for the pandas mode that loads every round anyway
+
+    Returns None when the database has no archived sessions.
+    """
+    batches = list(archived_round_batches(conn, session_table))
+    return pd.concat(batches, ignore_index=True) if batches else None
+
+
+def with_archived_rounds(conn, session_table, round_table):
+    """Name of a round source that includes archived rounds, for the SQL aggregations
+
+    The archives are decoded batch by batch into a temp table on this connection
+    and a temp view unions them with the raw rows; without archives round_table
+    is returned.
+    """
+    batches = archived_round_batches(conn, session_table)
+    batch = next(batches, None)
+    if batch is None:
+        return round_table
+
+    conn.execute("DROP VIEW IF EXISTS temp.all_rounds")
+    conn.execute("DROP TABLE IF EXISTS temp.archived_round")
+    conn.execute("""
+        CREATE TEMP TABLE archived_round (
+            session_id INTEGER, round_number INTEGER, stimulus_color TEXT,
+            reaction_time INTEGER, response_accuracy INTEGER)
+    """)
+    while batch is not None:
+        batch = batch.astype(object).where(batch.notna(), None)
+        conn.executemany("INSERT INTO temp.archived_round VALUES (?, ?, ?, ?, ?)",
+                         batch.itertuples(index=False, name=None))
+        batch = next(batches, None)
+    conn.execute(f"""
+        CREATE TEMP VIEW all_rounds AS
+        SELECT id, session_id, round_number, stimulus_color, reaction_time, response_accuracy
+        FROM {round_table}
+        UNION ALL
+        SELECT NULL, session_id, round_number, stimulus_color, reaction_time, response_accuracy
+        FROM temp.archived_round
+    """)
+    return 'temp.all_rounds'
+
+
+def _bucket_case(column):
+    """SQL CASE expression equivalent to reaction_category_codes()"""
+    whens = ' '.join(f'WHEN {column} <= {high} THEN {i}'
+                     for i, high in enumerate(REACTION_BINS[1:]))
+    return f'CASE {whens} END'
+
+
+def sql_aggregates(conn, user_table, session_table, round_table, active_users_only=True):
+    """Same result as compute_aggregates(), computed inside SQLite with GROUP BY/CASE
+
+    Only per-value, per-session, per-round-bucket and per-user rows come back,
+    never the raw rounds, so memory does not depend on the size of game_round.
+    With active_users_only=False every user is kept in user_stats, which is
+    what merge_aggregates() needs for partial results.
+    """
+    successful = f'gr.response_accuracy = 1 AND gr.reaction_time < {MAX_REACTION_MS}'
+
+    n_users = conn.execute(f"SELECT COUNT(*) FROM {user_table}").fetchone()[0]
+    n_sessions = conn.execute(f"SELECT COUNT(*) FROM {session_table}").fetchone()[0]
+    n_rounds, n_correct = conn.execute(
+        f"SELECT COUNT(*), COALESCE(SUM(response_accuracy), 0) FROM {round_table}").fetchone()
+
+    aggregates = {
+        'totals': {'users': n_users, 'sessions': n_sessions, 'rounds': n_rounds, 'correct': n_correct},
+        'distribution': None,
+        'summary': {'count': 0},
+        'levels': None,
+        'session_accuracy': None,
+        'round_buckets': None,
+        'user_stats': None,
+    }
+    if not n_rounds:
+        return aggregates
+
+    distribution = pd.read_sql_query(f"""
+        SELECT gr.reaction_time, COUNT(*) AS count
+        FROM {round_table} gr
+        WHERE {successful}
+        GROUP BY gr.reaction_time
+        ORDER BY gr.reaction_time
+    """, conn)
+    aggregates['distribution'] = distribution
+    aggregates['summary'] = distribution_summary(distribution)
+    aggregates['levels'] = reaction_levels(distribution)
+
+    buckets = pd.read_sql_query(f"""
+        SELECT gr.round_number, {_bucket_case('gr.reaction_time')} AS bucket, COUNT(*) AS count
+        FROM {round_table} gr
+        WHERE {successful} AND gr.reaction_time >= {REACTION_BINS[0]}
+        GROUP BY gr.round_number, bucket
+    """, conn)
+    rounds = np.sort(buckets['round_number'].unique())
+    matrix = np.zeros((len(rounds), len(REACTION_LABELS)), dtype=np.int64)
+    matrix[np.searchsorted(rounds, buckets['round_number']), buckets['bucket']] = buckets['count']
+    aggregates['round_buckets'] = pd.DataFrame(
+        matrix,
+        index=pd.Index(rounds, name='round_number'),
+        columns=pd.Index(REACTION_LABELS, name='reaction_category'))
+
+    if not n_sessions:
+        return aggregates
+
+    accuracy = pd.read_sql_query(f"""
+        SELECT gr.session_id, COUNT(*) AS rounds, SUM(gr.response_accuracy) AS correct
+        FROM {round_table} gr
+        JOIN {session_table} gs ON gr.session_id = gs.id
+        GROUP BY gr.session_id
+        ORDER BY gr.session_id
+    """, conn)
+    accuracy['accuracy'] = accuracy['correct'] / accuracy['rounds'] * 100
+    aggregates['session_accuracy'] = accuracy
+
+    if not n_users:
+        return aggregates
+
+    users = pd.read_sql_query(f"""
+        SELECT u.id AS user_id,
+               COALESCE(p.play_count, 0) AS play_count,
+               COALESCE(r.total_rounds, 0) AS total_rounds,
+               COALESCE(r.reaction_sum, 0) AS reaction_sum
+        FROM {user_table} u
+        LEFT JOIN (SELECT user_id, COUNT(*) AS play_count
+                   FROM {session_table} GROUP BY user_id) p ON p.user_id = u.id
+        LEFT JOIN (SELECT gs.user_id, COUNT(*) AS total_rounds, SUM(gr.reaction_time) AS reaction_sum
+                   FROM {round_table} gr
+                   JOIN {session_table} gs ON gr.session_id = gs.id
+                   WHERE {successful}
+                   GROUP BY gs.user_id) r ON r.user_id = u.id
+        {'WHERE p.play_count > 0 AND r.total_rounds > 0' if active_users_only else ''}
+        ORDER BY u.id
+    """, conn)
+    users['reaction_sum'] = users['reaction_sum'].astype(np.float64)
+    users['avg_reaction_time'] = users['reaction_sum'] / users['total_rounds']
+    aggregates['user_stats'] = users
+    return aggregates
+
+
+def _grow(array, size):
+    """Return array zero-padded to at least size entries"""
+    if size <= len(array):
+        return array
+    grown = np.zeros(max(size, 2 * len(array)), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class StreamingAggregator:
+    """Constant-memory aggregation over game_round read in bounded chunks
+
+    Memory grows with the number of sessions and users (per-id counters) but
+    not with the number of rounds: each chunk feeds
+      - Welford/Chan mean and variance plus min/max of successful reactions
+      - a fixed 1 ms histogram of successful reactions, which also gives the
+        exact median because reaction times are integer milliseconds
+      - a round number x reaction bucket count matrix for the heatmap
+      - per-session round/correct counts and per-user successful count/sum
+    finalize() returns the same structure as compute_aggregates().
+    """
+
+    def __init__(self):
+        self.n_rounds = 0
+        self.n_correct = 0
+        # Welford state for successful reactions
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.histogram = np.zeros(MAX_REACTION_MS, dtype=np.int64)
+        self.negative = {}
+        self.round_buckets = {}
+        self.session_rounds = np.zeros(0, dtype=np.int64)
+        self.session_correct = np.zeros(0, dtype=np.int64)
+        self.session_exists = np.zeros(0, dtype=bool)
+        self.user_plays = np.zeros(0, dtype=np.int64)
+        self.user_rounds = np.zeros(0, dtype=np.int64)
+        self.user_sum = np.zeros(0, dtype=np.float64)
+        self.user_ids = []
+
+    def add_users(self, ids):
+        self.user_ids.extend(int(i) for i in ids)
+
+    def add_sessions(self, session_ids, user_ids):
+        session_ids = np.asarray(session_ids, dtype=np.int64)
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        if not len(session_ids):
+            return
+        self.session_exists = _grow(self.session_exists, int(session_ids.max()) + 1)
+        self.session_exists[session_ids] = True
+        self.user_plays = _grow(self.user_plays, int(user_ids.max()) + 1)
+        self.user_plays += np.bincount(user_ids, minlength=len(self.user_plays))[:len(self.user_plays)]
+
+    def add_rounds(self, session_ids, round_numbers, reaction_times, accuracies, user_ids):
+        """Fold one chunk of rounds; reaction_times/user_ids may contain NaN for NULL"""
+        session_ids = np.asarray(session_ids, dtype=np.int64)
+        accuracies = np.asarray(accuracies, dtype=np.float64)
+        reaction_times = np.asarray(reaction_times, dtype=np.float64)
+        if not len(session_ids):
+            return
+
+        self.n_rounds += len(session_ids)
+        correct = accuracies == 1
+        self.n_correct += int(np.nansum(accuracies))
+
+        # Per-session partial counts
+        size = int(session_ids.max()) + 1
+        self.session_rounds = _grow(self.session_rounds, size)
+        self.session_correct = _grow(self.session_correct, size)
+        self.session_rounds[:size] += np.bincount(session_ids, minlength=size)
+        self.session_correct[:size] += np.bincount(session_ids, weights=correct, minlength=size).astype(np.int64)
+
+        successful = correct & (reaction_times < MAX_REACTION_MS)
+        values = reaction_times[successful].astype(np.int64)
+        if not len(values):
+            return
+
+        # Chan et al. parallel update of the Welford accumulators
+        chunk_count = len(values)
+        chunk_mean = values.mean()
+        chunk_m2 = ((values - chunk_mean) ** 2).sum()
+        delta = chunk_mean - self.mean
+        total = self.count + chunk_count
+        self.mean += delta * chunk_count / total
+        self.m2 += chunk_m2 + delta ** 2 * self.count * chunk_count / total
+        self.count = total
+        self.min = int(values.min()) if self.min is None else min(self.min, int(values.min()))
+        self.max = int(values.max()) if self.max is None else max(self.max, int(values.max()))
+
+        non_negative = values >= 0
+        self.histogram += np.bincount(values[non_negative], minlength=MAX_REACTION_MS)
+        for value in values[~non_negative]:
+            self.negative[int(value)] = self.negative.get(int(value), 0) + 1
+
+        codes = reaction_category_codes(values)
+        rounds = np.asarray(round_numbers, dtype=np.int64)[successful]
+        for round_number, code in zip(rounds[codes >= 0].tolist(), codes[codes >= 0].tolist()):
+            counts = self.round_buckets.setdefault(round_number, [0] * len(REACTION_LABELS))
+            counts[code] += 1
+
+        users = np.asarray(user_ids, dtype=np.float64)[successful]
+        known = ~np.isnan(users)
+        users = users[known].astype(np.int64)
+        if len(users):
+            size = int(users.max()) + 1
+            self.user_rounds = _grow(self.user_rounds, size)
+            self.user_sum = _grow(self.user_sum, size)
+            self.user_rounds[:size] += np.bincount(users, minlength=size)
+            self.user_sum[:size] += np.bincount(users, weights=values[known], minlength=size)
+
+    def distribution(self):
+        present = np.flatnonzero(self.histogram)
+        negative = sorted(self.negative.items())
+        return pd.DataFrame({
+            'reaction_time': np.concatenate([[v for v, _ in negative], present]).astype(np.int64),
+            'count': np.concatenate([[c for _, c in negative], self.histogram[present]]).astype(np.int64),
+        })
+
+    def finalize(self, active_users_only=True):
+        aggregates = {
+            'totals': {
+                'users': len(self.user_ids),
+                'sessions': int(self.session_exists.sum()),
+                'rounds': self.n_rounds,
+                'correct': self.n_correct,
+            },
+            'distribution': None,
+            'summary': {'count': 0},
+            'levels': None,
+            'session_accuracy': None,
+            'round_buckets': None,
+            'user_stats': None,
+        }
+        if not self.n_rounds:
+            return aggregates
+
+        distribution = self.distribution()
+        summary = distribution_summary(distribution)
+        if self.count:
+            summary.update({
+                'mean': self.mean,
+                'std': float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else float('nan'),
+                'min': self.min,
+                'max': self.max,
+            })
+        aggregates['distribution'] = distribution
+        aggregates['summary'] = summary
+        aggregates['levels'] = reaction_levels(distribution)
+
+        rounds = sorted(self.round_buckets)
+        aggregates['round_buckets'] = pd.DataFrame(
+            np.array([self.round_buckets[r] for r in rounds], dtype=np.int64).reshape(len(rounds), len(REACTION_LABELS)),
+            index=pd.Index(rounds, name='round_number', dtype=np.int64),
+            columns=pd.Index(REACTION_LABELS, name='reaction_category'))
+
+        if not aggregates['totals']['sessions']:
+            return aggregates
+
+        size = len(self.session_rounds)
+        exists = _grow(self.session_exists, size)[:size]
+        session_ids = np.flatnonzero(exists & (self.session_rounds > 0))
+        accuracy = pd.DataFrame({
+            'session_id': session_ids,
+            'rounds': self.session_rounds[session_ids],
+            'correct': self.session_correct[session_ids],
+        })
+        accuracy['accuracy'] = accuracy['correct'] / accuracy['rounds'] * 100
+        aggregates['session_accuracy'] = accuracy
+
+        if not self.user_ids:
+            return aggregates
+
+        user_ids = np.array(self.user_ids, dtype=np.int64)
+        size = max(len(self.user_plays), len(self.user_rounds), int(user_ids.max()) + 1)
+        plays = _grow(self.user_plays, size)
+        user_rounds = _grow(self.user_rounds, size)
+        user_sum = _grow(self.user_sum, size)
+        users = pd.DataFrame({
+            'user_id': user_ids,
+            'play_count': plays[user_ids],
+            'total_rounds': user_rounds[user_ids],
+            'reaction_sum': user_sum[user_ids],
+        })
+        if active_users_only:
+            users = users[(users['total_rounds'] > 0) & (users['play_count'] > 0)].reset_index(drop=True)
+        users['avg_reaction_time'] = users['reaction_sum'] / users['total_rounds']
+        aggregates['user_stats'] = users
+        return aggregates
+
+
+def _fetch_chunks(conn, query, chunk_size):
+    cursor = conn.execute(query)
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def stream_aggregates(conn, user_table, session_table, round_table, chunk_size=50000,
+                      active_users_only=True):
+    """Same result as compute_aggregates(), reading game_round chunk by chunk
+
+    Archived rounds (game_session.rounds_archive) are decoded chunk_size at a
+    time after the raw rows and fed to the same aggregator.
+    """
+    aggregator = StreamingAggregator()
+    archived = has_archive_column(conn, session_table)
+    # Owner of each session (by id - base), only needed to attribute archived rounds
+    owners = np.zeros(0, dtype=np.float64)
+
+    # Per-session counters are arrays indexed by id; shard files start their ids
+    # at a large offset, so index from the smallest id in this file instead
+    base = conn.execute(f"""
+        SELECT MIN(id) FROM (SELECT MIN(id) AS id FROM {session_table}
+                             UNION ALL SELECT MIN(session_id) FROM {round_table})
+    """).fetchone()[0]
+    base = base - 1 if base else 0
+
+    for rows in _fetch_chunks(conn, f"SELECT id FROM {user_table} ORDER BY id", chunk_size):
+        aggregator.add_users(row[0] for row in rows)
+
+    for rows in _fetch_chunks(conn, f"SELECT id - {base}, user_id FROM {session_table}", chunk_size):
+        session_ids, user_ids = zip(*rows)
+        aggregator.add_sessions(session_ids, user_ids)
+        if archived:
+            ids = np.asarray(session_ids, dtype=np.int64)
+            size = len(owners)
+            owners = _grow(owners, int(ids.max()) + 1)
+            owners[size:] = np.nan
+            owners[ids] = user_ids
+
+    query = f"""
+        SELECT gr.session_id - {base}, gr.round_number, gr.reaction_time, gr.response_accuracy, gs.user_id
+        FROM {round_table} gr
+        LEFT JOIN {session_table} gs ON gr.session_id = gs.id
+    """
+    for rows in _fetch_chunks(conn, query, chunk_size):
+        session_ids, round_numbers, reaction_times, accuracies, user_ids = zip(*rows)
+        aggregator.add_rounds(
+            session_ids, round_numbers,
+            np.array(reaction_times, dtype=np.float64),
+            np.array(accuracies, dtype=np.float64),
+            np.array(user_ids, dtype=np.float64))
+
+    for batch in archived_round_batches(conn, session_table, chunk_size) if archived else ():
+        session_ids = batch['session_id'].to_numpy(np.int64) - base
+        aggregator.add_rounds(
+            session_ids, batch['round_number'],
+            batch['reaction_time'].to_numpy(np.float64),
+            batch['response_accuracy'].to_numpy(np.float64),
+            owners[session_ids])
+
+    aggregates = aggregator.finalize(active_users_only)
+    if base and aggregates['session_accuracy'] is not None:
+        aggregates['session_accuracy']['session_id'] += base
+    return aggregates
+
+
+def band_median(band_counts):
+    """Median interpolated linearly inside the 100 ms band that holds it"""
+    counts = np.asarray(band_counts, dtype=np.float64)
+    n = counts.sum()
+    if not n:
+        return float('nan')
+    cumulative = np.cumsum(counts)
+    band = int(np.searchsorted(cumulative, n / 2))
+    before = cumulative[band - 1] if band else 0.0
+    return band * ROLLUP_BAND_MS + (n / 2 - before) / counts[band] * ROLLUP_BAND_MS
+
+
+def rollup_aggregates(conn, user_table, active_users_only=True):
+    """Aggregates read from the user_stats/daily_stats rollups the app maintains
+
+    Only finished sessions are rolled up. Per-millisecond values, per-session
+    accuracy and the round heatmap are not kept in the rollups, so
+    distribution holds 100 ms band midpoints, the median is interpolated
+    within its band, and session_accuracy/round_buckets are None.
+    """
+    daily = pd.read_sql_query("SELECT * FROM daily_stats ORDER BY day", conn)
+    bands = daily[ROLLUP_BANDS].sum().to_numpy(np.int64) if not daily.empty \
+        else np.zeros(len(ROLLUP_BANDS), dtype=np.int64)
+
+    aggregates = {
+        'totals': {
+            'users': conn.execute(f"SELECT COUNT(*) FROM {user_table}").fetchone()[0],
+            'sessions': int(daily['sessions'].sum()),
+            'rounds': int(daily['total_rounds'].sum()),
+            'correct': int(daily['correct_count'].sum()),
+        },
+        'distribution': None,
+        'summary': {'count': 0},
+        'levels': None,
+        'session_accuracy': None,
+        'round_buckets': None,
+        'user_stats': None,
+    }
+    if not aggregates['totals']['rounds']:
+        return aggregates
+
+    present = np.flatnonzero(bands)
+    distribution = pd.DataFrame({
+        'reaction_time': present * ROLLUP_BAND_MS + ROLLUP_BAND_MS // 2,
+        'count': bands[present],
+    })
+    aggregates['distribution'] = distribution
+
+    n = int(daily['successful_rounds'].sum())
+    if n:
+        total = float(daily['reaction_time_sum'].sum())
+        squares = float(daily['reaction_time_sq_sum'].sum())
+        mean = total / n
+        aggregates['summary'] = {
+            'count': n,
+            'mean': mean,
+            'median': band_median(bands),
+            'min': int(daily['best_time'].min()),
+            'max': int(daily['worst_time'].max()),
+            'std': float(np.sqrt(max(squares - n * mean * mean, 0) / (n - 1))) if n > 1 else float('nan'),
+        }
+
+    # Level boundaries fall on band edges, so the level counts are exact
+    band_starts = np.arange(len(ROLLUP_BANDS)) * ROLLUP_BAND_MS
+    aggregates['levels'] = reaction_levels(pd.DataFrame({'reaction_time': band_starts, 'count': bands}))
+
+    users = pd.read_sql_query(f"""
+        SELECT user_id, play_count, successful_rounds AS total_rounds,
+               reaction_time_sum AS reaction_sum
+        FROM user_stats
+        {'WHERE play_count > 0 AND successful_rounds > 0' if active_users_only else ''}
+        ORDER BY user_id
+    """, conn)
+    users['reaction_sum'] = users['reaction_sum'].astype(np.float64)
+    users['avg_reaction_time'] = users['reaction_sum'] / users['total_rounds']
+    aggregates['user_stats'] = users
+    return aggregates
+
+
+def _pool_summaries(summaries):
+    """Count, mean, std, min and max of the union of disjoint samples (Chan et al.)"""
+    parts = [summary for summary in summaries if summary.get('count')]
+    n = sum(summary['count'] for summary in parts)
+    if not n:
+        return {'count': 0}
+
+    mean = sum(summary['count'] * summary['mean'] for summary in parts) / n
+    m2 = sum((summary['count'] - 1) * summary['std'] ** 2 if summary['count'] > 1 else 0.0
+             for summary in parts)
+    m2 += sum(summary['count'] * (summary['mean'] - mean) ** 2 for summary in parts)
+    return {
+        'count': n,
+        'mean': mean,
+        'min': min(summary['min'] for summary in parts),
+        'max': max(summary['max'] for summary in parts),
+        'std': float(np.sqrt(m2 / (n - 1))) if n > 1 else float('nan'),
+    }
+
+
+def merge_aggregates(partials, n_users=None, binned=False):
+    """Combine aggregates computed separately over disjoint sets of sessions
+
+    Each partial is a compute/sql/stream/rollup_aggregates() result for one
+    database file (for example one shard). Counts, per-value histograms and
+    per-user sums simply add up, so the summary recomputed from the merged
+    distribution matches a single pass over all rows. Binned (rollup)
+    distributions cannot give exact moments, so their summaries are pooled
+    instead and the median is interpolated from the merged bands.
+
+    Partials should be built with active_users_only=False: a user whose
+    sessions are spread over several files is filtered once, after merging.
+    n_users replaces the summed user count when the partials share one user
+    table.
+    """
+    totals = {key: sum(p['totals'][key] for p in partials)
+              for key in ('users', 'sessions', 'rounds', 'correct')}
+    if n_users is not None:
+        totals['users'] = n_users
+
+    aggregates = {
+        'totals': totals,
+        'distribution': None,
+        'summary': {'count': 0},
+        'levels': None,
+        'session_accuracy': None,
+        'round_buckets': None,
+        'user_stats': None,
+    }
+
+    distributions = [p['distribution'] for p in partials if p['distribution'] is not None]
+    if not distributions:
+        return aggregates
+
+    distribution = pd.concat(distributions).groupby('reaction_time', as_index=False)['count'].sum()
+    aggregates['distribution'] = distribution
+    if binned:
+        summary = _pool_summaries([p['summary'] for p in partials])
+        if summary['count']:
+            bands = np.zeros(len(ROLLUP_BANDS), dtype=np.int64)
+            np.add.at(bands, distribution['reaction_time'].to_numpy() // ROLLUP_BAND_MS,
+                      distribution['count'].to_numpy())
+            summary['median'] = band_median(bands)
+        aggregates['summary'] = summary
+    else:
+        aggregates['summary'] = distribution_summary(distribution)
+    # Band midpoints sit in the same level as the band, so this is exact for rollups too
+    aggregates['levels'] = reaction_levels(distribution)
+
+    buckets = [p['round_buckets'] for p in partials if p['round_buckets'] is not None]
+    if buckets:
+        aggregates['round_buckets'] = pd.concat(buckets).groupby(level='round_number').sum().astype(np.int64)
+
+    accuracy = [p['session_accuracy'] for p in partials if p['session_accuracy'] is not None]
+    if accuracy:
+        aggregates['session_accuracy'] = pd.concat(accuracy).sort_values('session_id', ignore_index=True)
+
+    user_stats = [p['user_stats'] for p in partials if p['user_stats'] is not None]
+    if user_stats:
+        users = pd.concat(user_stats).groupby('user_id', as_index=False)[
+            ['play_count', 'total_rounds', 'reaction_sum']].sum()
+        users = users[(users['total_rounds'] > 0) & (users['play_count'] > 0)].reset_index(drop=True)
+        users['avg_reaction_time'] = users['reaction_sum'] / users['total_rounds']
+        aggregates['user_stats'] = users
+    return aggregates
@@ -0,0 +1,303 @@
+"""Incremental columnar snapshot cache for reaction_analysis_fixed.py
+
+Each joined frame (users, sessions, rounds) is kept as one raw binary file
+per column plus a meta.json. Rows are appended in id order, so a later run
+only queries rows with id > watermark and appends them; everything else is
+opened with np.memmap instead of being re-read through SQLite.
+
+Column encodings:
+    int       int64, NULL stored as INT64_MIN (loaded as float64/NaN like pandas)
+    float     float64, NULL as NaN
+    datetime  datetime64[ns] stored as int64, NULL as NaT
+    str       int32 dictionary codes, NULL as -1, vocabulary kept in meta.json
+
+Sessions are updated after they are inserted (end_time and counters), so
+cached sessions that were still open are re-read on every run and patched
+in place; rows that disappeared from the database are masked out. The same
+happens to cached rounds of sessions the app has since archived (their raw
+rows are deleted; the caller decodes game_session.rounds_archive instead).
+BLOB columns are not cached.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+INT_NULL = np.iinfo(np.int64).min
+LIVE_COLUMN = '__live__'
+
+KIND_DTYPES = {
+    'int': np.int64,
+    'float': np.float64,
+    'datetime': np.int64,
+    'str': np.int32,
+}
+
+
+def column_kind(declared_type):
+    """Map a SQLite declared column type to a cache encoding"""
+    declared = (declared_type or '').upper()
+    if 'INT' in declared or 'BOOL' in declared:
+        return 'int'
+    if 'CHAR' in declared or 'TEXT' in declared or 'CLOB' in declared:
+        return 'str'
+    if 'DATE' in declared or 'TIME' in declared:
+        return 'datetime'
+    return 'float'
+
+
+def table_kinds(conn, table):
+    return {row[1]: column_kind(row[2]) for row in conn.execute(f"PRAGMA table_info({table})")
+            if 'BLOB' not in (row[2] or '').upper()}
+
+
+class ColumnStore:
+    """One cached frame stored column by column under a directory"""
+
+    def __init__(self, directory, columns):
+        self.directory = directory
+        self.columns = columns
+        self.meta_path = os.path.join(directory, 'meta.json')
+        self.meta = self._read_meta()
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+
+        if (meta is None or meta.get('version') != FORMAT_VERSION
+                or meta.get('columns') != self.columns):
+            shutil.rmtree(self.directory, ignore_errors=True)
+            meta = self._new_meta()
+        return meta
+
+    def _new_meta(self):
+        return {
+            'version': FORMAT_VERSION,
+            'columns': self.columns,
+            'rows': 0,
+            'watermark': 0,
+            'vocab': {name: [] for name, kind in self.columns if kind == 'str'},
+        }
+
+    def _write_meta(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def _path(self, name):
+        return os.path.join(self.directory, f'{name}.bin')
+
+    @property
+    def watermark(self):
+        return self.meta['watermark']
+
+    @property
+    def rows(self):
+        return self.meta['rows']
+
+    def reset(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.meta = self._new_meta()
+
+    def _encode(self, name, kind, series):
+        if kind == 'int':
+            values = pd.to_numeric(series, errors='coerce')
+            return values.fillna(INT_NULL).to_numpy(np.int64)
+        if kind == 'float':
+            return pd.to_numeric(series, errors='coerce').to_numpy(np.float64)
+        if kind == 'datetime':
+            return pd.to_datetime(series, format='ISO8601').to_numpy('datetime64[ns]').view(np.int64)
+
+        vocab = self.meta['vocab'][name]
+        index = {value: code for code, value in enumerate(vocab)}
+        codes = np.empty(len(series), dtype=np.int32)
+        for i, value in enumerate(series.tolist()):
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                codes[i] = -1
+                continue
+            value = str(value)
+            code = index.get(value)
+            if code is None:
+                code = index[value] = len(vocab)
+                vocab.append(value)
+            codes[i] = code
+        return codes
+
+    def append(self, frame):
+        """Append rows (already ordered by id) and advance the watermark"""
+        if frame.empty:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for name, kind in self.columns:
+            encoded = self._encode(name, kind, frame[name])
+            with open(self._path(name), 'ab') as f:
+                f.write(np.ascontiguousarray(encoded, dtype=KIND_DTYPES[kind]).tobytes())
+        with open(self._path(LIVE_COLUMN), 'ab') as f:
+            f.write(np.ones(len(frame), dtype=np.uint8).tobytes())
+
+        self.meta['rows'] += len(frame)
+        self.meta['watermark'] = int(frame['id'].max())
+        self._write_meta()
+
+    def _memmap(self, name, dtype, mode='r'):
+        return np.memmap(self._path(name), dtype=dtype, mode=mode, shape=(self.rows,))
+
+    def ids(self):
+        if not self.rows:
+            return np.empty(0, dtype=np.int64)
+        return self._memmap('id', np.int64)
+
+    def patch(self, frame, expected_ids):
+        """Rewrite cached rows in place; ids in expected_ids missing from frame are masked out"""
+        if not self.rows or not len(expected_ids):
+            return
+        ids = self.ids()
+        found = frame['id'].to_numpy(np.int64) if not frame.empty else np.empty(0, np.int64)
+
+        if len(found):
+            positions = np.searchsorted(ids, found)
+            for name, kind in self.columns:
+                column = self._memmap(name, KIND_DTYPES[kind], mode='r+')
+                column[positions] = self._encode(name, kind, frame[name])
+                column.flush()
+
+        missing = np.setdiff1d(np.asarray(expected_ids, dtype=np.int64), found)
+        if len(missing):
+            live = self._memmap(LIVE_COLUMN, np.uint8, mode='r+')
+            live[np.searchsorted(ids, missing)] = 0
+            live.flush()
+        self._write_meta()
+
+    def load(self):
+        """Build a DataFrame backed by read-only memory maps where possible"""
+        if not self.rows:
+            return pd.DataFrame({name: pd.Series(dtype=self._empty_dtype(kind))
+                                 for name, kind in self.columns})
+
+        data = {}
+        for name, kind in self.columns:
+            raw = self._memmap(name, KIND_DTYPES[kind])
+            if kind == 'int':
+                nulls = raw == INT_NULL
+                if nulls.any():
+                    values = raw.astype(np.float64)
+                    values[nulls] = np.nan
+                    data[name] = values
+                else:
+                    data[name] = raw
+            elif kind == 'datetime':
+                data[name] = raw.view('datetime64[ns]')
+            elif kind == 'str':
+                vocab = np.array(self.meta['vocab'][name] + [None], dtype=object)
+                # code -1 indexes the trailing None
+                data[name] = vocab[raw]
+            else:
+                data[name] = raw
+
+        frame = pd.DataFrame(data, copy=False)
+        live = self._memmap(LIVE_COLUMN, np.uint8)
+        if not live.all():
+            frame = frame[live.astype(bool)].reset_index(drop=True)
+        return frame
+
+    @staticmethod
+    def _empty_dtype(kind):
+        return {'int': 'int64', 'float': 'float64', 'datetime': 'datetime64[ns]', 'str': 'object'}[kind]
+
+
+def default_cache_dir(db_path, base_dir='.analysis_cache'):
+    """One cache directory per database file"""
+    key = hashlib.sha1(os.path.abspath(db_path).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(base_dir, key)
+
+
+def load_cached_frames(conn, user_table, session_table, round_table, cache_dir):
+    """Return (users_df, sessions_df, rounds_df), reading only rows newer than the cache"""
+    user_kinds = table_kinds(conn, user_table)
+    session_kinds = table_kinds(conn, session_table)
+    round_kinds = table_kinds(conn, round_table)
+
+    specs = {
+        'users': (
+            [[name, kind] for name, kind in user_kinds.items()],
+            f"SELECT * FROM {user_table}",
+            'id',
+        ),
+        'sessions': (
+            [[name, kind] for name, kind in session_kinds.items()]
+            + [['username', user_kinds.get('username', 'str')], ['age', user_kinds.get('age', 'int')]],
+            f"""SELECT {', '.join(f'gs.{name}' for name in session_kinds)}, u.username, u.age
+                FROM {session_table} gs
+                LEFT JOIN {user_table} u ON gs.user_id = u.id""",
+            'gs.id',
+        ),
+        'rounds': (
+            [[name, kind] for name, kind in round_kinds.items()]
+            + [['user_id', session_kinds.get('user_id', 'int')], ['username', user_kinds.get('username', 'str')]],
+            f"""SELECT gr.*, gs.user_id, u.username
+                FROM {round_table} gr
+                LEFT JOIN {session_table} gs ON gr.session_id = gs.id
+                LEFT JOIN {user_table} u ON gs.user_id = u.id""",
+            'gr.id',
+        ),
+    }
+    max_ids = {
+        'users': conn.execute(f"SELECT MAX(id) FROM {user_table}").fetchone()[0] or 0,
+        'sessions': conn.execute(f"SELECT MAX(id) FROM {session_table}").fetchone()[0] or 0,
+        'rounds': conn.execute(f"SELECT MAX(id) FROM {round_table}").fetchone()[0] or 0,
+    }
+
+    archived_ids = None
+    if any(row[1] == 'rounds_archive' for row in conn.execute(f"PRAGMA table_info({session_table})")):
+        archived_ids = np.array([row[0] for row in conn.execute(
+            f"SELECT id FROM {session_table} WHERE rounds_archive IS NOT NULL")], dtype=np.int64)
+
+    frames = {}
+    for name, (columns, query, id_column) in specs.items():
+        store = ColumnStore(os.path.join(cache_dir, name), columns)
+
+        # A database that shrank below the watermark was replaced: start over
+        if store.watermark > max_ids[name]:
+            store.reset()
+
+        # Re-read sessions that were still open last time and patch them in place
+        if name == 'sessions' and store.rows:
+            cached = store.load()
+            open_ids = cached.loc[cached['end_time'].isna(), 'id'].to_numpy(np.int64)
+            for start in range(0, len(open_ids), 500):
+                chunk = open_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                updated = pd.read_sql_query(
+                    f"{query} WHERE {id_column} IN ({placeholders}) ORDER BY {id_column}",
+                    conn, params=[int(i) for i in chunk])
+                store.patch(updated, chunk)
+
+        # Re-read cached rounds of archived sessions; rows the archive job deleted are masked out
+        if name == 'rounds' and store.rows and archived_ids is not None:
+            cached = store.load()
+            stale_ids = cached.loc[cached['session_id'].isin(archived_ids), 'id'].to_numpy(np.int64)
+            for start in range(0, len(stale_ids), 500):
+                chunk = stale_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                remaining = pd.read_sql_query(
+                    f"{query} WHERE {id_column} IN ({placeholders}) ORDER BY {id_column}",
+                    conn, params=[int(i) for i in chunk])
+                store.patch(remaining, chunk)
+
+        new_rows = pd.read_sql_query(
+            f"{query} WHERE {id_column} > ? ORDER BY {id_column}",
+            conn, params=[store.watermark])
+        store.append(new_rows)
+        print(f"Cache {name}: {store.rows - len(new_rows)} cached + {len(new_rows)} new rows")
+        frames[name] = store.load()
+
+    return frames['users'], frames['sessions'], frames['rounds']
@@ -0,0 +1,378 @@
+"""Charts for the reaction time report
+
+Each chart draws onto a matplotlib Axes from the shared aggregates, so the same code fills the
+2x2 interactive figure and the per-chart files of the headless report. Headless rendering uses
+plain Figure objects (Agg canvas, no pyplot state), one per chart, in a process pool.
+"""
+import html
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from matplotlib.figure import Figure
+
+from analysis_aggregates import binned_kde, reaction_histogram
+from analysis_parallel import fork_context
+
+CHART_FIGSIZE = (10, 7.5)
+CHART_DPI = 100
+
+
+def apply_style():
+    # Use default English fonts
+    plt.rcParams['font.family'] = 'sans-serif'
+    plt.rcParams['font.sans-serif'] = ['Arial', 'Helvetica', 'DejaVu Sans']
+    plt.rcParams['font.size'] = 12
+    plt.rcParams['axes.unicode_minus'] = False
+    plt.rcParams['axes.titlesize'] = 16
+    plt.rcParams['axes.labelsize'] = 13
+    plt.rcParams['xtick.labelsize'] = 11
+    plt.rcParams['ytick.labelsize'] = 11
+    plt.rcParams['legend.fontsize'] = 11
+
+    # Set seaborn style
+    sns.set_style("whitegrid")
+    sns.set_palette("husl")
+
+
+def draw_distribution(ax, aggregates):
+    """Chart 1: Reaction Time Distribution"""
+    summary = aggregates['summary']
+    if aggregates['distribution'] is not None:
+        if summary['count']:
+            # Drawn from the per-value counts (at most one row per millisecond), so the
+            # cost does not grow with the number of reactions
+            distribution = aggregates['distribution']
+            sns.histplot(x=distribution['reaction_time'], weights=distribution['count'],
+                        bins=20, alpha=0.7, color='skyblue', stat='density', ax=ax)
+            kde = binned_kde(reaction_histogram(distribution), summary['count'], summary['std'])
+            if kde is not None:
+                ax.plot(*kde, color='skyblue')
+
+            mean_time = summary['mean']
+            median_time = summary['median']
+
+            ax.axvline(mean_time, color='red', linestyle='--', linewidth=2,
+                       label=f'Mean: {mean_time:.0f}ms')
+            ax.axvline(median_time, color='orange', linestyle='--', linewidth=2,
+                       label=f'Median: {median_time:.0f}ms')
+
+            ax.set_title('Reaction Time Distribution', fontsize=16, fontweight='bold', pad=15)
+            ax.set_xlabel('Reaction Time (ms)', fontsize=13)
+            ax.set_ylabel('Density', fontsize=13)
+            ax.legend(fontsize=11)
+            ax.grid(True, alpha=0.3)
+
+            # Statistics summary
+            stats_text = (f'Statistics Summary:\n'
+                         f'Sample Size: {summary["count"]}\n'
+                         f'Fastest: {summary["min"]:.0f}ms\n'
+                         f'Slowest: {summary["max"]:.0f}ms\n'
+                         f'Std Dev: {summary["std"]:.0f}ms')
+
+            ax.text(0.02, 0.98, stats_text, transform=ax.transAxes, fontsize=10,
+                    verticalalignment='top',
+                    bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.8))
+        else:
+            ax.text(0.5, 0.5, 'No successful reaction data', ha='center', va='center',
+                    transform=ax.transAxes, fontsize=14)
+            ax.set_title('Reaction Time Distribution', fontsize=16, fontweight='bold', pad=15)
+    else:
+        ax.text(0.5, 0.5, 'No data available', ha='center', va='center',
+                transform=ax.transAxes, fontsize=14)
+        ax.set_title('Reaction Time Distribution', fontsize=16, fontweight='bold', pad=15)
+
+
+def draw_accuracy(ax, aggregates):
+    """Chart 2: Accuracy Distribution"""
+    if aggregates['session_accuracy'] is not None:
+        session_accuracy = aggregates['session_accuracy']['accuracy']
+
+        if not session_accuracy.empty:
+            accuracy_bins = [0, 40, 60, 80, 90, 100]
+            accuracy_labels = ['0-40%', '41-60%', '61-80%', '81-90%', '91-100%']
+
+            accuracy_counts = pd.cut(session_accuracy, bins=accuracy_bins,
+                                   labels=accuracy_labels, include_lowest=True).value_counts()
+            accuracy_counts = accuracy_counts[accuracy_counts > 0]
+
+            if not accuracy_counts.empty:
+                colors = ['#ff6b6b', '#ffa726', '#ffeb3b', '#66bb6a', '#42a5f5'][:len(accuracy_counts)]
+                wedges, texts, autotexts = ax.pie(accuracy_counts.values,
+                                                  labels=accuracy_counts.index,
+                                                  autopct='%1.1f%%',
+                                                  startangle=90,
+                                                  colors=colors)
+
+                ax.set_title('Accuracy Distribution', fontsize=16, fontweight='bold', pad=15)
+
+                # Beautify text
+                for text in texts:
+                    text.set_fontsize(10)
+                for autotext in autotexts:
+                    autotext.set_color('black')
+                    autotext.set_fontweight('bold')
+                    autotext.set_fontsize(10)
+
+                # Statistics
+                mean_accuracy = session_accuracy.mean()
+                stats_text = (f'Accuracy Statistics:\n'
+                             f'Sessions: {len(session_accuracy)}\n'
+                             f'Mean Accuracy: {mean_accuracy:.1f}%\n'
+                             f'Max Accuracy: {session_accuracy.max():.1f}%\n'
+                             f'Min Accuracy: {session_accuracy.min():.1f}%')
+
+                ax.text(1.3, 0.5, stats_text, transform=ax.transAxes, fontsize=10,
+                        verticalalignment='center',
+                        bbox=dict(boxstyle='round', facecolor='lightblue', alpha=0.8))
+            else:
+                ax.text(0.5, 0.5, 'Insufficient accuracy data', ha='center', va='center',
+                        transform=ax.transAxes, fontsize=14)
+                ax.set_title('Accuracy Distribution', fontsize=16, fontweight='bold', pad=15)
+        else:
+            ax.text(0.5, 0.5, 'No accuracy data', ha='center', va='center',
+                    transform=ax.transAxes, fontsize=14)
+            ax.set_title('Accuracy Distribution', fontsize=16, fontweight='bold', pad=15)
+    else:
+        ax.text(0.5, 0.5, 'No data available', ha='center', va='center',
+                transform=ax.transAxes, fontsize=14)
+        ax.set_title('Accuracy Distribution', fontsize=16, fontweight='bold', pad=15)
+
+
+def draw_round_heatmap(ax, aggregates):
+    """Chart 3: Round vs Reaction Time Heatmap/Bar Chart"""
+    summary = aggregates['summary']
+    if aggregates['distribution'] is not None:
+        heatmap_data = aggregates['round_buckets']
+
+        if summary['count'] and heatmap_data is not None:
+            if not heatmap_data.empty and heatmap_data.shape[0] > 3 and heatmap_data.shape[1] > 2:
+                # Draw heatmap
+                sns.heatmap(heatmap_data.T, annot=True, fmt='d', cmap='YlOrRd',
+                           cbar_kws={'label': 'Reaction Count'}, ax=ax)
+
+                ax.set_title('Round vs Reaction Time Heatmap', fontsize=16, fontweight='bold', pad=15)
+                ax.set_xlabel('Round Number', fontsize=13)
+                ax.set_ylabel('Reaction Time Range', fontsize=13)
+                ax.tick_params(axis='x', rotation=45, labelsize=10)
+                ax.tick_params(axis='y', rotation=0, labelsize=10)
+            else:
+                # Use bar chart when insufficient data
+                reaction_counts = heatmap_data.sum(axis=0).sort_values(ascending=False, kind='stable')
+                if not reaction_counts.empty:
+                    bars = ax.bar(range(len(reaction_counts)), reaction_counts.values,
+                                  color='skyblue', alpha=0.7)
+                    ax.set_xticks(range(len(reaction_counts)))
+                    ax.set_xticklabels(reaction_counts.index, rotation=45)
+                    ax.set_title('Reaction Time Distribution', fontsize=16, fontweight='bold', pad=15)
+                    ax.set_xlabel('Reaction Time Range', fontsize=13)
+                    ax.set_ylabel('Count', fontsize=13)
+
+                    # Add values on bars
+                    for bar in bars:
+                        height = bar.get_height()
+                        ax.text(bar.get_x() + bar.get_width()/2., height,
+                                f'{int(height)}', ha='center', va='bottom', fontsize=10)
+                else:
+                    ax.text(0.5, 0.5, 'Insufficient data for chart', ha='center', va='center',
+                            transform=ax.transAxes, fontsize=14)
+                    ax.set_title('Reaction Time Analysis', fontsize=16, fontweight='bold', pad=15)
+        else:
+            ax.text(0.5, 0.5, 'No successful reaction data', ha='center', va='center',
+                    transform=ax.transAxes, fontsize=14)
+            ax.set_title('Round vs Reaction Time Heatmap', fontsize=16, fontweight='bold', pad=15)
+    else:
+        ax.text(0.5, 0.5, 'No data available', ha='center', va='center',
+                transform=ax.transAxes, fontsize=14)
+        ax.set_title('Round vs Reaction Time Heatmap', fontsize=16, fontweight='bold', pad=15)
+
+
+def draw_play_count(ax, aggregates):
+    """Chart 4: Play Count vs Reaction Time Relationship (without user IDs)"""
+    if aggregates['user_stats'] is not None:
+        stats_df = aggregates['user_stats']
+
+        if not stats_df.empty:
+            # Draw scatter plot without user ID labels
+            scatter = ax.scatter(stats_df['play_count'], stats_df['avg_reaction_time'],
+                                s=stats_df['total_rounds']*8, alpha=0.7,
+                                c=range(len(stats_df)), cmap='viridis',
+                                edgecolors='black', linewidth=1)
+
+            # Trend line
+            if len(stats_df) > 1:
+                z = np.polyfit(stats_df['play_count'], stats_df['avg_reaction_time'], 1)
+                p = np.poly1d(z)
+                ax.plot(stats_df['play_count'], p(stats_df['play_count']),
+                        "r--", alpha=0.8, linewidth=2,
+                        label=f'Trend Line (slope: {z[0]:.1f})')
+
+            ax.set_title('Play Count vs Average Reaction Time', fontsize=16, fontweight='bold', pad=15)
+            ax.set_xlabel('Number of Plays', fontsize=13)
+            ax.set_ylabel('Average Reaction Time (ms)', fontsize=13)
+            ax.grid(True, alpha=0.3)
+
+            if len(stats_df) > 1:
+                ax.legend(fontsize=10)
+
+            # Info text without specific user count
+            info_text = f'Info:\nBubble size = Total rounds\nData points: {len(stats_df)}'
+            ax.text(0.02, 0.98, info_text, transform=ax.transAxes, fontsize=10,
+                    verticalalignment='top',
+                    bbox=dict(boxstyle='round', facecolor='lightgreen', alpha=0.8))
+        else:
+            ax.text(0.5, 0.5, 'No user statistics data', ha='center', va='center',
+                    transform=ax.transAxes, fontsize=14)
+            ax.set_title('Play Count vs Average Reaction Time', fontsize=16, fontweight='bold', pad=15)
+    else:
+        ax.text(0.5, 0.5, 'No data available', ha='center', va='center',
+                transform=ax.transAxes, fontsize=14)
+        ax.set_title('Play Count vs Average Reaction Time', fontsize=16, fontweight='bold', pad=15)
+
+
+# (file name, title, draw function, aggregates it reads) in report order
+CHARTS = [
+    ('distribution', 'Reaction Time Distribution', draw_distribution, ('distribution', 'summary')),
+    ('accuracy', 'Accuracy Distribution', draw_accuracy, ('session_accuracy',)),
+    ('round_heatmap', 'Round vs Reaction Time', draw_round_heatmap,
+     ('distribution', 'round_buckets', 'summary')),
+    ('play_count', 'Play Count vs Average Reaction Time', draw_play_count, ('user_stats',)),
+]
+_DRAW = {name: draw for name, _, draw, _ in CHARTS}
+
+
+def draw_report(fig, aggregates, timings=None):
+    """Draw the four charts into a 2x2 grid on fig; appends (chart, seconds) to timings"""
+    gs = fig.add_gridspec(2, 2, hspace=0.4, wspace=0.3)
+    for position, (name, _, draw, _) in zip([(0, 0), (0, 1), (1, 0), (1, 1)], CHARTS):
+        started = time.perf_counter()
+        draw(fig.add_subplot(gs[position]), aggregates)
+        if timings is not None:
+            timings.append((f'chart {name}', time.perf_counter() - started))
+
+
+def draw_sample_report(fig):
+    """Draw the 2x2 sample charts shown when the database has no rounds yet"""
+    np.random.seed(42)
+    sample_reactions = np.random.normal(350, 80, 100)
+    sample_reactions = sample_reactions[sample_reactions > 150]
+    sample_reactions = sample_reactions[sample_reactions < 800]
+
+    fig.suptitle('Reaction Time Test Data Analysis Report (Sample Data)', fontsize=20, fontweight='bold')
+    gs = fig.add_gridspec(2, 2, hspace=0.35, wspace=0.3)
+
+    # Sample chart 1
+    ax1 = fig.add_subplot(gs[0, 0])
+    sns.histplot(sample_reactions, bins=20, kde=True, alpha=0.7, color='skyblue', ax=ax1)
+    ax1.axvline(np.mean(sample_reactions), color='red', linestyle='--', linewidth=2,
+                label=f'Mean: {np.mean(sample_reactions):.0f}ms')
+    ax1.set_title('Reaction Time Distribution (Sample)', fontsize=14, fontweight='bold')
+    ax1.set_xlabel('Reaction Time (ms)', fontsize=12)
+    ax1.set_ylabel('Density', fontsize=12)
+    ax1.legend()
+
+    # Sample chart 2
+    ax2 = fig.add_subplot(gs[0, 1])
+    sample_accuracy = [85, 92, 78, 95, 88]
+    accuracy_labels = ['User1', 'User2', 'User3', 'User4', 'User5']
+    ax2.pie(sample_accuracy, labels=accuracy_labels, autopct='%1.1f%%', startangle=90)
+    ax2.set_title('Accuracy Distribution (Sample)', fontsize=14, fontweight='bold')
+
+    # Sample chart 3
+    ax3 = fig.add_subplot(gs[1, 0])
+    sample_heatmap = np.random.randint(0, 10, (6, 15))
+    sns.heatmap(sample_heatmap, annot=True, fmt='d', cmap='YlOrRd', ax=ax3)
+    ax3.set_title('Round vs Reaction Time Heatmap (Sample)', fontsize=14, fontweight='bold')
+    ax3.set_xlabel('Round Number', fontsize=12)
+    ax3.set_ylabel('Reaction Time Range', fontsize=12)
+
+    # Sample chart 4
+    ax4 = fig.add_subplot(gs[1, 1])
+    sample_plays = [1, 2, 3, 4, 5]
+    sample_avg_time = [380, 350, 330, 320, 310]
+    ax4.scatter(sample_plays, sample_avg_time, s=120, alpha=0.7)
+    ax4.plot(sample_plays, sample_avg_time, 'r--', alpha=0.8)
+    ax4.set_title('Play Count vs Avg Reaction Time (Sample)', fontsize=14, fontweight='bold')
+    ax4.set_xlabel('Number of Plays', fontsize=12)
+    ax4.set_ylabel('Average Reaction Time (ms)', fontsize=12)
+
+
+def render_chart(name, aggregates, output_dir, formats):
+    """Draw one chart into its own figure and save it once per image format
+
+    Runs in a worker process; returns (name, [paths], draw seconds, save seconds).
+    """
+    apply_style()
+    started = time.perf_counter()
+    fig = Figure(figsize=CHART_FIGSIZE)
+    _DRAW[name](fig.add_subplot(), aggregates)
+    fig.tight_layout()
+    drawn = time.perf_counter()
+
+    paths = []
+    for fmt in formats:
+        path = os.path.join(output_dir, f'{name}.{fmt}')
+        fig.savefig(path, format=fmt, dpi=CHART_DPI)
+        paths.append(path)
+    return name, paths, drawn - started, time.perf_counter() - drawn
+
+
+def render_charts(aggregates, output_dir, formats, processes=None):
+    """Render every chart to its own file(s), in parallel when more than one CPU is available
+
+    Each worker only receives the aggregates its chart reads. Returns the render_chart
+    results in report order.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [(name, {key: aggregates[key] for key in inputs}, output_dir, formats)
+            for name, _, _, inputs in CHARTS]
+
+    if processes is None:
+        processes = min(len(jobs), os.cpu_count() or 1)
+    context = fork_context()
+    if processes <= 1 or context is None:
+        return [render_chart(*job) for job in jobs]
+
+    with ProcessPoolExecutor(processes, mp_context=context) as pool:
+        return list(pool.map(render_chart, *zip(*jobs)))
+
+
+def write_html_report(path, title, report_text, images):
+    """Write a standalone HTML page with the text report and the chart images
+
+    images is a list of (chart title, image file name relative to the page).
+    """
+    figures = '\n'.join(
+        f'<figure><img src="{html.escape(src)}" alt="{html.escape(caption)}">'
+        f'<figcaption>{html.escape(caption)}</figcaption></figure>'
+        for caption, src in images)
+    page = f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{html.escape(title)}</title>
+<style>
+body {{ font-family: Arial, Helvetica, sans-serif; margin: 2em; color: #222; }}
+.charts {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(480px, 1fr)); gap: 1.5em; }}
+figure {{ margin: 0; }}
+img {{ width: 100%; height: auto; border: 1px solid #ddd; }}
+figcaption {{ text-align: center; font-weight: bold; margin-top: .4em; }}
+pre {{ background: #f6f6f6; padding: 1em; border-radius: 4px; }}
+</style>
+</head>
+<body>
+<h1>{html.escape(title)}</h1>
+<p>Generated {html.escape(time.strftime('%Y-%m-%d %H:%M:%S'))}</p>
+<div class="charts">
+{figures}
+</div>
+<pre>{html.escape(report_text)}</pre>
+</body>
+</html>
+"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(page)
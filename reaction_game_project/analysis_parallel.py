@@ -0,0 +1,148 @@
+"""Map-reduce analysis over several game databases (for example one per kiosk)
+
+Each database file is aggregated on its own in a worker process with the sql,
+stream or rollup aggregations, keeping every user (active_users_only=False).
+The parent then renumbers users by username and sessions by file order and
+merges the partials with merge_aggregates(). The result equals a single pass
+over one database holding every file's rows, with the files appended in
+argument order.
+"""
+import glob
+import multiprocessing
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+MODES = ('sql', 'stream', 'rollup')
+
+# Tables maintained by the app's end_session rollup (see rollups.py)
+ROLLUP_TABLES = {'user_stats', 'daily_stats'}
+
+
+def fork_context():
+    # Forked workers inherit the already imported NumPy/pandas/matplotlib instead of importing
+    # them again; elsewhere the pool is skipped and the work runs in-process
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return None
+
+
+def natural_key(path):
+    """Sort key that orders shard2 before shard10"""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', path)]
+
+
+def expand_databases(patterns):
+    """Database paths from file names and glob patterns, in argument order without duplicates
+
+    Raises FileNotFoundError for a name or pattern that matches nothing.
+    """
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern), key=natural_key)
+        else:
+            matches = [pattern] if os.path.isfile(pattern) else []
+        if not matches:
+            raise FileNotFoundError(f'No database matches {pattern}')
+        for path in matches:
+            if os.path.realpath(path) not in seen:
+                seen.add(os.path.realpath(path))
+                paths.append(path)
+    return paths
+
+
+def find_tables(conn):
+    """(user, session, round) table names, any of them None when missing; None for an empty database"""
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+    if not tables:
+        return None
+
+    # The rollup tables also contain "user" but hold no raw data
+    candidates = [t for t in tables if t not in ROLLUP_TABLES]
+    return (next((t for t in candidates if 'user' in t.lower()), None),
+            next((t for t in candidates if 'session' in t.lower()), None),
+            next((t for t in candidates if 'round' in t.lower()), None))
+
+
+def database_partial(path, mode='sql', chunk_size=50000):
+    """Aggregate one database file for merging
+
+    Returns (partial aggregates, [(user_id, username)], largest session id).
+    Raises ValueError when the file lacks the tables the mode needs.
+    """
+    from analysis_aggregates import rollup_aggregates, sql_aggregates, stream_aggregates, with_archived_rounds
+
+    conn = sqlite3.connect(path)
+    try:
+        tables = find_tables(conn)
+        if tables is None or not all(tables):
+            raise ValueError(f'{path}: needs the user, session and round tables')
+        user_table, session_table, round_table = tables
+
+        if mode == 'rollup':
+            names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+            if not ROLLUP_TABLES <= names:
+                raise ValueError(f'{path}: needs the user_stats and daily_stats tables '
+                                 '(run: flask rebuild-rollups)')
+            partial = rollup_aggregates(conn, user_table, False)
+        elif mode == 'stream':
+            partial = stream_aggregates(conn, user_table, session_table, round_table, chunk_size, False)
+        else:
+            partial = sql_aggregates(conn, user_table, session_table,
+                                     with_archived_rounds(conn, session_table, round_table), False)
+
+        users = conn.execute(f"SELECT id, username FROM {user_table} ORDER BY id").fetchall()
+        last_session = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {session_table}").fetchone()[0]
+    finally:
+        conn.close()
+    return partial, users, last_session
+
+
+def _renumber(partial, user_ids, session_offset):
+    """Move a partial onto the merged id space: global user ids and offset session ids"""
+    if partial['user_stats'] is not None:
+        users = partial['user_stats'].copy()
+        users['user_id'] = users['user_id'].map(user_ids)
+        partial['user_stats'] = users.dropna(subset=['user_id']).astype({'user_id': 'int64'})
+    if partial['session_accuracy'] is not None and session_offset:
+        accuracy = partial['session_accuracy'].copy()
+        accuracy['session_id'] += session_offset
+        partial['session_accuracy'] = accuracy
+    return partial
+
+
+def map_reduce(paths, mode='sql', chunk_size=50000, processes=None):
+    """Aggregate every database in a process pool and merge the partials into one result
+
+    Users with the same username in several files are one user, numbered in
+    order of first appearance (file order, then id). Session ids of each file
+    are shifted past the largest id of the files before it.
+    """
+    from analysis_aggregates import merge_aggregates
+
+    if mode not in MODES:
+        raise ValueError(f'Unknown mode: {mode}')
+
+    if processes is None:
+        processes = min(len(paths), os.cpu_count() or 1)
+    jobs = [(path, mode, chunk_size) for path in paths]
+    context = fork_context()
+    if processes <= 1 or len(jobs) <= 1 or context is None:
+        results = [database_partial(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(processes, mp_context=context) as pool:
+            results = list(pool.map(database_partial, *zip(*jobs)))
+
+    usernames = {}
+    partials = []
+    session_offset = 0
+    for partial, users, last_session in results:
+        user_ids = {user_id: usernames.setdefault(username, len(usernames) + 1)
+                    for user_id, username in users}
+        partials.append(_renumber(partial, user_ids, session_offset))
+        session_offset += last_session
+
+    return merge_aggregates(partials, n_users=len(usernames), binned=mode == 'rollup')
@@ -0,0 +1,250 @@
+"""Printed statistics report, and a standard-library-only way to compute it
+
+report_lines() formats the "Detailed Data Analysis Report" from an aggregates
+dict; the full script feeds it the pandas aggregates. text_aggregates()
+computes the same summary, levels and totals with sqlite3 alone (per-value
+counts grouped inside SQLite, or the rollup tables), so --text never imports
+NumPy, pandas or matplotlib.
+"""
+import math
+import sqlite3
+from collections import Counter, namedtuple
+
+from analysis_parallel import find_tables
+from archive_format import INT16_NULL, reactions
+
+# Successful reactions: correct response and faster than the 800 ms timeout
+MAX_REACTION_MS = 800
+
+# Report levels (left-closed)
+LEVELS = [
+    ('Lightning', '<200ms', None, 200),
+    ('Excellent', '200-300ms', 200, 300),
+    ('Good', '300-400ms', 300, 400),
+    ('Average', '400-500ms', 400, 500),
+    ('Slow', '>500ms', 500, None),
+]
+
+# daily_stats histogram: band_i counts successful reactions in [i * 100, (i + 1) * 100) ms
+ROLLUP_BAND_MS = 100
+ROLLUP_BANDS = [f'band_{i}' for i in range(MAX_REACTION_MS // ROLLUP_BAND_MS)]
+
+Level = namedtuple('Level', 'level range count percent')
+
+
+def report_lines(aggregates):
+    """Lines of the printed report for an aggregates dict (pandas or text_aggregates())"""
+    summary = aggregates['summary']
+    totals = aggregates['totals']
+    report = ["\nDetailed Data Analysis Report:", "="*60]
+
+    if summary['count']:
+        report.append(f"Reaction Time Statistics:")
+        report.append(f"   • Total successful reactions: {summary['count']}")
+        report.append(f"   • Average reaction time: {summary['mean']:.2f} ms")
+        report.append(f"   • Median reaction time: {summary['median']:.2f} ms")
+        report.append(f"   • Fastest reaction time: {summary['min']} ms")
+        report.append(f"   • Slowest reaction time: {summary['max']} ms")
+        report.append(f"   • Standard deviation: {summary['std']:.2f} ms")
+
+        # Level analysis
+        levels = aggregates['levels']
+        report.append(f"\nReaction Level Distribution:")
+        for level in (levels.itertuples() if hasattr(levels, 'itertuples') else levels):
+            report.append(f"   • {level.level} ({level.range}): {level.count} times ({level.percent:.1f}%)")
+
+    if totals['sessions'] and totals['rounds'] and aggregates['distribution'] is not None:
+        total_accuracy = (totals['correct'] / totals['rounds']) * 100
+        report.append(f"\nOverall Accuracy: {total_accuracy:.2f}%")
+        report.append(f"Total Game Sessions: {totals['sessions']}")
+        report.append(f"Total Users: {totals['users']}")
+    return report
+
+
+def counts_summary(counts):
+    """Count, mean, median, min, max and sample std from {reaction_time: count}
+
+    Same definitions as analysis_aggregates.distribution_summary().
+    """
+    n = sum(counts.values())
+    if not n:
+        return {'count': 0}
+    values = sorted(counts)
+    mean = math.fsum(value * counts[value] for value in values) / n
+    squares = math.fsum(counts[value] * (value - mean) ** 2 for value in values)
+
+    # Median as pandas does: middle value, or the mean of the two middle values
+    def nth(k):
+        seen = 0
+        for value in values:
+            seen += counts[value]
+            if seen > k:
+                return value
+
+    return {
+        'count': n,
+        'mean': mean,
+        'median': (nth((n - 1) // 2) + nth(n // 2)) / 2,
+        'min': values[0],
+        'max': values[-1],
+        'std': math.sqrt(squares / (n - 1)) if n > 1 else float('nan'),
+    }
+
+
+def band_median(bands):
+    """Median interpolated linearly inside the 100 ms band that holds it"""
+    n = sum(bands)
+    if not n:
+        return float('nan')
+    before = 0
+    for band, count in enumerate(bands):
+        if before + count >= n / 2:
+            return band * ROLLUP_BAND_MS + (n / 2 - before) / count * ROLLUP_BAND_MS
+        before += count
+
+
+def counts_levels(counts):
+    """Report levels from {reaction_time: count}"""
+    total = sum(counts.values())
+    levels = []
+    for level, label, low, high in LEVELS:
+        count = sum(c for value, c in counts.items()
+                    if (low is None or value >= low) and (high is None or value < high))
+        levels.append(Level(level, label, count, count / total * 100 if total else 0.0))
+    return levels
+
+
+def _archived_rounds(conn, session_table):
+    """(rounds, correct, {reaction_time: successful count}) decoded from rounds_archive"""
+    rounds = correct = 0
+    successful = Counter()
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({session_table})")}
+    if 'rounds_archive' not in columns:
+        return rounds, correct, successful
+
+    for (blob,) in conn.execute(f"SELECT rounds_archive FROM {session_table} WHERE rounds_archive IS NOT NULL"):
+        # Raises ValueError on an archive format this script does not know
+        times, accuracies = reactions(blob)
+        rounds += len(times)
+        for ms, accurate in zip(times, accuracies):
+            if accurate:
+                correct += 1
+                if ms != INT16_NULL and ms < MAX_REACTION_MS:
+                    successful[ms] += 1
+    return rounds, correct, successful
+
+
+def _file_counts(conn, session_table, round_table):
+    """Sessions, rounds, correct and successful per-value counts of one database file"""
+    sessions = conn.execute(f"SELECT COUNT(*) FROM {session_table}").fetchone()[0]
+    rounds, correct = conn.execute(
+        f"SELECT COUNT(*), COALESCE(SUM(response_accuracy), 0) FROM {round_table}").fetchone()
+    counts = Counter(dict(conn.execute(f"""
+        SELECT reaction_time, COUNT(*) FROM {round_table}
+        WHERE response_accuracy = 1 AND reaction_time < {MAX_REACTION_MS}
+        GROUP BY reaction_time
+    """).fetchall()))
+    archived_rounds, archived_correct, archived = _archived_rounds(conn, session_table)
+    counts.update(archived)
+    return sessions, rounds + archived_rounds, correct + archived_correct, counts
+
+
+def _file_rollups(conn):
+    """Sessions, rounds, correct, successful, sums, best/worst and bands from daily_stats"""
+    row = conn.execute(f"""
+        SELECT COALESCE(SUM(sessions), 0), COALESCE(SUM(total_rounds), 0),
+               COALESCE(SUM(correct_count), 0), COALESCE(SUM(successful_rounds), 0),
+               COALESCE(SUM(reaction_time_sum), 0), COALESCE(SUM(reaction_time_sq_sum), 0),
+               MIN(best_time), MAX(worst_time),
+               {', '.join(f'COALESCE(SUM({band}), 0)' for band in ROLLUP_BANDS)}
+        FROM daily_stats
+    """).fetchone()
+    return row[:8], list(row[8:])
+
+
+def text_aggregates(paths, users_path=None, rollup=False):
+    """Totals, summary and levels over one or more database files, with sqlite3 only
+
+    paths hold game_session/game_round (a main database and its shards, or
+    several kiosk databases). Users are counted in users_path when given
+    (the main database of a sharded setup), otherwise as distinct usernames
+    across paths. With rollup=True only the daily_stats rollups are read:
+    the median is interpolated within its 100 ms band, as in rollup mode.
+    Raises ValueError when a file lacks the needed tables or holds a
+    rounds_archive in a format archive_format.py does not know.
+    """
+    if users_path is None and len(paths) == 1:
+        # A single file: its user table already holds one row per username
+        users_path = paths[0]
+
+    totals = {'users': 0, 'sessions': 0, 'rounds': 0, 'correct': 0}
+    counts = Counter()
+    sums = [0, 0, 0, 0, 0, 0, None, None]
+    bands = [0] * len(ROLLUP_BANDS)
+    usernames = set()
+
+    for path in paths:
+        conn = sqlite3.connect(path)
+        try:
+            user_table, session_table, round_table = find_tables(conn) or (None, None, None)
+            if not (session_table and round_table):
+                raise ValueError(f'{path}: needs the session and round tables')
+            if rollup and not conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type='table' AND name='daily_stats'").fetchone():
+                raise ValueError(f'{path}: needs the daily_stats table (run: flask rebuild-rollups)')
+            if users_path is None and user_table:
+                usernames.update(row[0] for row in conn.execute(f"SELECT username FROM {user_table}"))
+
+            if rollup:
+                file_sums, file_bands = _file_rollups(conn)
+                for i in range(6):
+                    sums[i] += file_sums[i]
+                for i, pick in ((6, min), (7, max)):
+                    present = [v for v in (sums[i], file_sums[i]) if v is not None]
+                    sums[i] = pick(present) if present else None
+                bands = [a + b for a, b in zip(bands, file_bands)]
+                sessions, rounds, correct = file_sums[:3]
+            else:
+                sessions, rounds, correct, file_counts = _file_counts(conn, session_table, round_table)
+                counts.update(file_counts)
+        finally:
+            conn.close()
+        totals['sessions'] += sessions
+        totals['rounds'] += rounds
+        totals['correct'] += correct
+
+    if users_path is not None:
+        conn = sqlite3.connect(users_path)
+        try:
+            user_table = (find_tables(conn) or (None,))[0]
+            totals['users'] = conn.execute(f"SELECT COUNT(*) FROM {user_table}").fetchone()[0] if user_table else 0
+        finally:
+            conn.close()
+    else:
+        totals['users'] = len(usernames)
+
+    aggregates = {'totals': totals, 'distribution': None, 'summary': {'count': 0}, 'levels': None}
+    if not totals['rounds']:
+        return aggregates
+
+    if rollup:
+        aggregates['distribution'] = {band * ROLLUP_BAND_MS + ROLLUP_BAND_MS // 2: count
+                                      for band, count in enumerate(bands) if count}
+        n, total, squares = sums[3], sums[4], sums[5]
+        if n:
+            mean = total / n
+            aggregates['summary'] = {
+                'count': n,
+                'mean': mean,
+                'median': band_median(bands),
+                'min': sums[6],
+                'max': sums[7],
+                'std': math.sqrt(max(squares - n * mean * mean, 0) / (n - 1)) if n > 1 else float('nan'),
+            }
+        # Level boundaries fall on band edges, so the level counts are exact
+        aggregates['levels'] = counts_levels({band * ROLLUP_BAND_MS: count for band, count in enumerate(bands)})
+    else:
+        aggregates['distribution'] = dict(counts)
+        aggregates['summary'] = counts_summary(counts)
+        aggregates['levels'] = counts_levels(counts)
+    return aggregates
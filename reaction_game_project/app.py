@@ -1,20 +1,46 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, Blueprint, current_app, render_template, request, redirect, url_for, flash, session, jsonify, make_response
+from flask.cli import with_appcontext
 from flask_sqlalchemy import SQLAlchemy
+from werkzeug.local import LocalProxy
 from datetime import datetime, timedelta
+from collections import defaultdict
+import atexit
+import hmac
+import os
+import threading
 
-# 創建 Flask 應用
-app = Flask(__name__)
+import click
 
-# 配置
-app.config['SECRET_KEY'] = 'reaction-game-secret-key-2025-very-secure'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///reaction_game.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SESSION_COOKIE_SECURE'] = False
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=2)
+from archive import ALL_ROUNDS, PackedRounds, archive_sessions, load_archived_rounds
+from config import config
+from export import COLUMNS as EXPORT_COLUMNS, FORMATS as EXPORT_FORMATS, export_chunks, parse_day
 
-db = SQLAlchemy(app)
+from ingest import RoundWriter
+from metrics import RequestMetrics
+from percentiles import PercentileService
+from reaper import SessionReaper
+from result_cache import ResultCache
+from result_feed import ResultFeed
+from rollups import BAND_COLUMNS, apply_session_rollup, rebuild_rollups
+from sharding import ShardRouter, init_shard, shard_binds, shard_metadata
+from storage import configure_sqlite_engine, ensure_indexes
+
+db = SQLAlchemy()
+
+def _extension(name):
+    return LocalProxy(lambda: current_app.extensions[name])
+
+# 服務是每個應用各自一份，由 create_app 建立並放在 app.extensions；
+# 這些名稱指向目前 app context 所屬應用的那一份，同一個行程建立多個應用也不會互相影響
+round_writer = _extension('round_writer')
+result_cache = _extension('result_cache')
+result_feed = _extension('result_feed')
+percentile_service = _extension('percentile_service')
+request_metrics = _extension('request_metrics')
+shard_router = _extension('shard_router')
+session_reaper = _extension('session_reaper')
+
+bp = Blueprint('main', __name__)
 
 # 模型定義
 class User(db.Model):
@@ -34,9 +60,21 @@ class GameSession(db.Model):
     total_rounds = db.Column(db.Integer, default=0)
     correct_responses = db.Column(db.Integer, default=0)
     average_reaction_time = db.Column(db.Float)
+    # 成功回合反應時間總和，與 total_rounds / correct_responses 一起在寫入回合時累加
+    reaction_time_sum = db.Column(db.Integer, default=0)
+    # 封存後的回合 (archive.py 的格式)；封存的會話在 game_round 已沒有對應的列
+    rounds_archive = db.Column(db.LargeBinary)
+    # 封存前最大的 game_round.id，名次服務只需要解開比快照水位線新的封存
+    rounds_archive_max_id = db.Column(db.Integer)
     
     user = db.relationship('User', backref=db.backref('sessions', lazy=True))
     
+    __table_args__ = (
+        db.Index('ix_game_session_user_start', 'user_id', 'start_time'),
+        # 清理程式找被放棄的會話 (reap_sessions)；只收未結束的列
+        db.Index('ix_game_session_open', 'start_time', sqlite_where=db.text('end_time IS NULL')),
+    )
+    
     def __repr__(self):
         return f'<GameSession {self.id}>'
 
@@ -50,15 +88,326 @@ class GameRound(db.Model):
     
     session = db.relationship('GameSession', backref=db.backref('rounds', lazy=True))
     
+    __table_args__ = (
+        db.Index('ix_game_round_session_round', 'session_id', 'round_number'),
+    )
+    
     def __repr__(self):
         return f'<GameRound {self.round_number}>'
 
+class UserStats(db.Model):
+    """每位玩家已結束會話的彙總，在 end_session 的交易內累加"""
+    __tablename__ = 'user_stats'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    play_count = db.Column(db.Integer, nullable=False, default=0)
+    total_rounds = db.Column(db.Integer, nullable=False, default=0)
+    correct_count = db.Column(db.Integer, nullable=False, default=0)
+    # 以下只計成功回合 (答對且 < 800 ms)
+    successful_rounds = db.Column(db.Integer, nullable=False, default=0)
+    reaction_time_sum = db.Column(db.Integer, nullable=False, default=0)
+    reaction_time_sq_sum = db.Column(db.Integer, nullable=False, default=0)
+    best_time = db.Column(db.Integer)
+    worst_time = db.Column(db.Integer)
+    updated_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<UserStats {self.user_id}>'
+
+class DailyStats(db.Model):
+    """每天 (依會話結束日期) 的彙總與 100 ms 一段的反應時間直方圖"""
+    __tablename__ = 'daily_stats'
+    
+    day = db.Column(db.Date, primary_key=True)
+    sessions = db.Column(db.Integer, nullable=False, default=0)
+    total_rounds = db.Column(db.Integer, nullable=False, default=0)
+    correct_count = db.Column(db.Integer, nullable=False, default=0)
+    successful_rounds = db.Column(db.Integer, nullable=False, default=0)
+    reaction_time_sum = db.Column(db.Integer, nullable=False, default=0)
+    reaction_time_sq_sum = db.Column(db.Integer, nullable=False, default=0)
+    best_time = db.Column(db.Integer)
+    worst_time = db.Column(db.Integer)
+    # 成功回合的反應時間直方圖：band_0 = [0, 100) ms ... band_7 = [700, 800) ms
+    band_0 = db.Column(db.Integer, nullable=False, default=0)
+    band_1 = db.Column(db.Integer, nullable=False, default=0)
+    band_2 = db.Column(db.Integer, nullable=False, default=0)
+    band_3 = db.Column(db.Integer, nullable=False, default=0)
+    band_4 = db.Column(db.Integer, nullable=False, default=0)
+    band_5 = db.Column(db.Integer, nullable=False, default=0)
+    band_6 = db.Column(db.Integer, nullable=False, default=0)
+    band_7 = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<DailyStats {self.day}>'
+
+# 資料庫初始化
+def init_db():
+    """建立表格，並替舊的資料庫檔補上新增的欄位"""
+    # 只建主資料庫：db.metadatas 會留著同一個行程裡其他應用登記過的分片 bind，分片由 init_shard 建立
+    db.create_all(bind_key=None)
+    
+    if shard_router.enabled:
+        metadata = shard_metadata(db.metadata)
+        for shard in range(shard_router.count):
+            init_shard(shard_router.engine_for_shard(shard), shard, metadata)
+    
+    for shard in shard_router.shards():
+        shard_session = shard_router.session_for_shard(shard)
+        columns = {row[1] for row in shard_session.execute(db.text('PRAGMA table_info(game_session)'))}
+        for name, definition in (('reaction_time_sum', 'INTEGER DEFAULT 0'), ('rounds_archive', 'BLOB'),
+                                 ('rounds_archive_max_id', 'INTEGER')):
+            if name not in columns:
+                shard_session.execute(db.text(f'ALTER TABLE game_session ADD COLUMN {name} {definition}'))
+        shard_session.commit()
+        
+        engine = shard_router.engine_for_shard(shard)
+        if engine.dialect.name == 'sqlite':
+            dbapi_connection = engine.raw_connection()
+            try:
+                ensure_indexes(dbapi_connection)
+            finally:
+                dbapi_connection.close()
+    
+    # 剛加上彙總表的舊資料庫：從既有的會話回填一次
+    for shard in shard_router.shards():
+        shard_session = shard_router.session_for_shard(shard)
+        if shard_session.query(UserStats).first() is None and \
+                shard_session.query(GameSession).filter(GameSession.end_time.isnot(None)).first() is not None:
+            rebuild_rollups(shard_session, datetime.utcnow())
+            shard_session.commit()
+
+def rebuild_session_counters(db_session):
+    """依 game_round (含封存的回合) 重新計算每個會話的累計欄位，回傳更新的會話數"""
+    load_archived_rounds(db_session)
+    result = db_session.execute(db.text(f"""
+        UPDATE game_session SET
+            total_rounds = (SELECT COUNT(*) FROM {ALL_ROUNDS} gr
+                            WHERE gr.session_id = game_session.id),
+            correct_responses = (SELECT COUNT(*) FROM {ALL_ROUNDS} gr
+                                 WHERE gr.session_id = game_session.id AND gr.response_accuracy),
+            reaction_time_sum = (SELECT COALESCE(SUM(gr.reaction_time), 0) FROM {ALL_ROUNDS} gr
+                                 WHERE gr.session_id = game_session.id AND gr.response_accuracy)
+    """))
+    db_session.execute(db.text("""
+        UPDATE game_session SET
+            average_reaction_time = CASE WHEN correct_responses > 0
+                THEN CAST(reaction_time_sum AS FLOAT) / correct_responses ELSE 0 END
+        WHERE end_time IS NOT NULL
+    """))
+    db_session.commit()
+    return result.rowcount
+
+@click.command('rebuild-counters')
+@with_appcontext
+def rebuild_counters_command():
+    """從 game_round 回填 game_session 的累計欄位"""
+    init_db()
+    updated = sum(rebuild_session_counters(shard_router.session_for_shard(shard))
+                  for shard in shard_router.shards())
+    print(f'已重建 {updated} 個遊戲會話的累計欄位')
+
+@click.command('rebuild-rollups')
+@with_appcontext
+def rebuild_rollups_command():
+    """從 game_session / game_round 重建 user_stats 與 daily_stats"""
+    init_db()
+    users = days = 0
+    for shard in shard_router.shards():
+        shard_session = shard_router.session_for_shard(shard)
+        rebuild_rollups(shard_session, datetime.utcnow())
+        shard_session.commit()
+        users += shard_session.query(UserStats).count()
+        days += shard_session.query(DailyStats).count()
+    print(f'已重建 {users} 位玩家、{days} 天的彙總 ({len(shard_router.shards())} 個資料庫)')
+
+@click.command('archive-sessions')
+@click.option('--older-than-hours', type=float, default=None,
+              help='只封存結束超過這個時數的會話 (預設 ARCHIVE_AFTER_HOURS)')
+@click.option('--batch-size', type=int, default=500, help='每個交易封存的會話數')
+@with_appcontext
+def archive_sessions_command(older_than_hours, batch_size):
+    """把已結束的會話壓成 rounds_archive 並刪除 game_round 的原始列"""
+    init_db()
+    if older_than_hours is None:
+        older_than_hours = current_app.config['ARCHIVE_AFTER_HOURS']
+    cutoff = datetime.utcnow() - timedelta(hours=older_than_hours)
+    
+    totals = defaultdict(int)
+    for shard in shard_router.shards():
+        for key, value in archive_sessions(shard_router.session_for_shard(shard), cutoff, batch_size).items():
+            totals[key] += value
+    print(f'已封存 {totals["archived"]} 個會話、刪除 {totals["rounds"]} 筆回合列'
+          f' (略過 {totals["skipped"]} 個無法封存的會話)')
+
+@click.command('reap-sessions')
+@click.option('--stale-minutes', type=float, default=None,
+              help='只處理開始超過這個分鐘數仍未結束的會話 (預設 REAPER_STALE_MINUTES)')
+@click.option('--batch-size', type=int, default=None, help='每個交易處理的會話數 (預設 REAPER_BATCH_SIZE)')
+@with_appcontext
+def reap_sessions_command(stale_minutes, batch_size):
+    """立即執行一輪被放棄會話的清理：有回合的結束，沒有回合的刪除"""
+    init_db()
+    totals = session_reaper.run_once(stale_minutes, batch_size)
+    print(f'已結束 {totals["finalized"]} 個、刪除 {totals["deleted"]} 個被放棄的遊戲會話')
+
+def _export_filters(since, until, user_id, username):
+    """匯出的篩選條件；日期為 YYYY-MM-DD，username 會換成 user_id，不合法時丟出 ValueError"""
+    try:
+        since, until = parse_day(since), parse_day(until)
+    except ValueError:
+        raise ValueError('Invalid date, expected YYYY-MM-DD')
+    if username:
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise ValueError('User not found')
+        user_id = user.id
+    return {'since': since, 'until': until, 'user_id': user_id}
+
+def _export(kind, fmt, compress, filters):
+    # 引擎在 app context 內取得，串流時產生器自己開關連線
+    engines = [shard_router.engine_for_shard(shard) for shard in shard_router.shards()]
+    return export_chunks(engines, db.engine, kind, fmt, compress, **filters)
+
+@click.command('export')
+@click.argument('kind', type=click.Choice(sorted(EXPORT_COLUMNS)))
+@click.option('--format', 'fmt', type=click.Choice(sorted(EXPORT_FORMATS)), default='csv', help='輸出格式')
+@click.option('--gzip', 'compress', is_flag=True, help='以 gzip 壓縮輸出')
+@click.option('--since', help='只匯出這天 (YYYY-MM-DD) 之後開始的會話')
+@click.option('--until', help='只匯出這天 (YYYY-MM-DD，含當天) 之前開始的會話')
+@click.option('--user-id', type=int, help='只匯出這位玩家')
+@click.option('--username', help='只匯出這位玩家 (以名稱指定)')
+@click.option('-o', '--output', default='-', help='輸出檔案 (預設為標準輸出)')
+@with_appcontext
+def export_command(kind, fmt, compress, since, until, user_id, username, output):
+    """串流匯出原始回合 (rounds) 或會話 (sessions)，記憶體用量不隨資料量增加"""
+    init_db()
+    try:
+        filters = _export_filters(since, until, user_id, username)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    with click.open_file(output, 'wb') as out:
+        for chunk in _export(kind, fmt, compress, filters):
+            out.write(chunk)
+
+def finish_session(db_session, session_id, now):
+    """在呼叫端的交易內結束會話：寫入結束時間與平均反應時間並計入彙總表
+
+    以 end_time IS NULL 為條件更新，end_session 與清理程式碰到同一個會話時
+    只有一方會累加彙總表；回傳 True 表示這次結束了會話。
+    """
+    # 回合統計已在寫入時累加，這裡只需要計算平均
+    average = db.case(
+        (GameSession.correct_responses > 0,
+         db.cast(db.func.coalesce(GameSession.reaction_time_sum, 0), db.Float) / GameSession.correct_responses),
+        else_=0.0)
+    result = db_session.execute(
+        db.update(GameSession)
+        .where(GameSession.id == session_id, GameSession.end_time.is_(None))
+        .values(end_time=now, average_reaction_time=average)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        return False
+    apply_session_rollup(db_session, session_id, now)
+    return True
+
+def reap_sessions(cutoff, limit):
+    """清理程式的一批 (reaper.py)：每個資料庫取最多 limit 個 cutoff 之前開始仍未結束的會話
+
+    有回合 (含封存) 的會話結束並計入彙總表，沒有回合的刪除；每個資料庫一個交易。
+    """
+    # 佇列中還沒寫入的回合也算數，避免把剛玩完第一批的會話當成空的
+    round_writer.flush()
+    result = {'finalized': 0, 'deleted': 0, 'more': False}
+    has_rounds = db.exists().where(GameRound.session_id == GameSession.id)
+    
+    for shard in shard_router.shards():
+        db_session = shard_router.session_for_shard(shard)
+        try:
+            stale = db_session.execute(
+                db.select(GameSession.id, has_rounds | GameSession.rounds_archive.is_not(None))
+                .where(GameSession.end_time.is_(None), GameSession.start_time < cutoff)
+                .order_by(GameSession.start_time, GameSession.id)
+                .limit(limit)
+            ).all()
+            now = datetime.utcnow()
+            finished = [session_id for session_id, played in stale
+                        if played and finish_session(db_session, session_id, now)]
+            empty = [session_id for session_id, played in stale if not played]
+            deleted = 0
+            if empty:
+                # 選出之後才寫入第一批回合的會話不刪除，下一輪再結束
+                deleted = db_session.execute(
+                    db.delete(GameSession)
+                    .where(GameSession.id.in_(empty), GameSession.end_time.is_(None), ~has_rounds)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            raise
+        
+        if finished and current_app.config['REAPER_TRACK_PERCENTILES']:
+            for average in db_session.execute(
+                    db.select(GameSession.average_reaction_time).where(GameSession.id.in_(finished))).scalars():
+                percentile_service.add_session(average)
+        db_session.commit()
+        
+        for session_id in finished + empty:
+            failed = round_writer.failed_rounds(session_id)
+            if failed:
+                current_app.logger.warning('清理程式結束的會話 %d 缺少 %d 個寫入失敗的回合', session_id, failed)
+            round_writer.forget(session_id)
+        
+        result['finalized'] += len(finished)
+        result['deleted'] += deleted
+        result['more'] = result['more'] or len(stale) == limit
+    return result
+
+def _bump_session_counters(db_session, session_id, rows):
+    """在目前交易內以 UPDATE ... SET x = x + ? 累加會話統計"""
+    correct = [r['reaction_time'] for r in rows if r['response_accuracy']]
+    db_session.execute(
+        db.update(GameSession)
+        .where(GameSession.id == session_id)
+        .values(
+            total_rounds=db.func.coalesce(GameSession.total_rounds, 0) + len(rows),
+            correct_responses=db.func.coalesce(GameSession.correct_responses, 0) + len(correct),
+            reaction_time_sum=db.func.coalesce(GameSession.reaction_time_sum, 0) + sum(correct),
+        )
+    )
+
+def _round_shard(rows):
+    """延後寫入佇列的交易分組：一次送出的回合屬於同一個會話，也就在同一個分片"""
+    return shard_router.shard_for_id(rows[0]['session_id'])
+
+def write_rounds(rows):
+    """在單一交易內寫入一批回合 (可跨多個會話) 並累加會話統計；分片時每個分片一個交易"""
+    by_shard = defaultdict(lambda: defaultdict(list))
+    for row in rows:
+        by_shard[shard_router.shard_for_id(row['session_id'])][row['session_id']].append(row)
+    
+    for shard, by_session in by_shard.items():
+        db_session = shard_router.session_for_shard(shard)
+        try:
+            db_session.execute(db.insert(GameRound),
+                               [row for session_rows in by_session.values() for row in session_rows])
+            for session_id, session_rows in by_session.items():
+                _bump_session_counters(db_session, session_id, session_rows)
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            raise
+    
+    percentile_service.add_rounds(rows)
+
 # 路由
-@app.route('/')
+@bp.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         username = request.form.get('username', '').strip()
@@ -84,7 +433,7 @@ def register():
             session['login_time'] = datetime.now().isoformat()
             
             flash('註冊成功！', 'success')
-            return redirect(url_for('game_menu'))
+            return redirect(url_for('main.game_menu'))
             
         except Exception as e:
             db.session.rollback()
@@ -93,86 +442,275 @@ def register():
     
     return render_template('register.html')
 
-@app.route('/game_menu')
+@bp.route('/game_menu')
 def game_menu():
     if 'user_id' not in session:
         flash('請先註冊！', 'error')
-        return redirect(url_for('register'))
+        return redirect(url_for('main.register'))
     
     return render_template('game/menu.html')
 
-@app.route('/simple_reaction_game')
+@bp.route('/simple_reaction_game')
 def simple_reaction_game():
     if 'user_id' not in session:
         flash('請先註冊！', 'error')
-        return redirect(url_for('register'))
+        return redirect(url_for('main.register'))
+    
+    # 只記下開始時間；會話等第一批回合送來時才建立 (_game_session_id)，
+    # 重新整理或打開後沒玩的頁面不會寫入資料庫
+    session.pop('session_id', None)
+    session['pending_game'] = datetime.utcnow().isoformat()
+    session['game_start_time'] = datetime.now().isoformat()
+    
+    return render_template('game/simple_reaction.html')
+
+def _has_game():
+    return 'session_id' in session or 'pending_game' in session
+
+def _game_session_id():
+    """這局遊戲的會話 ID；第一次呼叫時才在玩家所在的分片 (不分片時就是主資料庫) 建立會話"""
+    if 'session_id' in session:
+        return session['session_id']
     
+    db_session = shard_router.session_for_user(session['user_id'])
     try:
-        game_session = GameSession(user_id=session['user_id'])
-        db.session.add(game_session)
-        db.session.commit()
-        
-        session['session_id'] = game_session.id
-        session['game_start_time'] = datetime.now().isoformat()
-        
-        return render_template('game/simple_reaction.html', session_id=game_session.id)
-        
-    except Exception as e:
-        db.session.rollback()
-        flash('創建遊戲會話失敗，請重試！', 'error')
-        return redirect(url_for('game_menu'))
+        game_session = GameSession(user_id=session['user_id'],
+                                   start_time=datetime.fromisoformat(session['pending_game']))
+        db_session.add(game_session)
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    
+    session['session_id'] = game_session.id
+    session.pop('pending_game', None)
+    return game_session.id
+
+# 回合欄位的允許範圍：整數欄位與封存格式 (int16) 一致，顏色與 game_round.stimulus_color 的長度一致
+MAX_ROUND_NUMBER = 0x7FFF
+MAX_REACTION_TIME_MS = 0x7FFF
+MAX_COLOR_LENGTH = 20
+
+def _int_field(data, name, high):
+    """0 到 high 之間的整數欄位；未提供或 null 時為 0，數字字串與浮點數取整數部分"""
+    value = data.get(name)
+    if value is None:
+        return 0
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f'Invalid {name}')
+    try:
+        value = int(value)
+    except (ValueError, OverflowError):
+        raise ValueError(f'Invalid {name}')
+    if not 0 <= value <= high:
+        raise ValueError(f'{name} out of range')
+    return value
 
-@app.route('/api/record_round', methods=['POST'])
+def _round_values(session_id, data):
+    """把前端送來的單一回合資料驗證後轉成 game_round 欄位；session_id 可先給 None 之後再補上
+
+    回合會和其他玩家的回合合併成一個交易寫入，所以每個欄位都在放進佇列之前檢查，
+    不合法時丟出 ValueError，整個請求被拒絕。
+    """
+    color = data.get('stimulus_color', 'red')
+    if color is not None and (not isinstance(color, str) or len(color) > MAX_COLOR_LENGTH):
+        raise ValueError('Invalid stimulus_color')
+    accuracy = data.get('response_accuracy', False)
+    if accuracy is None:
+        accuracy = False
+    if not isinstance(accuracy, bool) and accuracy not in (0, 1):
+        raise ValueError('Invalid response_accuracy')
+    return {
+        'session_id': session_id,
+        'round_number': _int_field(data, 'round_number', MAX_ROUND_NUMBER),
+        'stimulus_color': color,
+        'reaction_time': _int_field(data, 'reaction_time', MAX_REACTION_TIME_MS),
+        'response_accuracy': bool(accuracy),
+    }
+
+@bp.route('/api/record_round', methods=['POST'])
 def record_round():
-    if 'session_id' not in session:
+    if not _has_game():
         return jsonify({'success': False, 'error': 'No game session'})
     
-    session_id = session['session_id']
     data = request.json or {}
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'error': 'Invalid round payload'})
     
     try:
-        game_round = GameRound(
-            session_id=session_id,
-            round_number=data.get('round_number', 0),
-            stimulus_color=data.get('stimulus_color', 'red'),
-            reaction_time=data.get('reaction_time', 0),
-            response_accuracy=data.get('response_accuracy', False)
-        )
-        
-        db.session.add(game_round)
-        db.session.commit()
+        values = _round_values(None, data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)})
+    
+    try:
+        values['session_id'] = session_id = _game_session_id()
+        queued = round_writer.submit([values])
+        return jsonify({'success': True, 'session_id': session_id, 'queued': queued})
         
-        return jsonify({'success': True})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/api/record_rounds', methods=['POST'])
+def record_rounds():
+    """批次寫入多個回合：一次 executemany、一個交易"""
+    if not _has_game():
+        return jsonify({'success': False, 'error': 'No game session'})
+    
+    data = request.json
+    
+    # 接受 {"rounds": [...]} 或直接傳陣列
+    rounds = data.get('rounds') if isinstance(data, dict) else data
+    if not isinstance(rounds, list) or not all(isinstance(r, dict) for r in rounds):
+        return jsonify({'success': False, 'error': 'Invalid rounds payload'})
+    
+    if not rounds:
+        return jsonify({'success': True, 'recorded': 0})
+    if len(rounds) > current_app.config['INGEST_MAX_ROUNDS_PER_REQUEST']:
+        return jsonify({'success': False, 'error': 'Too many rounds'})
+    
+    try:
+        rows = [_round_values(None, r) for r in rounds]
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)})
+    
+    try:
+        session_id = _game_session_id()
+        for row in rows:
+            row['session_id'] = session_id
+        queued = round_writer.submit(rows)
+        return jsonify({'success': True, 'session_id': session_id, 'recorded': len(rows), 'queued': queued})
         
     except Exception as e:
-        db.session.rollback()
         return jsonify({'success': False, 'error': str(e)})
 
-@app.route('/api/end_session', methods=['POST'])
+@bp.route('/api/ingest_stats')
+def ingest_stats():
+    """延後寫入佇列的深度、批次大小與 commit 延遲"""
+    return jsonify(round_writer.stats())
+
+@bp.route('/metrics')
+def metrics():
+    """Prometheus 格式的請求延遲、SQL、commit、樣板與 session cookie 耗時"""
+    response = make_response(request_metrics.render())
+    response.mimetype = 'text/plain'
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
+@bp.route('/api/stream/results')
+def stream_results():
+    """剛結束的遊戲結果 (Server-Sent Events)：連線時先補送最近幾筆，之後即時推送，不查詢資料庫"""
+    subscriber = result_feed.subscribe(request.headers.get('Last-Event-ID', type=int))
+    if subscriber is None:
+        return jsonify({'success': False, 'error': 'Too many listeners'}), 503
+    
+    response = current_app.response_class(
+        result_feed.stream(subscriber, current_app.config['RESULTS_FEED_KEEPALIVE']),
+        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # 反向代理 (nginx) 不要緩衝，事件才會馬上送到
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/api/export/<kind>')
+def export_data(kind):
+    """串流匯出原始資料：/api/export/rounds (回合含會話與玩家欄位) 或 /api/export/sessions
+
+    參數：format=csv|ndjson、gzip=1、since / until (YYYY-MM-DD，依會話開始日期，含當天)、
+    user_id 或 username。第一段馬上送出，之後邊讀邊送，不會把結果整個放進記憶體。
+    內容含玩家名稱與年齡：只有設定 EXPORT_API_TOKEN 時才開放，請求需帶
+    Authorization: Bearer <token>；未設定時回 404，請改用 flask export。
+    """
+    token = current_app.config['EXPORT_API_TOKEN']
+    if not token:
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(credentials.strip().encode(), token.encode()):
+        response = jsonify({'success': False, 'error': 'Unauthorized'})
+        response.headers['WWW-Authenticate'] = 'Bearer'
+        return response, 401
+    
+    fmt = request.args.get('format', 'csv')
+    compress = request.args.get('gzip', '0') not in ('0', '', 'false')
+    if kind not in EXPORT_COLUMNS:
+        return jsonify({'success': False, 'error': 'Unknown export kind'}), 404
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'error': 'Invalid format'}), 400
+    
+    try:
+        filters = _export_filters(request.args.get('since'), request.args.get('until'),
+                                  request.args.get('user_id', type=int), request.args.get('username'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    filename = f'{kind}.{fmt}' + ('.gz' if compress else '')
+    response = current_app.response_class(
+        _export(kind, fmt, compress, filters),
+        mimetype='application/gzip' if compress else EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/api/percentile')
+def percentile():
+    """查詢某個反應時間在全體玩家中的名次 (比幾 % 的人快)"""
+    ms = request.args.get('ms', type=float)
+    kind = request.args.get('kind', 'session')
+    
+    if ms is None or ms < 0:
+        return jsonify({'success': False, 'error': 'Invalid ms'})
+    if kind not in PercentileService.KINDS:
+        return jsonify({'success': False, 'error': 'Invalid kind'})
+    
+    faster_than, population = percentile_service.rank(ms, kind)
+    return jsonify({
+        'success': True,
+        'ms': ms,
+        'kind': kind,
+        'faster_than': faster_than,
+        'population': population
+    })
+
+@bp.route('/api/end_session', methods=['POST'])
 def end_session():
     if 'session_id' not in session:
-        return jsonify({'success': False, 'error': 'No game session'})
+        # 還沒送出任何回合的遊戲沒有會話可以結束
+        error = 'No rounds recorded' if 'pending_game' in session else 'No game session'
+        return jsonify({'success': False, 'error': error})
     
     session_id = session['session_id']
     
+    # 先確保此會話尚在佇列中的回合都已寫入
+    if not round_writer.flush():
+        return jsonify({'success': False, 'error': 'Pending rounds not yet written'})
+    # 背景寫入失敗的回合已經回應過成功，不能當成完整的會話結束
+    failed = round_writer.failed_rounds(session_id)
+    if failed:
+        return jsonify({'success': False, 'error': 'Some rounds were not saved', 'rounds_failed': failed})
+    
+    db_session = shard_router.session_for_id(session_id)
+    if db_session is None:
+        return jsonify({'success': False, 'error': 'Session not found'})
+    
     try:
-        game_session = db.session.get(GameSession, session_id)
+        game_session = db_session.get(GameSession, session_id)
         if not game_session:
             return jsonify({'success': False, 'error': 'Session not found'})
         
-        game_session.end_time = datetime.utcnow()
-        
-        rounds = GameRound.query.filter_by(session_id=session_id).all()
-        game_session.total_rounds = len(rounds)
-        game_session.correct_responses = sum(1 for r in rounds if r.response_accuracy)
-        
-        reaction_times = [r.reaction_time for r in rounds if r.response_accuracy]
-        if reaction_times:
-            game_session.average_reaction_time = sum(reaction_times) / len(reaction_times)
-        else:
-            game_session.average_reaction_time = 0
-        
-        db.session.commit()
+        # 重複呼叫或已被清理程式結束時不會再次累加彙總表
+        finished = finish_session(db_session, session_id, datetime.utcnow())
+        db_session.commit()
+        if finished:
+            percentile_service.add_session(game_session.average_reaction_time)
+            result_feed.publish({
+                'session_id': session_id,
+                'username': session.get('username'),
+                'total_rounds': game_session.total_rounds,
+                'correct_responses': game_session.correct_responses,
+                'average_reaction_time': game_session.average_reaction_time,
+                'end_time': game_session.end_time.isoformat(),
+                'url': url_for('main.results', session_id=session_id),
+            })
         
         return jsonify({
             'success': True, 
@@ -182,27 +720,227 @@ def end_session():
         })
     
     except Exception as e:
-        db.session.rollback()
+        db_session.rollback()
         return jsonify({'success': False, 'error': str(e)})
 
-@app.route('/results/<int:session_id>')
+def _rollup_summary(row):
+    """把彙總列轉成 JSON，順便算出平均與標準差"""
+    n = row.successful_rounds
+    mean = row.reaction_time_sum / n if n else None
+    std = None
+    if n > 1:
+        variance = (row.reaction_time_sq_sum - n * mean * mean) / (n - 1)
+        std = max(variance, 0) ** 0.5
+    return {
+        'total_rounds': row.total_rounds,
+        'correct_count': row.correct_count,
+        'successful_rounds': n,
+        'average_reaction_time': mean,
+        'std_reaction_time': std,
+        'best_time': row.best_time,
+        'worst_time': row.worst_time,
+    }
+
+@bp.route('/api/stats/daily')
+def daily_stats():
+    """最近幾天的彙總 (讀 daily_stats，不掃描 game_round)"""
+    days = min(max(request.args.get('days', 30, type=int), 1), 366)
+    
+    # 分片時每個資料庫各有一份 daily_stats，取各自最近的幾天後依日期合併
+    merged = {}
+    for shard in shard_router.shards():
+        rows = shard_router.session_for_shard(shard).query(DailyStats) \
+            .order_by(DailyStats.day.desc()).limit(days).all()
+        for row in rows:
+            merged.setdefault(row.day, []).append(row)
+    
+    return jsonify({
+        'success': True,
+        'days': [_merge_daily_rows(day, merged[day]) for day in sorted(merged)[-days:]]
+    })
+
+def _merge_daily_rows(day, rows):
+    """同一天在各個資料庫的 daily_stats 列合併成一筆"""
+    if len(rows) == 1:
+        row = rows[0]
+    else:
+        row = DailyStats(day=day)
+        for column in ['sessions', 'total_rounds', 'correct_count', 'successful_rounds',
+                       'reaction_time_sum', 'reaction_time_sq_sum'] + BAND_COLUMNS:
+            setattr(row, column, sum(getattr(r, column) or 0 for r in rows))
+        best = [r.best_time for r in rows if r.best_time is not None]
+        worst = [r.worst_time for r in rows if r.worst_time is not None]
+        row.best_time = min(best) if best else None
+        row.worst_time = max(worst) if worst else None
+    
+    return dict(_rollup_summary(row),
+                day=day.isoformat(),
+                sessions=row.sessions,
+                bands=[getattr(row, band) for band in BAND_COLUMNS])
+
+@bp.route('/api/stats/me')
+def my_stats():
+    """目前玩家的累計成績 (讀 user_stats)"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Not registered'})
+    
+    row = shard_router.session_for_user(session['user_id']).get(UserStats, session['user_id'])
+    if row is None:
+        return jsonify({'success': True, 'play_count': 0})
+    
+    return jsonify(dict(_rollup_summary(row), success=True, play_count=row.play_count))
+
+def _cached_results_response(body, etag):
+    """已結束的會話：帶上強 ETag 與 Cache-Control，符合 If-None-Match 時回 304"""
+    response = make_response(body)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['RESULTS_CACHE_MAX_AGE']
+    return response.make_conditional(request)
+
+@bp.route('/results/<int:session_id>')
 def results(session_id):
+    # 有待顯示的 flash 訊息時頁面內容會不同，不走快取
+    cacheable = '_flashes' not in session
+    
+    if cacheable:
+        cached = result_cache.get(session_id)
+        if cached is not None:
+            return _cached_results_response(*cached)
+    
     try:
-        game_session = db.session.get(GameSession, session_id)
+        db_session = shard_router.session_for_id(session_id)
+        game_session = db_session.get(GameSession, session_id) if db_session is not None else None
         if not game_session:
             flash('找不到測試結果', 'error')
-            return redirect(url_for('game_menu'))
+            return redirect(url_for('main.game_menu'))
+        
+        rounds = db_session.query(GameRound).filter_by(session_id=session_id).order_by(GameRound.round_number).all()
+        if game_session.rounds_archive is not None:
+            # 封存的回合加上封存之後才寫入的回合
+            rounds = sorted(PackedRounds(game_session.rounds_archive).rounds() + rounds,
+                            key=lambda r: r.round_number)
         
-        rounds = GameRound.query.filter_by(session_id=session_id).order_by(GameRound.round_number).all()
+        html = render_template('game/results.html', session=game_session, rounds=rounds)
         
-        return render_template('game/results.html', session=game_session, rounds=rounds)
+        # 尚未結束的會話結果仍會變動，不快取
+        if not cacheable or game_session.end_time is None:
+            return html
+        
+        body = html.encode('utf-8')
+        etag = result_cache.put(session_id, body)
+        return _cached_results_response(body, etag)
     
     except Exception as e:
         flash('載入結果時發生錯誤', 'error')
-        return redirect(url_for('game_menu'))
+        return redirect(url_for('main.game_menu'))
 
-if __name__ == '__main__':
+def save_percentiles(app):
+    if not app.config['PERCENTILE_SNAPSHOT_SAVE']:
+        return
+    app.extensions['percentile_service'].save(app.config['PERCENTILE_SNAPSHOT'])
+
+def _register_percentile_save(app):
+    """處理第一個請求時才登記結束時寫入名次快照
+
+    只有實際提供服務的行程會寫入；flask 的 CLI 指令與 reloader 的監看行程 (python app.py)
+    也會建立應用，但不處理請求，不會用自己較舊的狀態蓋掉快照。
+    """
+    registered = threading.Event()
+    
+    def register():
+        if not registered.is_set():
+            registered.set()
+            atexit.register(save_percentiles, app)
+    
+    app.before_request(register)
+
+def _init_services(app):
+    """建立這個應用自己的服務實例 (放進 app.extensions) 並登記 /metrics 的數值"""
+    router = ShardRouter(db)
+    router.init_app(app, db)
+    writer = RoundWriter()
+    writer.init_app(app, write_batch=write_rounds, batch_key=_round_shard)
+    reaper = SessionReaper()
+    reaper.init_app(app, reap_batch=reap_sessions)
+    cache = ResultCache()
+    cache.init_app(app)
+    feed = ResultFeed()
+    feed.init_app(app)
+    percentiles = PercentileService()
+    percentiles.init_app(app)
+    
+    metrics = RequestMetrics()
+    metrics.add_gauge('app_ingest', 'Background round writer stats (see /api/ingest_stats)',
+                      lambda: {k: v for k, v in writer.stats().items() if v is not None})
+    metrics.add_gauge('app_results_cache', 'Results page cache stats', cache.stats)
+    metrics.add_gauge('app_results_feed', 'Live results stream subscribers and fan-out stats', feed.stats)
+    metrics.add_gauge('app_percentile_population', 'Samples in the percentile histograms',
+                      lambda: {kind: percentiles.rank(0, kind)[1] for kind in PercentileService.KINDS})
+    metrics.add_gauge('app_reaper', 'Abandoned session reaper stats in this process', reaper.stats)
+    with app.app_context():
+        metrics.init_app(app, db.engine)
+        for shard in router.shards():
+            engine = router.engine_for_shard(shard)
+            if app.config['SQLITE_STORAGE_PROFILE']:
+                configure_sqlite_engine(engine)
+            if shard is not None:
+                metrics.watch_engine(engine)
+
+def create_app(config_name=None):
+    """依 config.py 建立應用；config_name 未指定時讀 FLASK_CONFIG 環境變數
+
+    資料庫引擎在這裡才建立，所以 fork 出來的 worker 各自呼叫一次就會有自己的連線池。
+    round_writer、result_cache 等服務每個應用各自一份，同一個行程可以建立多個應用 (例如測試)。
+    """
+    config_name = config_name or os.environ.get('FLASK_CONFIG') or 'default'
+    
+    app = Flask(__name__)
+    app.config.from_object(config[config_name])
+    if not app.config['PERCENTILE_SNAPSHOT']:
+        app.config['PERCENTILE_SNAPSHOT'] = os.path.join(app.instance_path, 'percentiles.json')
+    
+    # 分片檔以 SQLALCHEMY_BINDS 登記，每個分片一個引擎
+    if app.config['SHARD_COUNT']:
+        app.config['SQLALCHEMY_BINDS'] = dict(
+            app.config.get('SQLALCHEMY_BINDS') or {},
+            **shard_binds(app.config['SHARD_COUNT'], app.config['SHARD_URI_TEMPLATE']))
+    
+    db.init_app(app)
+    _init_services(app)
+    
+    app.register_blueprint(bp)
+    app.cli.add_command(rebuild_counters_command)
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(archive_sessions_command)
+    app.cli.add_command(reap_sessions_command)
+    app.cli.add_command(export_command)
+    
+    # 啟動時建立表格並補上舊資料庫缺少的欄位與索引
     with app.app_context():
-        db.create_all()
+        init_db()
+        
+        # 讀回上次的名次快照，再補上之後新增的資料；沒有快照時就是完整重建
+        percentile_service.load(app.config['PERCENTILE_SNAPSHOT'])
+        with shard_router.connect_all() as connections:
+            for name, connection in connections.items():
+                percentile_service.catch_up(connection, name)
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # 背景清理被放棄的會話；多個 worker 時只由 serve.py 的主行程執行
+    app.extensions['session_reaper'].start()
+    if app.config['PERCENTILE_SNAPSHOT_SAVE']:
+        _register_percentile_save(app)
+    return app
+
+def __getattr__(name):
+    # 相容 `from app import app` 與 `flask --app app`：第一次取用時才建立預設應用
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+if __name__ == '__main__':
+    # 開發用：單一行程加上 reloader；正式環境請用 serve.py 啟動多個 worker
+    application = create_app()
+    application.run(debug=application.config['DEBUG'], host='0.0.0.0', port=5000)
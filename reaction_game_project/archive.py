@@ -0,0 +1,237 @@
+"""已結束會話的回合封存 (packed arrays)
+
+封存後一個會話的所有回合壓成 game_session.rounds_archive 的一個 BLOB，原本的
+game_round 列在同一個交易內刪除：
+
+    header            8 bytes：magic b'RA'、版本、顏色數、回合數 n、字典長度
+    int16[n]          round_number
+    int16[n]          reaction_time，NULL 記為 -32768
+    uint8[n]          stimulus_color 的字典代碼，NULL 記為 255
+    uint8[(n+7)//8]   response_accuracy 位元遮罩 (np.packbits，little bit order)
+    字典              以 \\x1f 分隔的 UTF-8 顏色名稱
+    int64 + uint32[n] 版本 2：原本的 game_round.id，存成最小值與各回合的差
+
+原本的 id 讓名次服務分辨哪些封存的回合已經在快照裡 (percentiles.PercentileService.catch_up)；
+game_session.rounds_archive_max_id 記下最大的 id，只需要讀比水位線新的封存。版本 1 的封存沒有 id。
+讀取時數值陣列以 np.frombuffer 直接指向 BLOB，不複製。
+封存後仍寫進來的回合照常放在 game_round，完整的回合 = game_round + 封存。
+"""
+import sqlite3
+from collections import namedtuple
+
+import numpy as np
+from sqlalchemy import DateTime, bindparam, text
+
+# 格式常數放在只用標準函式庫的 archive_format.py，分析腳本的 --text 模式也讀同一份
+from archive_format import ARCHIVE_MAGIC, ARCHIVE_VERSION, COLOR_NULL, INT16_NULL, read_header
+from archive_format import HEADER as _HEADER
+from archive_format import ID_BASE as _ID_BASE
+from archive_format import SEPARATOR as _SEPARATOR
+
+# 與 GameRound 相同的屬性名稱，結果頁的樣板不需要區分
+ArchivedRound = namedtuple('ArchivedRound', 'round_number stimulus_color reaction_time response_accuracy')
+
+# 需要完整回合的重建 SQL 使用：原始列加上 load_archived_rounds() 解開的封存
+ALL_ROUNDS = """(
+    SELECT session_id, round_number, stimulus_color, reaction_time, response_accuracy FROM game_round
+    UNION ALL
+    SELECT session_id, round_number, stimulus_color, reaction_time, response_accuracy FROM temp.archived_round
+)"""
+
+
+def pack_rounds(round_numbers, colors, reaction_times, accuracies, round_ids=None):
+    """把一個會話的回合壓成 BLOB；有無法無損表示的值 (超出 int16、非整數等) 時回傳 None
+
+    SQLite 的欄位型別不強制，舊資料可能把 round_number 等存成 TEXT，這些會話一樣回傳 None 略過。
+    有 round_ids (原本的 game_round.id) 時寫成版本 2，否則寫成沒有 id 的版本 1。
+    """
+    n = len(round_numbers)
+    if not n or n > 0xFFFF:
+        return None
+
+    if any(not isinstance(number, int) or not -0x8000 <= number <= 0x7FFF for number in round_numbers) or \
+            any(t is not None and (not isinstance(t, int) or not INT16_NULL < t <= 0x7FFF)
+                for t in reaction_times) or \
+            any(c is not None and not isinstance(c, str) for c in colors) or \
+            any(a is not None and not isinstance(a, int) for a in accuracies):
+        return None
+    numbers = np.array(round_numbers, dtype='<i2')
+    times = np.array([INT16_NULL if t is None else t for t in reaction_times], dtype='<i2')
+
+    vocab = list(dict.fromkeys(c for c in colors if c is not None))
+    if len(vocab) >= COLOR_NULL or any(_SEPARATOR in c for c in vocab):
+        return None
+    index = {color: code for code, color in enumerate(vocab)}
+    codes = np.array([COLOR_NULL if c is None else index[c] for c in colors], dtype=np.uint8)
+    dictionary = _SEPARATOR.join(vocab).encode('utf-8')
+    if len(dictionary) > 0xFFFF:
+        return None
+
+    ids = []
+    if round_ids is not None:
+        if any(not isinstance(i, int) for i in round_ids):
+            return None
+        base = min(round_ids)
+        if max(round_ids) - base > 0xFFFFFFFF:
+            return None
+        ids = [_ID_BASE.pack(base), np.array([i - base for i in round_ids], dtype='<u4').tobytes()]
+
+    bits = np.packbits(np.array([bool(a) for a in accuracies], dtype=bool), bitorder='little')
+    return b''.join([
+        _HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION if ids else 1, len(vocab), n, len(dictionary)),
+        numbers.tobytes(),
+        times.tobytes(),
+        codes.tobytes(),
+        bits.tobytes(),
+        dictionary,
+        *ids,
+    ])
+
+
+class PackedRounds:
+    """解開的封存；round_number、reaction_time、color_codes 是指向 BLOB 的唯讀 view
+
+    round_ids 是原本的 game_round.id，版本 1 的封存為 None。
+    """
+
+    def __init__(self, blob):
+        version, n_colors, n, dictionary_size = read_header(blob)
+
+        offset = _HEADER.size
+        self.round_number = np.frombuffer(blob, dtype='<i2', count=n, offset=offset)
+        offset += 2 * n
+        self.reaction_time = np.frombuffer(blob, dtype='<i2', count=n, offset=offset)
+        offset += 2 * n
+        self.color_codes = np.frombuffer(blob, dtype=np.uint8, count=n, offset=offset)
+        offset += n
+        self._accuracy_bits = np.frombuffer(blob, dtype=np.uint8, count=(n + 7) // 8, offset=offset)
+        offset += (n + 7) // 8
+        dictionary = bytes(blob[offset:offset + dictionary_size]).decode('utf-8')
+        self.colors = dictionary.split(_SEPARATOR) if n_colors else []
+        offset += dictionary_size
+
+        self.round_ids = None
+        if version >= 2:
+            base, = _ID_BASE.unpack_from(blob, offset)
+            self.round_ids = base + np.frombuffer(blob, dtype='<u4', count=n, offset=offset + _ID_BASE.size) \
+                .astype(np.int64)
+
+    def __len__(self):
+        return len(self.round_number)
+
+    @property
+    def response_accuracy(self):
+        return np.unpackbits(self._accuracy_bits, count=len(self), bitorder='little').astype(bool)
+
+    @property
+    def reaction_time_null(self):
+        return self.reaction_time == INT16_NULL
+
+    def stimulus_colors(self):
+        vocab = np.array(self.colors + [None], dtype=object)
+        return vocab[np.where(self.color_codes == COLOR_NULL, len(self.colors), self.color_codes)]
+
+    def rounds(self):
+        """轉成 ArchivedRound 清單 (結果頁用)"""
+        nulls = self.reaction_time_null
+        return [ArchivedRound(int(number), color, None if null else int(ms), bool(correct))
+                for number, color, ms, null, correct in zip(
+                    self.round_number, self.stimulus_colors(), self.reaction_time, nulls,
+                    self.response_accuracy)]
+
+
+def iter_archives(connection, batch_size=500, session_table='game_session', after_round_id=None):
+    """依 id 逐批讀出所有封存，產生 (session_id, PackedRounds)
+
+    每次只讀 batch_size 個 BLOB；connection 可以是 SQLAlchemy 連線，也可以是分析腳本用的 sqlite3 連線。
+    有 after_round_id 時只讀含有比它新的回合的封存 (rounds_archive_max_id，版本 1 的封存不會讀到)。
+    """
+    newer = 'AND rounds_archive_max_id > :round_id' if after_round_id is not None else ''
+    query = f"""
+        SELECT id, rounds_archive FROM {session_table}
+        WHERE rounds_archive IS NOT NULL AND id > :after {newer}
+        ORDER BY id LIMIT :limit
+    """
+    if not isinstance(connection, sqlite3.Connection):
+        query = text(query)
+    last_id = 0
+    while True:
+        rows = connection.execute(query, {'after': last_id, 'limit': batch_size,
+                                          'round_id': after_round_id}).fetchall()
+        if not rows:
+            return
+        for session_id, blob in rows:
+            yield session_id, PackedRounds(blob)
+        last_id = rows[-1][0]
+
+
+def load_archived_rounds(connection):
+    """把所有封存解開放進 temp.archived_round，讓重建用的 SQL 可以讀 ALL_ROUNDS；回傳回合數"""
+    connection.execute(text('DROP TABLE IF EXISTS temp.archived_round'))
+    connection.execute(text("""
+        CREATE TEMP TABLE archived_round (
+            session_id INTEGER, round_number INTEGER, stimulus_color VARCHAR(20),
+            reaction_time INTEGER, response_accuracy BOOLEAN)
+    """))
+    connection.execute(text('CREATE INDEX temp.ix_archived_round_session ON archived_round (session_id)'))
+
+    insert = text('INSERT INTO temp.archived_round VALUES '
+                  '(:session_id, :round_number, :stimulus_color, :reaction_time, :response_accuracy)')
+    total = 0
+    for session_id, packed in iter_archives(connection):
+        connection.execute(insert, [dict(r._asdict(), session_id=session_id) for r in packed.rounds()])
+        total += len(packed)
+    return total
+
+
+def archive_sessions(connection, cutoff, batch_size=500):
+    """把 end_time 早於 cutoff 的會話封存並刪除原始回合列，每批一個交易
+
+    id 最大的回合所屬的會話不封存：game_round 沒有 AUTOINCREMENT，刪掉最大的 id 之後
+    SQLite 會重用它，名次服務以 id 為水位線就會漏掉新的回合。
+    回傳 {'archived': 會話數, 'rounds': 刪除的列數, 'skipped': 無法無損封存的會話數}。
+    """
+    result = {'archived': 0, 'rounds': 0, 'skipped': 0}
+    select_rounds = text("""
+        SELECT session_id, round_number, stimulus_color, reaction_time, response_accuracy, id
+        FROM game_round WHERE session_id IN :ids
+        ORDER BY session_id, round_number, id
+    """).bindparams(bindparam('ids', expanding=True))
+    delete_rounds = text('DELETE FROM game_round WHERE session_id IN :ids') \
+        .bindparams(bindparam('ids', expanding=True))
+
+    last_id = 0
+    while True:
+        session_ids = connection.execute(text("""
+            SELECT gs.id FROM game_session gs
+            WHERE gs.end_time IS NOT NULL AND gs.end_time < :cutoff
+              AND gs.rounds_archive IS NULL AND gs.id > :after
+              AND EXISTS (SELECT 1 FROM game_round gr WHERE gr.session_id = gs.id)
+              AND gs.id IS NOT (SELECT session_id FROM game_round ORDER BY id DESC LIMIT 1)
+            ORDER BY gs.id LIMIT :limit
+        """).bindparams(bindparam('cutoff', type_=DateTime())),
+            {'cutoff': cutoff, 'after': last_id, 'limit': batch_size}).scalars().all()
+        if not session_ids:
+            return result
+        last_id = session_ids[-1]
+
+        by_session = {}
+        for session_id, *values in connection.execute(select_rounds, {'ids': session_ids}):
+            by_session.setdefault(session_id, []).append(values)
+
+        archives = []
+        for session_id, rows in by_session.items():
+            numbers, colors, times, accuracies, round_ids = zip(*rows)
+            blob = pack_rounds(numbers, colors, times, accuracies, round_ids)
+            if blob is None:
+                result['skipped'] += 1
+            else:
+                archives.append({'id': session_id, 'blob': blob, 'max_id': max(round_ids)})
+                result['rounds'] += len(rows)
+
+        if archives:
+            connection.execute(text('UPDATE game_session SET rounds_archive = :blob, rounds_archive_max_id = :max_id '
+                                    'WHERE id = :id'), archives)
+            connection.execute(delete_rounds, {'ids': [a['id'] for a in archives]})
+        connection.commit()
+        result['archived'] += len(archives)
@@ -0,0 +1,36 @@
+"""rounds_archive 的格式常數與只用標準函式庫的解碼
+
+archive.py (NumPy 版) 與分析腳本的 --text 模式 (不載入 NumPy) 共用這裡的定義，
+格式改版時兩邊不會各說各話；各區段的說明見 archive.py。
+"""
+import struct
+import sys
+from array import array
+
+ARCHIVE_MAGIC = b'RA'
+ARCHIVE_VERSION = 2
+HEADER = struct.Struct('<2sBBHH')
+ID_BASE = struct.Struct('<q')
+INT16_NULL = -32768
+COLOR_NULL = 255
+SEPARATOR = '\x1f'
+
+
+def read_header(blob):
+    """回傳 (版本, 顏色數, 回合數 n, 字典長度)；不是封存或是不認得的版本時丟出 ValueError"""
+    magic, version, n_colors, n, dictionary_size = HEADER.unpack_from(blob)
+    if magic != ARCHIVE_MAGIC or not 1 <= version <= ARCHIVE_VERSION:
+        raise ValueError(f'not a rounds archive (magic {magic!r}, version {version})')
+    return version, n_colors, n, dictionary_size
+
+
+def reactions(blob):
+    """(reaction_time, response_accuracy)：array('h') 與 bool 串列，NULL 的反應時間為 INT16_NULL"""
+    _, _, n, _ = read_header(blob)
+    offset = HEADER.size + 2 * n
+    times = array('h')
+    times.frombytes(blob[offset:offset + 2 * n])
+    if sys.byteorder != 'little':
+        times.byteswap()
+    bits = blob[offset + 3 * n:offset + 3 * n + (n + 7) // 8]
+    return times, [bool(bits[i >> 3] >> (i & 7) & 1) for i in range(n)]
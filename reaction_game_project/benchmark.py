@@ -0,0 +1,232 @@
+"""遊戲端點效能測試
+
+每個模式在獨立的子行程中啟動 app，指向全新的暫存 SQLite 檔，
+以多個執行緒模擬玩家跑完整個流程，回報各端點的吞吐量、p50/p95/p99 延遲，
+以及 SQLite 鎖定 (database is locked) 的錯誤數。
+
+    python benchmark.py --players 50 --concurrency 8 --output run.json
+    python benchmark.py --baseline run.json          # 與先前的結果比較，退步時結束碼為 1
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROUNDS_PER_GAME = 15
+ENDPOINTS = ('register', 'simple_reaction_game', 'record_round', 'end_session', 'results')
+
+# 與基準相比超過這個比例就視為退步 (延遲變高或吞吐量變低)
+DEFAULT_THRESHOLD = 0.2
+
+MODES = {
+    'before': {'SQLITE_STORAGE_PROFILE': '0'},
+    'after': {'SQLITE_STORAGE_PROFILE': '1'},
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def is_lock_error(message):
+    return 'locked' in message.lower() or 'busy' in message.lower()
+
+
+def summarize(timings, elapsed, errors):
+    summary = {}
+    for endpoint, values in timings.items():
+        summary[endpoint] = {
+            'count': len(values),
+            'throughput_rps': len(values) / elapsed if elapsed else 0.0,
+            'mean_ms': sum(values) / len(values) if values else 0.0,
+            'p50_ms': percentile(values, 50),
+            'p95_ms': percentile(values, 95),
+            'p99_ms': percentile(values, 99),
+            'max_ms': max(values) if values else 0.0,
+        }
+    requests = sum(len(values) for values in timings.values())
+    return {
+        'elapsed_s': elapsed,
+        'requests': requests,
+        'throughput_rps': requests / elapsed if elapsed else 0.0,
+        'endpoints': summary,
+        'errors': errors,
+        'lock_errors': sum(1 for e in errors if is_lock_error(e)),
+    }
+
+
+def run_player(app, index, timings, errors):
+    client = app.test_client()
+
+    def timed(name, method, url, **kwargs):
+        started = time.perf_counter()
+        response = getattr(client, method)(url, **kwargs)
+        timings[name].append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            errors.append(f'{name}: HTTP {response.status_code}')
+        elif response.is_json and response.json.get('success') is False:
+            errors.append(f"{name}: {response.json.get('error')}")
+        return response
+
+    timed('register', 'post', '/register', data={'username': f'bench-{index}', 'age': '20'})
+    timed('simple_reaction_game', 'get', '/simple_reaction_game')
+    for round_number in range(1, ROUNDS_PER_GAME + 1):
+        timed('record_round', 'post', '/api/record_round', json={
+            'round_number': round_number,
+            'stimulus_color': 'red',
+            'reaction_time': 250 + (index * 7 + round_number * 13) % 300,
+            'response_accuracy': round_number % 5 != 0,
+        })
+    response = timed('end_session', 'post', '/api/end_session')
+    session_id = response.json.get('session_id')
+    if session_id:
+        timed('results', 'get', f'/results/{session_id}')
+
+
+def run_worker(players, concurrency):
+    """子行程：在目前的環境變數設定下跑一次測試，輸出 JSON"""
+    from app import app, db, init_db
+
+    round_writer = app.extensions['round_writer']
+    app.config['TESTING'] = True
+    with app.app_context():
+        init_db()
+        # 關閉儲存設定時也移除索引，重現原本的資料表結構
+        if not app.config['SQLITE_STORAGE_PROFILE']:
+            db.session.execute(db.text('DROP INDEX IF EXISTS ix_game_round_session_round'))
+            db.session.execute(db.text('DROP INDEX IF EXISTS ix_game_session_user_start'))
+            db.session.execute(db.text('DROP INDEX IF EXISTS ix_game_session_open'))
+            db.session.commit()
+
+    timings = {name: [] for name in ENDPOINTS}
+    errors = []
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(run_player, app, i, timings, errors) for i in range(players)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    # 確認佇列中的回合都已寫入，寫入失敗也算進錯誤
+    round_writer.flush()
+    ingest = round_writer.stats()
+    if ingest['rows_failed']:
+        errors.append(f"ingest: {ingest['rows_failed']} rounds failed to write")
+
+    result = summarize(timings, elapsed, errors)
+    result['ingest'] = ingest
+    print(json.dumps(result))
+
+
+def run_mode(name, players, concurrency):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, **MODES[name])
+        env['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        env['PERCENTILE_SNAPSHOT'] = os.path.join(tmp, 'percentiles.json')
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--worker',
+             '--players', str(players), '--concurrency', str(concurrency)],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def print_comparison(results):
+    names = list(results)
+    print(f"{'endpoint':<22}" + ''.join(
+        f'{n + " p50":>14}{n + " p95":>14}{n + " p99":>14}{n + " rps":>12}' for n in names))
+    endpoints = results[names[0]]['endpoints']
+    for endpoint in endpoints:
+        row = f'{endpoint:<22}'
+        for name in names:
+            stats = results[name]['endpoints'][endpoint]
+            row += (f"{stats['p50_ms']:>12.2f}ms{stats['p95_ms']:>12.2f}ms{stats['p99_ms']:>12.2f}ms"
+                    f"{stats['throughput_rps']:>12.1f}")
+        print(row)
+    for name in names:
+        result = results[name]
+        print(f"{name}: {result['elapsed_s']:.2f}s total, {result['throughput_rps']:.1f} req/s, "
+              f"{len(result['errors'])} errors ({result['lock_errors']} lock waits)")
+
+
+def compare_to_baseline(results, baseline, threshold):
+    """與基準結果比較，回傳退步項目的說明"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+
+        if result['throughput_rps'] < base['throughput_rps'] * (1 - threshold):
+            regressions.append(f"{name}: throughput {base['throughput_rps']:.1f} -> "
+                               f"{result['throughput_rps']:.1f} req/s")
+        if result['lock_errors'] > base.get('lock_errors', 0):
+            regressions.append(f"{name}: lock errors {base.get('lock_errors', 0)} -> {result['lock_errors']}")
+
+        for endpoint, stats in result['endpoints'].items():
+            base_stats = base['endpoints'].get(endpoint)
+            if not base_stats:
+                continue
+            for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+                if stats[key] > base_stats[key] * (1 + threshold):
+                    regressions.append(f"{name} {endpoint}: {key} {base_stats[key]:.2f} -> {stats[key]:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the game endpoints')
+    parser.add_argument('--players', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--mode', choices=sorted(MODES), action='append',
+                        help='run only the given mode(s); default runs before and after')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON file from an earlier --output run to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='relative change counted as a regression (default 0.2 = 20%%)')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.players, args.concurrency)
+        return
+
+    results = {name: run_mode(name, args.players, args.concurrency)
+               for name in (args.mode or ['before', 'after'])}
+    print_comparison(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'players': args.players,
+                'concurrency': args.concurrency,
+                'rounds_per_game': ROUNDS_PER_GAME,
+                'results': results,
+            }, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            stored = json.load(f)
+        baseline = stored['results']
+        if (stored.get('players'), stored.get('concurrency')) != (args.players, args.concurrency):
+            print(f"\nNote: baseline ran {stored.get('players')} players x {stored.get('concurrency')} "
+                  f"threads, this run {args.players} x {args.concurrency}")
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(f'\nRegressions vs {args.baseline}:')
+            for line in regressions:
+                print(f'  {line}')
+            sys.exit(1)
+        print(f'\nNo regressions vs {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,40 +1,235 @@
+"""資料庫結構與健康檢查 (唯讀)
+
+以 URI mode=ro 開啟資料庫，檔案不存在時直接報錯，不會建立空檔案。不做 COUNT(*)
+之類的全表掃描：列數取自 sqlite_stat1 (執行過 ANALYZE 時) 或 MAX(rowid)，頁數與
+free-list 取自 PRAGMA；另外列出索引，並以 EXPLAIN QUERY PLAN 檢查應用程式在
+record_round、end_session、results 等路徑發出的查詢，標出全表掃描。
+多 GB 的資料庫也只需要幾毫秒。
+
+    python check_tables.py                       # instance/reaction_game.db 與旁邊的分片
+    python check_tables.py path/to/kiosk.db --no-plans
+"""
+import argparse
+import glob
+import os
+import re
 import sqlite3
+import sys
+import time
+from urllib.request import pathname2url
+
+# 應用程式啟動時建立的索引；storage.py 匯入時不會載入 SQLAlchemy
+from storage import SQLITE_INDEXES
+
+DEFAULT_DATABASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'reaction_game.db')
+
+# 應用程式發出的查詢 (路徑, 說明, SQL)；參數以 NULL 代入，只取查詢計畫不執行
+_ROLLUP_SELECT = """
+    SELECT {key}, COUNT(DISTINCT gs.id), COUNT(gr.session_id), SUM(gr.reaction_time)
+    FROM game_session gs
+    LEFT JOIN game_round gr ON gr.session_id = gs.id
+    WHERE gs.id = :session_id AND gs.end_time IS NOT NULL
+    GROUP BY {key}
+"""
+APP_QUERIES = [
+    ('register', '依名稱查詢玩家',
+     "SELECT id, username, age FROM user WHERE username = :username LIMIT 1"),
+    ('record_round', '寫入回合',
+     "INSERT INTO game_round (session_id, round_number, stimulus_color, reaction_time, response_accuracy) "
+     "VALUES (:session_id, :round_number, :color, :reaction_time, :accuracy)"),
+    ('record_round', '累加會話統計',
+     "UPDATE game_session SET total_rounds = COALESCE(total_rounds, 0) + :n, "
+     "correct_responses = COALESCE(correct_responses, 0) + :correct, "
+     "reaction_time_sum = COALESCE(reaction_time_sum, 0) + :ms WHERE id = :session_id"),
+    ('end_session', '讀取會話',
+     "SELECT * FROM game_session WHERE id = :session_id"),
+    ('end_session', '寫入結束時間與平均',
+     "UPDATE game_session SET end_time = :now, average_reaction_time = CASE WHEN correct_responses > 0 "
+     "THEN CAST(COALESCE(reaction_time_sum, 0) AS REAL) / correct_responses ELSE 0.0 END "
+     "WHERE id = :session_id AND end_time IS NULL"),
+    ('end_session', 'user_stats 彙總 (SELECT 部分)', _ROLLUP_SELECT.format(key='gs.user_id')),
+    ('end_session', 'daily_stats 彙總 (SELECT 部分)', _ROLLUP_SELECT.format(key='date(gs.end_time)')),
+    ('results', '讀取會話',
+     "SELECT * FROM game_session WHERE id = :session_id"),
+    ('results', '讀取回合',
+     "SELECT * FROM game_round WHERE session_id = :session_id ORDER BY round_number"),
+    ('reaper', '找出被放棄的會話',
+     "SELECT gs.id, EXISTS (SELECT 1 FROM game_round gr WHERE gr.session_id = gs.id) "
+     "OR gs.rounds_archive IS NOT NULL FROM game_session gs "
+     "WHERE gs.end_time IS NULL AND gs.start_time < :cutoff ORDER BY gs.start_time LIMIT :limit"),
+]
+
+
+def open_readonly(path):
+    """以唯讀 URI 開啟；檔案不存在時丟出 FileNotFoundError 而不是建立空檔案"""
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f'找不到資料庫檔案: {path}')
+    return sqlite3.connect(f'file:{pathname2url(os.path.abspath(path))}?mode=ro', uri=True)
+
+
+def find_shards(path):
+    """主資料庫旁邊由 SHARD_COUNT 建立的分片檔 (reaction_game_shard*.db)"""
+    natural = lambda name: [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+    return sorted(glob.glob(os.path.join(os.path.dirname(path), 'reaction_game_shard*.db')), key=natural)
+
 
-def check_database_structure():
-    """檢查資料庫結構"""
+def file_summary(conn, path):
+    pragma = lambda name: conn.execute(f'PRAGMA {name}').fetchone()[0]
+    page_size = pragma('page_size')
+    wal = f'{path}-wal'
+    return {
+        'size': os.path.getsize(path),
+        'wal_size': os.path.getsize(wal) if os.path.exists(wal) else 0,
+        'page_size': page_size,
+        'page_count': pragma('page_count'),
+        'freelist_count': pragma('freelist_count'),
+        'journal_mode': pragma('journal_mode'),
+    }
+
+
+def approximate_rows(conn, table, stats):
+    """(列數, 來源)：sqlite_stat1 的估計值，沒有時用 MAX(rowid) (只讀 B-tree 最右邊的頁)"""
+    if table in stats:
+        return stats[table], 'sqlite_stat1'
     try:
-        conn = sqlite3.connect('reaction_game.db')
-        cursor = conn.cursor()
-        
-        # 檢查所有表格
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        
-        print("📊 資料庫中的表格:")
-        if tables:
-            for table in tables:
-                table_name = table[0]
-                print(f"   • {table_name}")
-                
-                # 檢查每個表格的結構
-                cursor.execute(f"PRAGMA table_info({table_name})")
-                columns = cursor.fetchall()
-                print(f"     欄位: {[col[1] for col in columns]}")
-                
-                # 檢查記錄數
-                cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-                count = cursor.fetchone()[0]
-                print(f"     記錄數: {count}")
-                print()
-        else:
+        last = conn.execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()[0]
+    except sqlite3.OperationalError:
+        # WITHOUT ROWID 表格
+        return None, '-'
+    return last or 0, 'max rowid'
+
+
+def read_stat1(conn):
+    """table -> 估計列數；stat 欄位的第一個數字就是表格 (或索引所屬表格) 的列數"""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+    if not exists:
+        return {}
+    stats = {}
+    for table, stat in conn.execute('SELECT tbl, stat FROM sqlite_stat1'):
+        if stat:
+            stats[table] = max(stats.get(table, 0), int(stat.split()[0]))
+    return stats
+
+
+def table_indexes(conn, table):
+    """[(索引名稱, 欄位, 是否 UNIQUE)]"""
+    indexes = []
+    for row in conn.execute(f'PRAGMA index_list("{table}")'):
+        name, unique = row[1], row[2]
+        columns = [info[2] for info in conn.execute(f'PRAGMA index_info("{name}")')]
+        indexes.append((name, columns, bool(unique)))
+    return indexes
+
+
+def query_plan(conn, sql):
+    """EXPLAIN QUERY PLAN 的每一列 (縮排, 說明)；參數一律代入 NULL"""
+    parameters = {name: None for name in re.findall(r':(\w+)', sql)}
+    rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+    depth = {0: 0}
+    plan = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, 0) + 1
+        plan.append((depth[node], detail))
+    return plan
+
+
+def is_full_scan(detail):
+    # "SCAN t" 是全表掃描，"SCAN t USING INDEX" 是整個索引掃過一遍，兩者都會隨資料量變慢
+    return detail.startswith('SCAN ') and 'CONSTANT ROW' not in detail
+
+
+def inspect(path, plans=True):
+    """印出一個資料庫檔的檢查結果；回傳發現的全表掃描數"""
+    conn = open_readonly(path)
+    try:
+        summary = file_summary(conn, path)
+        print(f"📁 {path}")
+        print(f"   檔案大小: {summary['size'] / 1048576:.1f} MB"
+              f" (WAL {summary['wal_size'] / 1048576:.1f} MB), journal_mode={summary['journal_mode']}")
+        print(f"   頁數: {summary['page_count']} x {summary['page_size']} bytes,"
+              f" free-list: {summary['freelist_count']} 頁"
+              f" ({summary['freelist_count'] / max(summary['page_count'], 1):.1%})")
+
+        tables = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+        if not tables:
             print("   資料庫是空的！")
-        
+            return 0
+
+        stats = read_stat1(conn)
+        print("\n📊 資料庫中的表格:")
+        for table in tables:
+            columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+            rows, source = approximate_rows(conn, table, stats)
+            print(f"   • {table}")
+            print(f"     欄位: {columns}")
+            print(f"     記錄數: ≈{rows} ({source})" if rows is not None else "     記錄數: 未知")
+            for name, index_columns, unique in table_indexes(conn, table):
+                print(f"     索引: {name} ({', '.join(index_columns)}){' UNIQUE' if unique else ''}")
+            if table == 'game_session' and 'rounds_archive' in columns:
+                print("     封存: 已啟用 rounds_archive (archive-sessions)")
+        if not stats:
+            print("   (沒有 sqlite_stat1，記錄數以 MAX(rowid) 估計；刪除過資料時會偏高)")
+
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        missing = [(name, table) for name, table, _, _ in SQLITE_INDEXES
+                   if table in tables and name not in existing]
+        for name, table in missing:
+            print(f"   ⚠️ 缺少索引 {name} ({table})，啟動應用程式時會自動建立")
+
+        if not plans:
+            return 0
+
+        print("\n🔍 應用程式查詢的查詢計畫:")
+        scans = 0
+        for route, label, sql in APP_QUERIES:
+            try:
+                plan = query_plan(conn, sql)
+            except sqlite3.OperationalError as e:
+                print(f"   [{route}] {label}: 略過 ({e})")
+                continue
+            flagged = [detail for _, detail in plan if is_full_scan(detail)]
+            scans += len(flagged)
+            print(f"   [{route}] {label}{'  ⚠️ 全表掃描' if flagged else ''}")
+            for level, detail in plan:
+                print(f"      {'  ' * (level - 1)}{detail}")
+            if not plan:
+                print("      (直接寫入，沒有查詢步驟)")
+        return scans
+    finally:
         conn.close()
-        return [table[0] for table in tables]
-        
-    except Exception as e:
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Read-only schema and health check of the game database')
+    parser.add_argument('database', nargs='?', default=DEFAULT_DATABASE,
+                        help='database file (default: instance/reaction_game.db next to this script)')
+    parser.add_argument('--shards', default=None, metavar='GLOB',
+                        help='shard files to inspect as well '
+                             '(default: reaction_game_shard*.db next to the database)')
+    parser.add_argument('--no-plans', action='store_true',
+                        help='skip EXPLAIN QUERY PLAN of the app queries')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.shards is not None:
+        shards = sorted(glob.glob(args.shards))
+    else:
+        shards = find_shards(args.database)
+
+    scans = 0
+    try:
+        for index, path in enumerate([args.database] + shards):
+            if index:
+                print()
+            scans += inspect(path, plans=not args.no_plans)
+    except (FileNotFoundError, sqlite3.Error) as e:
         print(f"❌ 檢查資料庫時發生錯誤: {e}")
-        return []
+        sys.exit(1)
+
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"\n⏱️ 檢查完成，耗時 {elapsed:.1f} ms" + (f"，發現 {scans} 處全表掃描" if scans else ""))
+
 
-# 執行檢查
-table_names = check_database_structure()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
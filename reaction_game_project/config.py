@@ -1,26 +1,81 @@
 import os
+from datetime import timedelta
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, '1' if default else '0') != '0'
+
 
 class Config:
-    SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-very-secret-key-here-change-in-production-12345'
+    SECRET_KEY = os.environ.get('SECRET_KEY') or 'reaction-game-secret-key-2025-very-secure'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///reaction_game.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     # 確保 session 配置
     SESSION_COOKIE_SECURE = False  # 在 HTTP 下設為 False
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
-    PERMANENT_SESSION_LIFETIME = 3600  # 1 小時
+    PERMANENT_SESSION_LIFETIME = timedelta(hours=2)
+
+    # 回合延後寫入 (group commit)；INGEST_QUEUE_SIZE 是佇列中最多的回合數，超過時改為同步寫入
+    INGEST_ASYNC = True
+    INGEST_QUEUE_SIZE = 10000
+    # /api/record_rounds 一次最多的回合數
+    INGEST_MAX_ROUNDS_PER_REQUEST = 1000
+    INGEST_BATCH_SIZE = 500
+    INGEST_FLUSH_INTERVAL = 0.005
+    # 等回合 commit 後才回應；多個 worker 行程時必須開啟 (serve.py 會設定)，
+    # 否則 end_session 落在別的行程時看不到還在佇列中的回合
+    INGEST_WAIT = _env_flag('INGEST_WAIT', False)
+
+    # SQLite 儲存設定 (WAL、PRAGMA、索引)，設 SQLITE_STORAGE_PROFILE=0 可關閉以便比較
+    SQLITE_STORAGE_PROFILE = _env_flag('SQLITE_STORAGE_PROFILE', True)
+
+    # 已結束會話的結果頁快取
+    RESULTS_CACHE_MAX_BYTES = 16 * 1024 * 1024
+    RESULTS_CACHE_MAX_AGE = 3600
+
+    # /api/stream/results：每個連線最多暫存幾筆 (讀太慢的連線會被中斷)、新連線補送的筆數、連線數上限
+    RESULTS_FEED_BUFFER = 64
+    RESULTS_FEED_REPLAY = 20
+    RESULTS_FEED_MAX_LISTENERS = 500
+    RESULTS_FEED_KEEPALIVE = 15.0
+
+    # 請求耗時拆解 (/metrics)；設定毫秒數後，超過的請求會連同 SQL 清單寫進 log
+    METRICS_ENABLED = _env_flag('METRICS_ENABLED', True)
+    METRICS_SLOW_REQUEST_MS = float(os.environ['SLOW_REQUEST_MS']) if os.environ.get('SLOW_REQUEST_MS') else None
+
+    # 反應時間名次的快照檔，啟動時讀回；未設定時放在 instance/percentiles.json
+    PERCENTILE_SNAPSHOT = os.environ.get('PERCENTILE_SNAPSHOT')
+    # 關閉時是否寫入快照 (只有處理過請求的行程會寫入)；多個 worker 時由 serve.py 的主行程統一寫入
+    PERCENTILE_SNAPSHOT_SAVE = _env_flag('PERCENTILE_SNAPSHOT_SAVE', True)
+
+    # /api/export/<kind> 需要的 Bearer token；未設定時這個 API 關閉 (404)，只能用 flask export 匯出
+    EXPORT_API_TOKEN = os.environ.get('EXPORT_API_TOKEN') or None
+
+    # flask archive-sessions 預設只封存結束超過這個時數的會話
+    ARCHIVE_AFTER_HOURS = 24
+
+    # 被放棄 (開始超過 REAPER_STALE_MINUTES 分鐘仍未結束) 的會話由背景執行緒每 REAPER_INTERVAL 秒清理一次：
+    # 有回合的結束並計入彙總，沒有回合的刪除；REAPER_ENABLED=0 或間隔 0 時只能用 flask reap-sessions
+    REAPER_ENABLED = _env_flag('REAPER_ENABLED', True)
+    REAPER_INTERVAL = int(os.environ.get('REAPER_INTERVAL') or 300)
+    REAPER_STALE_MINUTES = 120
+    REAPER_BATCH_SIZE = 200
+    # 清理時是否把結束的會話加進這個行程的名次統計；serve.py 的主行程最後以 catch_up 從資料庫補上
+    REAPER_TRACK_PERCENTILES = _env_flag('REAPER_TRACK_PERCENTILES', True)
+
+    # 依 user_id 把會話與回合分散到多個 SQLite 檔 (0 = 不分片)；啟用後不可再更改數量
+    SHARD_COUNT = int(os.environ.get('SHARD_COUNT') or 0)
+    SHARD_URI_TEMPLATE = os.environ.get('SHARD_URI_TEMPLATE') or 'sqlite:///reaction_game_shard{index}.db'
 
 class DevelopmentConfig(Config):
     DEBUG = True
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
-        'sqlite:///reaction_game.db'
 
 class ProductionConfig(Config):
     DEBUG = False
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
-        'sqlite:///reaction_game.db'
 
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
     'default': DevelopmentConfig
-}
\ No newline at end of file
+}
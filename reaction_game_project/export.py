@@ -0,0 +1,203 @@
+"""原始資料匯出：回合 (含會話與玩家欄位) 或會話，輸出 CSV / NDJSON，可選 gzip
+
+以 fetchmany 逐批讀取、產生器逐段輸出，記憶體用量與資料量無關；表頭在讀取資料庫
+之前就先送出。封存的回合 (archive.py) 逐個會話解開，與 game_round 的原始列一起匯出。
+分片時 user 只在主資料庫，玩家欄位以每批一次 IN 查詢補上。
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import DateTime, bindparam, text
+
+from archive import PackedRounds
+
+COLUMNS = {
+    'rounds': ('user_id', 'username', 'age', 'session_id', 'session_start', 'session_end',
+               'round_number', 'stimulus_color', 'reaction_time', 'response_accuracy'),
+    'sessions': ('user_id', 'username', 'age', 'session_id', 'session_start', 'session_end',
+                 'total_rounds', 'correct_responses', 'average_reaction_time'),
+}
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+# 每次 fetchmany 的列數；封存的會話一列就有整局的回合，批次小一些
+BATCH_SIZE = 5000
+ARCHIVE_BATCH_SIZE = 200
+# 玩家欄位快取的上限，超過就清空，避免匯出很多玩家時越長越大
+USER_CACHE_SIZE = 10000
+
+
+def parse_day(value):
+    """YYYY-MM-DD 轉成 date；空值回傳 None，格式錯誤時丟出 ValueError"""
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+def _session_filter(since, until, user_id):
+    """依會話開始時間 (since 到 until，含當天) 與玩家篩選的 WHERE 條件"""
+    clauses = []
+    params = {}
+    if since is not None:
+        clauses.append('gs.start_time >= :since')
+        params['since'] = datetime.combine(since, time.min)
+    if until is not None:
+        clauses.append('gs.start_time < :until')
+        params['until'] = datetime.combine(until + timedelta(days=1), time.min)
+    if user_id is not None:
+        clauses.append('gs.user_id = :user_id')
+        params['user_id'] = user_id
+    return ' AND '.join(clauses) or '1 = 1', params
+
+
+def _query(sql, params):
+    # 日期參數用與 ORM 相同的 DateTime 格式比較
+    statement = text(sql)
+    for name in ('since', 'until'):
+        if name in params:
+            statement = statement.bindparams(bindparam(name, type_=DateTime()))
+    return statement
+
+
+class _Users:
+    """user_id -> (username, age)，從主資料庫每批查一次"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._cache = {}
+        self._select = text('SELECT id, username, age FROM user WHERE id IN :ids') \
+            .bindparams(bindparam('ids', expanding=True))
+
+    def resolve(self, user_ids):
+        missing = {user_id for user_id in user_ids if user_id not in self._cache}
+        if missing:
+            if len(self._cache) + len(missing) > USER_CACHE_SIZE:
+                self._cache.clear()
+                missing = set(user_ids)
+            for user_id in missing:
+                self._cache[user_id] = (None, None)
+            for user_id, username, age in self.connection.execute(self._select, {'ids': list(missing)}):
+                self._cache[user_id] = (username, age)
+        return self._cache
+
+
+def _fetch_batches(result, size):
+    while True:
+        rows = result.fetchmany(size)
+        if not rows:
+            return
+        yield rows
+
+
+def _round_batches(connection, users, where, params):
+    """一個資料庫的回合：先是封存的會話，再來是 game_round 的原始列 (依 id)"""
+    archived = connection.execute(_query(f"""
+        SELECT gs.user_id, gs.id, gs.start_time, gs.end_time, gs.rounds_archive
+        FROM game_session gs
+        WHERE gs.rounds_archive IS NOT NULL AND {where}
+        ORDER BY gs.id
+    """, params), params)
+    for rows in _fetch_batches(archived, ARCHIVE_BATCH_SIZE):
+        players = users.resolve({row[0] for row in rows})
+        batch = []
+        for user_id, session_id, start, end, blob in rows:
+            prefix = (user_id, *players[user_id], session_id, start, end)
+            batch.extend(prefix + (r.round_number, r.stimulus_color, r.reaction_time, int(r.response_accuracy))
+                         for r in PackedRounds(blob).rounds())
+        yield batch
+
+    raw = connection.execute(_query(f"""
+        SELECT gs.user_id, gs.id, gs.start_time, gs.end_time,
+               gr.round_number, gr.stimulus_color, gr.reaction_time, gr.response_accuracy
+        FROM game_round gr
+        JOIN game_session gs ON gs.id = gr.session_id
+        WHERE {where}
+        ORDER BY gr.id
+    """, params), params)
+    for rows in _fetch_batches(raw, BATCH_SIZE):
+        players = users.resolve({row[0] for row in rows})
+        yield [(user_id, *players[user_id], session_id, start, end, number, color, ms,
+                None if correct is None else int(correct))
+               for user_id, session_id, start, end, number, color, ms, correct in rows]
+
+
+def _session_batches(connection, users, where, params):
+    result = connection.execute(_query(f"""
+        SELECT gs.user_id, gs.id, gs.start_time, gs.end_time,
+               gs.total_rounds, gs.correct_responses, gs.average_reaction_time
+        FROM game_session gs
+        WHERE {where}
+        ORDER BY gs.id
+    """, params), params)
+    for rows in _fetch_batches(result, BATCH_SIZE):
+        players = users.resolve({row[0] for row in rows})
+        yield [(user_id, *players[user_id], *rest) for user_id, *rest in rows]
+
+
+def _encode_csv(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(columns)
+    yield buffer.getvalue().encode('utf-8')
+    for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _encode_ndjson(columns, batches):
+    accuracy = columns.index('response_accuracy') if 'response_accuracy' in columns else None
+    for batch in batches:
+        lines = []
+        for row in batch:
+            record = dict(zip(columns, row))
+            if accuracy is not None and row[accuracy] is not None:
+                record['response_accuracy'] = bool(row[accuracy])
+            lines.append(json.dumps(record, ensure_ascii=False))
+        if lines:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    # gzip 檔頭在讀取資料庫之前就送出
+    yield compressor.flush(zlib.Z_SYNC_FLUSH)
+    first = True
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if first:
+            # 第一段 (CSV 表頭) 也馬上送出，之後才讓壓縮器自己累積
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            first = False
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(engines, user_engine, kind='rounds', fmt='csv', compress=False,
+                  since=None, until=None, user_id=None):
+    """產生匯出檔的內容 (bytes)
+
+    engines 是存放會話與回合的資料庫 (主資料庫加上各分片)，user_engine 是有 user 表的主資料庫。
+    連線在第一次取值時才開啟、產生器結束或關閉時歸還，每個資料庫在一個讀取交易內匯出。
+    """
+    if kind not in COLUMNS:
+        raise ValueError(f'Unknown export kind: {kind}')
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown export format: {fmt}')
+
+    columns = COLUMNS[kind]
+    where, params = _session_filter(since, until, user_id)
+    read_batches = _round_batches if kind == 'rounds' else _session_batches
+
+    def batches():
+        with user_engine.connect() as user_connection:
+            users = _Users(user_connection)
+            for engine in engines:
+                with engine.connect() as connection:
+                    yield from read_batches(connection, users, where, params)
+
+    encode = _encode_csv if fmt == 'csv' else _encode_ndjson
+    chunks = encode(columns, batches())
+    return _gzip(chunks) if compress else chunks
@@ -0,0 +1,301 @@
+"""大量測試資料產生器
+
+建立與 app 相同 schema 的 SQLite 檔，填入模擬玩家的會話與回合，
+用來在接近正式環境的資料量下測試分析腳本與各個端點：
+
+    python generate_data.py --users 100000 --output instance/synthetic.db           # 約 1000 萬回合
+    python generate_data.py --users 100000 --workers 4 --output instance/synthetic.db
+
+模擬方式與遊戲本身一致 (simple_reaction.html)：每局 15 回合、紅色刺激、800 ms 內沒點到記為
+reaction_time = 800 的失誤。每位玩家的反應時間是對數常態分布，中位數與離散程度因人而異，
+並隨遊玩次數沿學習曲線變快；另外有少量注意力不集中的失誤與搶先按的極短反應。
+
+寫入時關閉 journal 與 fsync、以 executemany 大批寫入，每批一個交易。--workers 大於 1 時
+每個行程負責一段玩家、寫到各自的暫存檔，最後以 ATTACH + INSERT ... SELECT 合併。
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import repeat
+
+import numpy as np
+
+ROUNDS_PER_SESSION = 15
+STIMULUS_COLOR = 'red'
+MISS_MS = 800
+
+# 一次產生並寫入的玩家數 (約 users_per_batch * 平均會話數 * 15 個回合)
+USERS_PER_BATCH = 2000
+
+LOAD_PRAGMAS = {
+    'journal_mode': 'OFF',
+    'synchronous': 'OFF',
+    'locking_mode': 'EXCLUSIVE',
+    'temp_store': 'MEMORY',
+    'cache_size': -262144,      # 256 MB
+}
+
+
+def create_schema(path):
+    """以 app 的模型建立表格與索引 (含 user_stats / daily_stats)"""
+    from sqlalchemy import create_engine
+
+    from app import db
+
+    engine = create_engine(f'sqlite:///{os.path.abspath(path)}')
+    db.metadata.create_all(engine)
+    engine.dispose()
+
+
+def connect_for_load(path):
+    connection = sqlite3.connect(path, isolation_level=None)
+    for name, value in LOAD_PRAGMAS.items():
+        connection.execute(f'PRAGMA {name}={value}')
+    return connection
+
+
+def _timestamps(microseconds):
+    """epoch 微秒轉成 SQLAlchemy DateTime 在 SQLite 中的字串格式"""
+    text = np.datetime_as_string(microseconds.astype('datetime64[us]'), unit='us')
+    return np.char.replace(text, 'T', ' ').tolist()
+
+
+def simulate_users(rng, first_user_id, n_users, options):
+    """產生一批玩家，回傳 (users, sessions, rounds) 三組欄位陣列；會話與回合的 id 從 1 開始"""
+    user_ids = np.arange(first_user_id, first_user_id + n_users)
+
+    # 玩家本身的特性：反應時間中位數、離散程度、學習幅度與速度、失誤傾向
+    median_ms = np.exp(rng.normal(np.log(options.median_ms), 0.18, n_users))
+    sigma = rng.uniform(0.18, 0.32, n_users)
+    learning = rng.uniform(0.05, 0.25, n_users)
+    learning_rate = rng.uniform(2.0, 10.0, n_users)
+    lapse = rng.beta(1.5, 30.0, n_users)
+
+    ages = np.clip(np.round(rng.normal(28, 9, n_users)), 10, 60)
+    age_known = rng.random(n_users) >= 0.05
+
+    sessions_per_user = rng.geometric(1.0 / options.sessions_per_user, n_users)
+    n_sessions = int(sessions_per_user.sum())
+    session_user = np.repeat(np.arange(n_users), sessions_per_user)
+    # 每位玩家的第幾次遊玩 (0 起算)
+    starts = np.cumsum(sessions_per_user) - sessions_per_user
+    play_index = np.arange(n_sessions) - np.repeat(starts, sessions_per_user)
+
+    # 第一次遊玩落在整個期間內，之後每局間隔呈指數分布 (平均 options.gap_hours 小時)
+    window_us = options.days * 86400e6
+    first_play = options.start_us + rng.random(n_users) * window_us
+    gaps = rng.exponential(options.gap_hours * 3600e6, n_sessions)
+    gaps[starts] = 0
+    offsets = np.cumsum(gaps)
+    offsets -= np.repeat(offsets[starts], sessions_per_user)
+    session_start = (first_play[session_user] + offsets).astype(np.int64)
+
+    # 學習曲線：遊玩次數越多越快，逐漸趨近 (1 - learning) 倍
+    speedup = 1.0 - learning[session_user] * (1.0 - np.exp(-play_index / learning_rate[session_user]))
+    mu = np.log(median_ms[session_user] * speedup)[:, None]
+    rt = np.exp(mu + sigma[session_user][:, None] * rng.standard_normal((n_sessions, ROUNDS_PER_SESSION)))
+    # 搶先按：少量 0~120 ms 的極短反應
+    anticipation = rng.random(rt.shape) < 0.004
+    rt[anticipation] = rng.uniform(0, 120, int(anticipation.sum()))
+    rt = np.round(rt).astype(np.int64)
+
+    # 失誤：800 ms 內沒點到，或注意力不集中 (練習後減少)
+    lapse_p = (lapse[session_user] * (0.6 + 0.4 * np.exp(-play_index / 5.0)))[:, None]
+    miss = (rt >= MISS_MS) | (rng.random(rt.shape) < lapse_p)
+    rt[miss] = MISS_MS
+    correct = ~miss
+
+    correct_count = correct.sum(axis=1)
+    rt_sum = np.where(correct, rt, 0).sum(axis=1)
+    average = np.divide(rt_sum, correct_count, out=np.zeros(n_sessions), where=correct_count > 0)
+
+    # 每局：倒數 3 秒，每回合等待 0.8~1.6 秒後出現刺激，反應之後 0.1 秒進入下一回合
+    waits = rng.uniform(0.8e6, 1.6e6, rt.shape).sum(axis=1)
+    session_end = session_start + (3e6 + waits + rt.sum(axis=1) * 1000 + ROUNDS_PER_SESSION * 1e5).astype(np.int64)
+    # 註冊時間在第一次遊玩前幾秒
+    created = (first_play - rng.uniform(2e6, 30e6, n_users)).astype(np.int64)
+
+    users = {
+        'id': user_ids,
+        'age': np.where(age_known, ages, np.nan),
+        'created_at': created,
+    }
+    sessions = {
+        'id': np.arange(1, n_sessions + 1),
+        'user_id': user_ids[session_user],
+        'start_time': session_start,
+        'end_time': session_end,
+        'correct_responses': correct_count,
+        'reaction_time_sum': rt_sum,
+        'average_reaction_time': average,
+    }
+    rounds = {
+        'session_id': np.repeat(sessions['id'], ROUNDS_PER_SESSION),
+        'round_number': np.tile(np.arange(1, ROUNDS_PER_SESSION + 1), n_sessions),
+        'reaction_time': rt.ravel(),
+        'response_accuracy': correct.ravel(),
+    }
+    return users, sessions, rounds
+
+
+def write_batch(connection, users, sessions, rounds, session_offset, round_offset):
+    """把一批玩家寫入 (一個交易)，回傳寫入的會話數與回合數"""
+    n_sessions = len(sessions['id'])
+    n_rounds = len(rounds['session_id'])
+    ages = [None if np.isnan(age) else int(age) for age in users['age']]
+
+    connection.execute('BEGIN')
+    connection.executemany(
+        'INSERT INTO user (id, username, age, created_at) VALUES (?, ?, ?, ?)',
+        zip(users['id'].tolist(), [f'user{i}' for i in users['id'].tolist()], ages,
+            _timestamps(users['created_at'])))
+    connection.executemany(
+        'INSERT INTO game_session (id, user_id, start_time, end_time, total_rounds, correct_responses,'
+        ' average_reaction_time, reaction_time_sum) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        zip((sessions['id'] + session_offset).tolist(), sessions['user_id'].tolist(),
+            _timestamps(sessions['start_time']), _timestamps(sessions['end_time']),
+            repeat(ROUNDS_PER_SESSION), sessions['correct_responses'].tolist(),
+            sessions['average_reaction_time'].tolist(), sessions['reaction_time_sum'].tolist()))
+    connection.executemany(
+        'INSERT INTO game_round (id, session_id, round_number, stimulus_color, reaction_time,'
+        ' response_accuracy) VALUES (?, ?, ?, ?, ?, ?)',
+        zip(range(round_offset + 1, round_offset + n_rounds + 1),
+            (rounds['session_id'] + session_offset).tolist(), rounds['round_number'].tolist(),
+            repeat(STIMULUS_COLOR), rounds['reaction_time'].tolist(),
+            rounds['response_accuracy'].astype(int).tolist()))
+    connection.execute('COMMIT')
+    return n_sessions, n_rounds
+
+
+def generate(path, first_user_id, n_users, options, seed):
+    """產生 n_users 位玩家寫入 path (已建立好 schema)，回傳 (會話數, 回合數)"""
+    rng = np.random.default_rng(seed)
+    connection = connect_for_load(path)
+    total_sessions = total_rounds = 0
+    try:
+        for offset in range(0, n_users, USERS_PER_BATCH):
+            batch_users = min(USERS_PER_BATCH, n_users - offset)
+            users, sessions, rounds = simulate_users(rng, first_user_id + offset, batch_users, options)
+            written = write_batch(connection, users, sessions, rounds, total_sessions, total_rounds)
+            total_sessions += written[0]
+            total_rounds += written[1]
+    finally:
+        connection.close()
+    return total_sessions, total_rounds
+
+
+def _generate_part(args):
+    path, first_user_id, n_users, options, seed = args
+    create_schema(path)
+    return generate(path, first_user_id, n_users, options, seed)
+
+
+def merge_parts(path, parts):
+    """把各行程的暫存檔依序併入 path，會話與回合的 id 往後平移"""
+    connection = connect_for_load(path)
+    try:
+        session_offset = round_offset = 0
+        for part in parts:
+            connection.execute('ATTACH DATABASE ? AS part', (part,))
+            connection.execute('BEGIN')
+            connection.execute('INSERT INTO user SELECT * FROM part.user')
+            connection.execute("""
+                INSERT INTO game_session (id, user_id, start_time, end_time, total_rounds, correct_responses,
+                                          average_reaction_time, reaction_time_sum)
+                SELECT id + ?, user_id, start_time, end_time, total_rounds, correct_responses,
+                       average_reaction_time, reaction_time_sum
+                FROM part.game_session ORDER BY id
+            """, (session_offset,))
+            connection.execute("""
+                INSERT INTO game_round (id, session_id, round_number, stimulus_color, reaction_time,
+                                        response_accuracy)
+                SELECT id + ?, session_id + ?, round_number, stimulus_color, reaction_time, response_accuracy
+                FROM part.game_round ORDER BY id
+            """, (round_offset, session_offset))
+            connection.execute('COMMIT')
+            session_offset = connection.execute('SELECT MAX(id) FROM game_session').fetchone()[0] or 0
+            round_offset = connection.execute('SELECT MAX(id) FROM game_round').fetchone()[0] or 0
+            connection.execute('DETACH DATABASE part')
+            os.remove(part)
+    finally:
+        connection.close()
+
+
+def rebuild_rollups(path):
+    """重建 user_stats / daily_stats，讓 /api/stats 與 rollup 模式的分析可以直接使用"""
+    from sqlalchemy import create_engine
+
+    from rollups import rebuild_rollups as rebuild
+
+    engine = create_engine(f'sqlite:///{os.path.abspath(path)}')
+    with engine.begin() as connection:
+        rebuild(connection, datetime.utcnow())
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fill a SQLite database with synthetic players, sessions and rounds')
+    parser.add_argument('--output', default=os.path.join('instance', 'synthetic.db'),
+                        help='SQLite file to create (default: instance/synthetic.db)')
+    parser.add_argument('--users', type=int, default=100000, help='number of players (default: 100000)')
+    parser.add_argument('--sessions-per-user', type=float, default=7.0,
+                        help='mean sessions per player, geometrically distributed (default: 7)')
+    parser.add_argument('--median-ms', type=float, default=420.0,
+                        help='population median reaction time before practice (default: 420)')
+    parser.add_argument('--start', default='2025-01-01', help='first day players can appear (YYYY-MM-DD)')
+    parser.add_argument('--days', type=float, default=180.0, help='length of the period first plays spread over')
+    parser.add_argument('--gap-hours', type=float, default=36.0, help='mean time between a player\'s sessions')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='generate in this many processes, each into its own file, then merge')
+    parser.add_argument('--no-rollups', action='store_true', help='skip rebuilding user_stats / daily_stats')
+    parser.add_argument('--overwrite', action='store_true', help='replace the output file if it exists')
+    options = parser.parse_args()
+
+    if os.path.exists(options.output):
+        if not options.overwrite:
+            parser.error(f'{options.output} already exists (use --overwrite to replace it)')
+        os.remove(options.output)
+    os.makedirs(os.path.dirname(os.path.abspath(options.output)), exist_ok=True)
+    # 與 app 相同以 UTC 記錄時間
+    start = datetime.strptime(options.start, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    options.start_us = int(start.timestamp() * 1e6)
+
+    started = time.perf_counter()
+    create_schema(options.output)
+    workers = max(1, min(options.workers, options.users))
+    seeds = np.random.SeedSequence(options.seed).spawn(workers)
+
+    if workers == 1:
+        n_sessions, n_rounds = generate(options.output, 1, options.users, options, seeds[0])
+    else:
+        bounds = np.linspace(0, options.users, workers + 1).astype(int)
+        parts = [f'{options.output}.part{i}' for i in range(workers)]
+        for part in parts:
+            if os.path.exists(part):
+                os.remove(part)
+        jobs = [(parts[i], int(bounds[i]) + 1, int(bounds[i + 1] - bounds[i]), options, seeds[i])
+                for i in range(workers)]
+        with ProcessPoolExecutor(workers) as pool:
+            counts = list(pool.map(_generate_part, jobs))
+        generated = time.perf_counter() - started
+        print(f'generated {workers} parts in {generated:.1f}s, merging', file=sys.stderr)
+        merge_parts(options.output, parts)
+        n_sessions = sum(c[0] for c in counts)
+        n_rounds = sum(c[1] for c in counts)
+
+    loaded = time.perf_counter() - started
+    print(f'{options.users} users, {n_sessions} sessions, {n_rounds} rounds in {loaded:.1f}s '
+          f'({n_rounds / loaded:,.0f} rounds/s)', file=sys.stderr)
+
+    if not options.no_rollups:
+        rebuild_rollups(options.output)
+        print(f'rebuilt rollups in {time.perf_counter() - started - loaded:.1f}s', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import Counter, defaultdict
+
+
+class _Submission:
+    """佇列中的一次送出：回合、所屬交易的 key，INGEST_WAIT 模式下呼叫端等待 commit 的 done"""
+
+    def __init__(self, rows, key, wait):
+        self.rows = rows
+        self.key = key
+        self.done = threading.Event() if wait else None
+        self.ok = False
+
+
+class RoundWriter:
+    """回合資料的延後寫入佇列
+
+    API 只需驗證資料後放進有界佇列即可回應，背景執行緒把累積的回合
+    合併成一個交易寫入 (group commit)，讓單一 SQLite writer 不必每筆都 fsync。
+    佇列以回合數計算容量 (INGEST_QUEUE_SIZE)，與 stats() 的 queue_depth 同一個單位。
+
+    batch_key(rows) 回傳一次送出的回合所屬的交易 (例如分片)，在 submit 時於呼叫端的
+    app context 內計算；同一個 key 的回合合併成一次 write_batch。合併的交易失敗時改為每次送出各自寫入，
+    一筆有問題的資料不會連帶丟掉其他會話的回合。
+
+    沒有人等待結果的送出 (INGEST_WAIT 關閉) 寫入失敗時，呼叫端早已回應成功，
+    所以依會話記下失敗的回合數 (failed_rounds)，end_session 據此拒絕結束缺少回合的會話。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.write_batch = None
+        self.batch_key = lambda rows: None
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._atexit_registered = False
+        self._lock = threading.Lock()
+        self._pending_rows = 0
+        # session_id -> 寫入失敗且沒有通知到呼叫端的回合數
+        self._failed = Counter()
+        self._stats = {
+            'batches': 0,
+            'rows_written': 0,
+            'rows_failed': 0,
+            'overflow_writes': 0,
+            'last_batch_size': 0,
+            'max_batch_size': 0,
+            'last_commit_ms': 0.0,
+            'max_commit_ms': 0.0,
+            'total_commit_ms': 0.0,
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, write_batch=None, batch_key=None):
+        app.config.setdefault('INGEST_ASYNC', True)
+        app.config.setdefault('INGEST_QUEUE_SIZE', 10000)
+        app.config.setdefault('INGEST_BATCH_SIZE', 500)
+        app.config.setdefault('INGEST_FLUSH_INTERVAL', 0.005)
+        app.config.setdefault('INGEST_FLUSH_TIMEOUT', 5.0)
+        app.config.setdefault('INGEST_WAIT', False)
+        app.config.setdefault('INGEST_MAX_ROUNDS_PER_REQUEST', 1000)
+        self.app = app
+        if write_batch is not None:
+            self.write_batch = write_batch
+        if batch_key is not None:
+            self.batch_key = batch_key
+        app.extensions['round_writer'] = self
+
+    @property
+    def enabled(self):
+        return self.app.config['INGEST_ASYNC']
+
+    def _ensure_started(self):
+        # 在 fork 之後的子行程裡需要重新建立佇列與執行緒
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            # 容量由 _pending_rows 以回合數控制，佇列本身不設上限
+            self._queue = queue.Queue()
+            self._pending_rows = 0
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='round-writer', daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def submit(self, rows):
+        """把一組回合 (同一個會話、已驗證) 放進佇列；佇列中的回合數會超過容量時改為在呼叫端同步寫入
+
+        回傳 True 表示資料還在佇列中。INGEST_WAIT 開啟時 (多個 worker 行程，
+        end_session 可能落在別的行程) 會等到這批回合 commit 後才回傳 False，
+        同一行程內同時送來的回合仍會合併成一個交易。
+        """
+        if not rows:
+            return True
+        if not self.enabled:
+            self._write(rows)
+            return False
+
+        self._ensure_started()
+        wait = self.app.config['INGEST_WAIT']
+        item = _Submission(list(rows), self.batch_key(rows), wait)
+        with self._lock:
+            full = self._pending_rows + len(rows) > self.app.config['INGEST_QUEUE_SIZE']
+            if full:
+                self._stats['overflow_writes'] += 1
+            else:
+                self._pending_rows += len(rows)
+        if full:
+            self._write(rows)
+            return False
+        self._queue.put(item)
+        if not wait:
+            return True
+
+        if not item.done.wait(self.app.config['INGEST_FLUSH_TIMEOUT']):
+            raise RuntimeError('Timed out waiting for rounds to be written')
+        if not item.ok:
+            raise RuntimeError('Failed to write rounds')
+        return False
+
+    def flush(self, timeout=None):
+        """等待呼叫前已放入佇列的回合全部寫入，逾時回傳 False"""
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return True
+        if timeout is None:
+            timeout = self.app.config['INGEST_FLUSH_TIMEOUT']
+
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def stop(self, timeout=5.0):
+        """寫完剩餘的回合後停止背景執行緒"""
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def failed_rounds(self, session_id):
+        """這個會話在背景寫入時失敗、呼叫端不知道的回合數"""
+        with self._lock:
+            return self._failed.get(session_id, 0)
+
+    def forget(self, session_id):
+        """會話已處理完 (例如被清理程式結束)，不再保留它的失敗紀錄"""
+        with self._lock:
+            self._failed.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['queue_depth'] = self._pending_rows
+            stats['sessions_with_failures'] = len(self._failed)
+        stats['queue_capacity'] = self.app.config['INGEST_QUEUE_SIZE']
+        stats['batch_size_limit'] = self.app.config['INGEST_BATCH_SIZE']
+        stats['running'] = self._thread is not None and self._thread.is_alive()
+        if stats['batches']:
+            stats['avg_batch_size'] = stats['rows_written'] / stats['batches']
+            stats['avg_commit_ms'] = stats['total_commit_ms'] / stats['batches']
+        else:
+            stats['avg_batch_size'] = 0
+            stats['avg_commit_ms'] = 0.0
+        return stats
+
+    def _write(self, rows):
+        with self.app.app_context():
+            self.write_batch(rows)
+
+    def _run(self):
+        batch_limit = self.app.config['INGEST_BATCH_SIZE']
+        interval = self.app.config['INGEST_FLUSH_INTERVAL']
+        stopping = False
+
+        while not stopping:
+            item = self._queue.get()
+            # 每次送出各自保留，失敗時才能分開重寫
+            submissions = []
+            collected = 0
+            waiters = []
+            deadline = time.monotonic() + interval
+
+            # 收集到批次上限、flush 要求或時間到為止
+            while True:
+                if item is None:
+                    stopping = True
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                submissions.append(item)
+                collected += len(item.rows)
+                if collected >= batch_limit:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            groups = defaultdict(list)
+            for submission in submissions:
+                groups[submission.key].append(submission)
+            for group in groups.values():
+                self._commit(group)
+            for waiter in waiters:
+                waiter.set()
+
+    def _commit(self, submissions):
+        """把同一個交易的多次送出合併寫入；失敗時改為每次送出各自寫入"""
+        rows = [row for submission in submissions for row in submission.rows]
+        if self._write_timed(rows):
+            results = [True] * len(submissions)
+        elif len(submissions) == 1:
+            results = [False]
+        else:
+            self.app.logger.warning('改為逐次寫入 %d 次送出的回合', len(submissions))
+            results = [self._write_timed(submission.rows) for submission in submissions]
+
+        with self._lock:
+            self._pending_rows -= len(rows)
+            for submission, ok in zip(submissions, results):
+                if ok:
+                    continue
+                self._stats['rows_failed'] += len(submission.rows)
+                # 等待中的呼叫端會收到錯誤並自行重送，只記下無從得知的失敗
+                if submission.done is None:
+                    self._failed.update(row['session_id'] for row in submission.rows)
+        for submission, ok in zip(submissions, results):
+            submission.ok = ok
+            if submission.done is not None:
+                submission.done.set()
+
+    def _write_timed(self, rows):
+        """寫入一個交易並記錄批次統計；失敗時記下例外並回傳 False"""
+        started = time.perf_counter()
+        try:
+            self._write(rows)
+        except Exception:
+            self.app.logger.exception('回合資料交易失敗 (%d 筆)', len(rows))
+            return False
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['rows_written'] += len(rows)
+            self._stats['last_batch_size'] = len(rows)
+            self._stats['max_batch_size'] = max(self._stats['max_batch_size'], len(rows))
+            self._stats['last_commit_ms'] = elapsed_ms
+            self._stats['max_commit_ms'] = max(self._stats['max_commit_ms'], elapsed_ms)
+            self._stats['total_commit_ms'] += elapsed_ms
+        return True
@@ -0,0 +1,284 @@
+import threading
+import time
+from collections import defaultdict
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+
+# 延遲直方圖的上界 (秒)，與 Prometheus client 的預設值相同
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 不在請求之內 (延後寫入佇列、啟動時的初始化) 的 SQL 與 commit 記在這組標籤
+BACKGROUND = ('-', 'background')
+
+
+class Histogram:
+    """固定上界的累積直方圖 (Prometheus histogram)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels.items()) + '}'
+
+
+class _Timer:
+    """把巢狀的開始時間放在堆疊上 (同一條連線上的 cursor 或同一個請求中的樣板)"""
+
+    @staticmethod
+    def push(stack):
+        stack.append(time.perf_counter())
+
+    @staticmethod
+    def pop(stack):
+        return time.perf_counter() - stack.pop() if stack else 0.0
+
+
+class RequestMetrics:
+    """每個請求的耗時拆解與 /metrics 輸出
+
+    - 每個端點的延遲直方圖 (含 session cookie 的寫入)
+    - 每個請求執行的 SQL 數與時間 (cursor 事件)、commit 數
+    - 樣板渲染時間與 session cookie 序列化時間
+    背景執行緒 (延後寫入佇列) 的 SQL 另外記在 endpoint="background"。
+    設定 METRICS_SLOW_REQUEST_MS 後，超過的請求會連同 SQL 清單寫進 log。
+    """
+
+    def __init__(self, app=None, engine=None):
+        self._lock = threading.Lock()
+        self._gauges = []
+        self.reset()
+        if app is not None:
+            self.init_app(app, engine)
+
+    def reset(self):
+        with self._lock:
+            self.latency = defaultdict(Histogram)
+            self.requests = defaultdict(int)
+            self.sql_statements = defaultdict(int)
+            self.sql_seconds = defaultdict(float)
+            self.commits = defaultdict(int)
+            self.template_seconds = defaultdict(float)
+            self.session_seconds = defaultdict(float)
+
+    def init_app(self, app, engine):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_SLOW_REQUEST_MS', None)
+        app.config.setdefault('METRICS_SLOW_QUERY_LIMIT', 50)
+        self.app = app
+        app.extensions['request_metrics'] = self
+
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.session_interface = _TimedSessionInterface(app.session_interface)
+        self.watch_engine(engine)
+
+    def watch_engine(self, engine):
+        """量測這個引擎的 SQL 與 commit；分片時每個分片引擎都要登記"""
+        if not self.app.config['METRICS_ENABLED']:
+            return
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+        event.listen(engine, 'commit', self._on_commit)
+
+    def add_gauge(self, name, help_text, collect):
+        """登記一組外部數值，collect() 回傳 {label 值: 數值} 或單一數值"""
+        self._gauges.append((name, help_text, collect))
+
+    # 請求
+
+    def _before_request(self):
+        g._metrics = {
+            'start': time.perf_counter(),
+            'sql_count': 0,
+            'sql_seconds': 0.0,
+            'commits': 0,
+            'template_seconds': 0.0,
+            'template_stack': [],
+            'session_seconds': 0.0,
+            'queries': [] if self.app.config['METRICS_SLOW_REQUEST_MS'] is not None else None,
+            'status': 500,
+        }
+
+    def _after_request(self, response):
+        state = g.get('_metrics')
+        if state is not None:
+            state['status'] = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        # teardown 在 session cookie 寫入之後才執行，耗時包含整個請求
+        state = g.pop('_metrics', None)
+        if state is None:
+            return
+        elapsed = time.perf_counter() - state['start']
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        key = (request.method, endpoint)
+
+        with self._lock:
+            self.latency[key].observe(elapsed)
+            self.requests[key + (state['status'],)] += 1
+            self.sql_statements[key] += state['sql_count']
+            self.sql_seconds[key] += state['sql_seconds']
+            self.commits[key] += state['commits']
+            self.template_seconds[key] += state['template_seconds']
+            self.session_seconds[key] += state['session_seconds']
+
+        threshold = self.app.config['METRICS_SLOW_REQUEST_MS']
+        if threshold is not None and elapsed * 1000 >= threshold:
+            self._log_slow_request(key, state, elapsed)
+
+    def _log_slow_request(self, key, state, elapsed):
+        lines = [f'slow request {key[0]} {key[1]} {state["status"]}: {elapsed * 1000:.1f} ms total, '
+                 f'{state["sql_count"]} SQL in {state["sql_seconds"] * 1000:.1f} ms, '
+                 f'{state["commits"]} commits, template {state["template_seconds"] * 1000:.1f} ms, '
+                 f'session {state["session_seconds"] * 1000:.1f} ms']
+        for ms, statement in state['queries']:
+            lines.append(f'  {ms:8.2f} ms  {" ".join(statement.split())[:200]}')
+        self.app.logger.warning('\n'.join(lines))
+
+    # 樣板
+
+    def _before_render(self, sender, template, context, **extra):
+        state = g.get('_metrics') if has_request_context() else None
+        if state is not None:
+            _Timer.push(state['template_stack'])
+
+    def _after_render(self, sender, template, context, **extra):
+        state = g.get('_metrics') if has_request_context() else None
+        if state is not None:
+            state['template_seconds'] += _Timer.pop(state['template_stack'])
+
+    # SQL
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        _Timer.push(conn.info.setdefault('_metrics_start', []))
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = _Timer.pop(conn.info.get('_metrics_start', []))
+        self._record_sql(statement, elapsed)
+
+    def _handle_error(self, exception_context):
+        # 失敗的語句不會觸發 after_cursor_execute，仍要把開始時間取出
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('_metrics_start'):
+            self._record_sql(exception_context.statement or '', _Timer.pop(connection.info['_metrics_start']))
+
+    def _record_sql(self, statement, elapsed):
+        state = g.get('_metrics') if has_request_context() else None
+        if state is None:
+            with self._lock:
+                self.sql_statements[BACKGROUND] += 1
+                self.sql_seconds[BACKGROUND] += elapsed
+            return
+
+        state['sql_count'] += 1
+        state['sql_seconds'] += elapsed
+        queries = state['queries']
+        if queries is not None and len(queries) < self.app.config['METRICS_SLOW_QUERY_LIMIT']:
+            queries.append((elapsed * 1000, statement))
+
+    def _on_commit(self, conn):
+        state = g.get('_metrics') if has_request_context() else None
+        if state is not None:
+            state['commits'] += 1
+        else:
+            with self._lock:
+                self.commits[BACKGROUND] += 1
+
+    # 輸出
+
+    def render(self):
+        """Prometheus text exposition format (0.0.4)"""
+        out = []
+
+        def header(name, kind, help_text):
+            out.append(f'# HELP {name} {help_text}')
+            out.append(f'# TYPE {name} {kind}')
+
+        with self._lock:
+            header('app_request_duration_seconds', 'histogram',
+                   'Request latency per endpoint, including the session cookie')
+            for (method, endpoint), histogram in sorted(self.latency.items()):
+                for bound, count in histogram.cumulative():
+                    out.append('app_request_duration_seconds_bucket'
+                               f'{_labels(method=method, endpoint=endpoint, le=bound)} {count}')
+                out.append('app_request_duration_seconds_bucket'
+                           f'{_labels(method=method, endpoint=endpoint, le="+Inf")} {histogram.count}')
+                out.append(f'app_request_duration_seconds_sum{_labels(method=method, endpoint=endpoint)} '
+                           f'{histogram.sum:.6f}')
+                out.append(f'app_request_duration_seconds_count{_labels(method=method, endpoint=endpoint)} '
+                           f'{histogram.count}')
+
+            header('app_requests_total', 'counter', 'Requests per endpoint and status code')
+            for (method, endpoint, status), count in sorted(self.requests.items()):
+                out.append(f'app_requests_total{_labels(method=method, endpoint=endpoint, status=status)} {count}')
+
+            for name, kind, help_text, values, fmt in (
+                    ('app_sql_statements_total', 'counter', 'SQL statements executed', self.sql_statements, '{}'),
+                    ('app_sql_seconds_total', 'counter', 'Time spent executing SQL', self.sql_seconds, '{:.6f}'),
+                    ('app_db_commits_total', 'counter', 'Database commits', self.commits, '{}'),
+                    ('app_template_seconds_total', 'counter', 'Time spent rendering templates',
+                     self.template_seconds, '{:.6f}'),
+                    ('app_session_save_seconds_total', 'counter', 'Time spent writing the session cookie',
+                     self.session_seconds, '{:.6f}')):
+                header(name, kind, help_text)
+                for (method, endpoint), value in sorted(values.items()):
+                    out.append(f'{name}{_labels(method=method, endpoint=endpoint)} {fmt.format(value)}')
+
+        for name, help_text, collect in self._gauges:
+            header(name, 'gauge', help_text)
+            values = collect()
+            if isinstance(values, dict):
+                for label, value in sorted(values.items()):
+                    out.append(f'{name}{_labels(name=label)} {float(value):g}')
+            else:
+                out.append(f'{name} {float(values):g}')
+
+        return '\n'.join(out) + '\n'
+
+
+class _TimedSessionInterface:
+    """包住原本的 session interface，量測寫入 session cookie 的時間"""
+
+    def __init__(self, wrapped):
+        self._wrapped = wrapped
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+    def save_session(self, app, session, response):
+        started = time.perf_counter()
+        try:
+            return self._wrapped.save_session(app, session, response)
+        finally:
+            state = g.get('_metrics')
+            if state is not None:
+                state['session_seconds'] += time.perf_counter() - started
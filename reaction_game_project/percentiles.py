@@ -0,0 +1,238 @@
+import json
+import os
+import threading
+from collections import Counter
+
+from archive import iter_archives
+
+
+class ReactionHistogram:
+    """以 1 ms 為一格的反應時間分佈
+
+    反應時間是有上限的整數毫秒，固定格數的直方圖就能精確表示整個族群，
+    記憶體與玩家數無關。搭配 Fenwick tree，插入與名次查詢都是 O(log n)。
+    超過 max_ms 的值都放進最後一格。
+    """
+
+    def __init__(self, max_ms=2000):
+        self.max_ms = max_ms
+        self.size = max_ms + 1
+        self.counts = [0] * self.size
+        self.tree = [0] * (self.size + 1)
+        self.total = 0
+
+    def _bin(self, ms):
+        return min(max(int(round(ms)), 0), self.max_ms)
+
+    def add(self, ms, count=1):
+        index = self._bin(ms)
+        self.counts[index] += count
+        self.total += count
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += count
+            i += i & -i
+
+    def count_below(self, ms):
+        """小於 ms 這一格的樣本數"""
+        i = self._bin(ms)
+        result = 0
+        while i > 0:
+            result += self.tree[i]
+            i -= i & -i
+        return result
+
+    def rank(self, ms):
+        """比 ms 慢的樣本所佔百分比 (同分算一半)，也就是「你比幾 % 的人快」"""
+        if not self.total:
+            return None
+        below = self.count_below(ms)
+        equal = self.counts[self._bin(ms)]
+        slower = self.total - below - equal
+        return (slower + equal / 2) / self.total * 100
+
+    def quantile(self, q):
+        """第 q 分位數 (0~1) 所在的毫秒格"""
+        if not self.total:
+            return None
+        target = max(1, int(round(q * self.total)))
+        position = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            nxt = position + step
+            if nxt <= self.size and self.tree[nxt] < target:
+                position = nxt
+                target -= self.tree[nxt]
+            step >>= 1
+        return position
+
+    def copy(self):
+        histogram = ReactionHistogram(self.max_ms)
+        histogram.counts = list(self.counts)
+        histogram.tree = list(self.tree)
+        histogram.total = self.total
+        return histogram
+
+    def to_dict(self):
+        # 只存非零的格子
+        return {
+            'max_ms': self.max_ms,
+            'counts': {str(i): c for i, c in enumerate(self.counts) if c},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data['max_ms'])
+        for index, count in data['counts'].items():
+            histogram.add(int(index), count)
+        return histogram
+
+
+class PercentileService:
+    """全體玩家的反應時間名次
+
+    session：已結束會話的平均反應時間；round：所有成功回合的反應時間。
+    啟動時讀取上次關閉時存下的快照，再從資料庫補上之後新增的資料。
+    每個行程各自維護一份，只會看到自己寫入的增量，直到下次重建。
+
+    histograms 是查詢用的完整分佈；snapshot 只含 load/catch_up 讀到水位線為止的資料，
+    save() 存的是這一份。行程內直接加入的增量不在快照裡 (別的行程寫入的 id 可能與它們交錯，
+    無法用水位線表示)，下次啟動時由 catch_up 從資料庫讀回。
+    """
+
+    KINDS = ('session', 'round')
+
+    def __init__(self, max_ms=2000):
+        self.max_ms = max_ms
+        self._lock = threading.Lock()
+        self._reset()
+
+    def init_app(self, app):
+        app.extensions['percentile_service'] = self
+
+    def _reset(self):
+        self.histograms = {kind: ReactionHistogram(self.max_ms) for kind in self.KINDS}
+        self.snapshot = {kind: ReactionHistogram(self.max_ms) for kind in self.KINDS}
+        # 每個資料庫 (分片) 的 snapshot 涵蓋到的最後一筆資料：game_session.end_time 與 game_round.id
+        self.watermarks = {}
+
+    def add_session(self, average_reaction_time):
+        if average_reaction_time:
+            with self._lock:
+                self.histograms['session'].add(average_reaction_time)
+
+    def add_rounds(self, rows):
+        times = [r['reaction_time'] for r in rows if r['response_accuracy']]
+        if times:
+            with self._lock:
+                histogram = self.histograms['round']
+                for ms in times:
+                    histogram.add(ms)
+
+    def rank(self, ms, kind='session'):
+        with self._lock:
+            histogram = self.histograms[kind]
+            return histogram.rank(ms), histogram.total
+
+    def quantile(self, q, kind='session'):
+        with self._lock:
+            return self.histograms[kind].quantile(q)
+
+    def catch_up(self, connection, key='default'):
+        """從資料庫併入水位線之後的會話與回合 (GROUP BY，只回傳每毫秒一列)
+
+        key 區分不同的資料庫檔 (分片)，各自有一組水位線。
+        """
+        # 先取新的水位線，再只讀兩條水位線之間的資料，避免漏掉查詢期間寫入的列
+        session_watermark = connection.exec_driver_sql(
+            'SELECT MAX(end_time) FROM game_session').scalar()
+        round_watermark = connection.exec_driver_sql(
+            'SELECT MAX(id) FROM game_round').scalar() or 0
+        previous = self.watermarks.get(key, {})
+
+        session_rows = []
+        if session_watermark is not None:
+            session_rows = connection.exec_driver_sql("""
+                SELECT CAST(ROUND(average_reaction_time) AS INTEGER) AS ms, COUNT(*)
+                FROM game_session
+                WHERE end_time IS NOT NULL AND correct_responses > 0
+                  AND end_time > ? AND end_time <= ?
+                GROUP BY ms
+            """, (previous.get('session') or '', session_watermark)).fetchall()
+
+        round_rows = connection.exec_driver_sql("""
+            SELECT reaction_time, COUNT(*) FROM game_round
+            WHERE response_accuracy AND reaction_time IS NOT NULL
+              AND id > ? AND id <= ?
+            GROUP BY reaction_time
+        """, (previous.get('round') or 0, round_watermark)).fetchall()
+
+        # 已封存的回合不在 game_round 裡，要從封存解開：id 在兩條水位線之間的回合同樣要併入，
+        # 否則快照之後寫入、下次啟動前就被 archive-sessions 搬進封存的回合會永遠漏掉。
+        # 沒有 id 的版本 1 封存只在第一次讀這個資料庫時整個併入
+        after = previous.get('round') or 0
+        archived = Counter()
+        for _, packed in iter_archives(connection, after_round_id=after or None):
+            keep = packed.response_accuracy & ~packed.reaction_time_null
+            if packed.round_ids is not None:
+                keep &= (packed.round_ids > after) & (packed.round_ids <= round_watermark)
+            archived.update(packed.reaction_time[keep].tolist())
+        round_rows = round_rows + sorted(archived.items())
+
+        with self._lock:
+            for histograms in (self.histograms, self.snapshot):
+                for ms, count in session_rows:
+                    histograms['session'].add(ms, count)
+                for ms, count in round_rows:
+                    histograms['round'].add(ms, count)
+            watermark = self.watermarks.setdefault(key, {'session': None, 'round': 0})
+            if session_watermark is not None:
+                watermark['session'] = session_watermark
+            watermark['round'] = max(watermark['round'] or 0, round_watermark)
+
+    def rebuild(self, connections):
+        """connections：{key: connection}"""
+        with self._lock:
+            self._reset()
+        for key, connection in connections.items():
+            self.catch_up(connection, key)
+
+    def load(self, path):
+        """讀取快照；檔案不存在或格式不符時回傳 False"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            histograms = {kind: ReactionHistogram.from_dict(data['histograms'][kind])
+                          for kind in self.KINDS}
+        except (OSError, ValueError, KeyError):
+            return False
+
+        watermarks = data.get('watermarks')
+        if watermarks is None:
+            # 分片之前的快照格式：只有主資料庫一組水位線
+            watermarks = {'default': {'session': data.get('session_watermark'),
+                                      'round': data.get('round_watermark') or 0}}
+
+        with self._lock:
+            self.histograms = histograms
+            self.snapshot = {kind: h.copy() for kind, h in histograms.items()}
+            self.watermarks = watermarks
+        return True
+
+    def save(self, path):
+        """存下 snapshot 與它涵蓋到的水位線 (load/catch_up 讀到的位置)
+
+        不含這個行程直接加入的增量，所以沒看過的資料不會被水位線跳過；
+        要把目前資料庫的內容都存進快照，先對每個資料庫呼叫 catch_up。
+        """
+        with self._lock:
+            data = {
+                'watermarks': {key: dict(watermark) for key, watermark in self.watermarks.items()},
+                'histograms': {kind: h.to_dict() for kind, h in self.snapshot.items()},
+            }
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
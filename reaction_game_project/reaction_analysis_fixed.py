@@ -1,30 +1,31 @@
+"""Reaction time analysis report: charts plus a printed statistics report
+
+    python reaction_analysis_fixed.py                     # interactive charts (pandas mode)
+    python reaction_analysis_fixed.py --output-dir report  # headless PNG/SVG/HTML files
+    python reaction_analysis_fixed.py --text               # printed report only, stdlib sqlite3
+
+NumPy, pandas, matplotlib and seaborn are imported where they are first needed,
+so --text and --help start without them. The functions can also be imported
+and called from other code; main() is the command line entry point.
+"""
+import argparse
+import glob
+import os
 import sqlite3
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from datetime import datetime
+import sys
+import time
 import warnings
-import os
+from contextlib import contextmanager
 warnings.filterwarnings('ignore')
 
-# Use default English fonts
-plt.rcParams['font.family'] = 'sans-serif'
-plt.rcParams['font.sans-serif'] = ['Arial', 'Helvetica', 'DejaVu Sans']
-plt.rcParams['font.size'] = 12
-plt.rcParams['axes.unicode_minus'] = False
-plt.rcParams['axes.titlesize'] = 16
-plt.rcParams['axes.labelsize'] = 13
-plt.rcParams['xtick.labelsize'] = 11
-plt.rcParams['ytick.labelsize'] = 11
-plt.rcParams['legend.fontsize'] = 11
-
-# Set seaborn style
-sns.set_style("whitegrid")
-sns.set_palette("husl")
-
-def check_and_load_data():
-    """Check database structure and load data"""
+from analysis_parallel import ROLLUP_TABLES, expand_databases, find_tables, map_reduce, natural_key
+from analysis_report import report_lines, text_aggregates
+
+IMAGE_FORMATS = ('png', 'svg')
+REPORT_FORMATS = IMAGE_FORMATS + ('html',)
+
+def find_database():
+    """Return the first database path that exists"""
     # Database paths
     db_paths = [
         '/Users/yangt-ccu/Desktop/reaction_game_project/instance/reaction_game.db',
@@ -33,77 +34,292 @@ def check_and_load_data():
         'reaction_game.db'
     ]
     
-    db_path = None
     for path in db_paths:
         if os.path.exists(path):
-            db_path = path
-            break
+            return path
+    return None
+
+def find_shards(db_path, pattern=None):
+    """Shard files written by the app when SHARD_COUNT is set, next to the main database"""
+    if pattern is None:
+        pattern = os.path.join(os.path.dirname(db_path), 'reaction_game_shard*.db')
+    return sorted(glob.glob(pattern), key=natural_key)
+
+def connect_shard(shard_path, db_path):
+    """Open a shard with the main database attached as `directory` (the user table lives there)"""
+    conn = sqlite3.connect(shard_path)
+    conn.execute("ATTACH DATABASE ? AS directory", (db_path,))
+    return conn
+
+def scatter_gather(conn, db_path, shard_paths, detected, aggregate, binned=False):
+    """Run aggregate() on the main database and on every shard, then merge the partials
+
+    aggregate(conn, user_table, session_table, round_table, active_users_only)
+    must return an aggregates dict; without shards it runs once on conn.
+    """
+    from analysis_aggregates import merge_aggregates
+    
+    user_table, session_table, round_table = detected
+    if not shard_paths:
+        return aggregate(conn, user_table, session_table, round_table, True)
+    
+    partials = [aggregate(conn, user_table, session_table, round_table, False)]
+    for shard_path in shard_paths:
+        shard_conn = connect_shard(shard_path, db_path)
+        try:
+            partials.append(aggregate(shard_conn, f'directory.{user_table}', session_table, round_table, False))
+        finally:
+            shard_conn.close()
+    
+    print(f"Merged partial aggregates from {len(partials)} databases")
+    return merge_aggregates(partials, n_users=partials[0]['totals']['users'], binned=binned)
+
+def detect_tables(conn):
+    """Find the user, session and round tables; None when the database is empty"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+    tables = [table[0] for table in cursor.fetchall()]
+    
+    print(f"Found tables: {tables}")
+    
+    if not tables:
+        print("Database is empty!")
+        return None
+    
+    user_table, session_table, round_table = find_tables(conn)
+    
+    print(f"Detected tables:")
+    print(f"   User table: {user_table}")
+    print(f"   Session table: {session_table}")
+    print(f"   Round table: {round_table}")
+    
+    return user_table, session_table, round_table
+
+def needs_raw_tables(mode_name):
+    """Table check for the modes that read game_round: user, session and round tables must all exist"""
+    def check(conn, detected):
+        if not all(detected):
+            return f"{mode_name} mode needs the user, session and round tables"
+        return None
+    return check
+
+def needs_rollup_tables(conn, detected):
+    """Table check for rollup mode: the user table plus the user_stats/daily_stats rollups"""
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    if not detected[0] or not ROLLUP_TABLES <= tables:
+        return "Rollup mode needs the user_stats and daily_stats tables (run: flask rebuild-rollups)"
+    return None
+
+def aggregate_database(aggregate, check_tables, shard_pattern=None, binned=False):
+    """Find the database and its shards, check the tables and scatter_gather() aggregate over them
+
+    check_tables(conn, detected) returns an error message when the mode cannot run on this
+    database, else None. Returns None when there is nothing to analyse.
+    """
+    db_path = find_database()
+    if not db_path:
+        print("Database file not found")
+        return None
+    
+    print(f"Using database path: {db_path}")
+    shard_paths = find_shards(db_path, shard_pattern)
+    if shard_paths:
+        print(f"Found {len(shard_paths)} shard databases")
+    
+    conn = sqlite3.connect(db_path)
+    
+    try:
+        detected = detect_tables(conn)
+        if detected is None:
+            return None
+        error = check_tables(conn, detected)
+        if error:
+            print(error)
+            return None
+        return scatter_gather(conn, db_path, shard_paths, detected, aggregate, binned)
+    
+    finally:
+        conn.close()
+
+def check_and_aggregate_in_sql(shard_pattern=None):
+    """Run every aggregation inside SQLite; returns None when there is nothing to analyse"""
+    from analysis_aggregates import sql_aggregates, with_archived_rounds
+    
+    aggregates = aggregate_database(
+        lambda conn, user_table, session_table, round_table, active: sql_aggregates(
+            conn, user_table, session_table, with_archived_rounds(conn, session_table, round_table), active),
+        needs_raw_tables('SQL'), shard_pattern)
+    if aggregates is not None:
+        print(f"Aggregated {aggregates['totals']['rounds']} rounds in SQLite")
+    return aggregates
+
+def check_and_stream_data(chunk_size=50000, shard_pattern=None):
+    """Stream game_round in chunks into online accumulators; returns None when there is nothing to analyse"""
+    from analysis_aggregates import stream_aggregates
+    
+    aggregates = aggregate_database(
+        lambda conn, user_table, session_table, round_table, active: stream_aggregates(
+            conn, user_table, session_table, round_table, chunk_size, active),
+        needs_raw_tables('Stream'), shard_pattern)
+    if aggregates is not None:
+        print(f"Streamed {aggregates['totals']['rounds']} rounds in chunks of {chunk_size}")
+    return aggregates
+
+def check_and_read_rollups(shard_pattern=None):
+    """Read the user_stats/daily_stats rollups maintained by the app; returns None when unavailable"""
+    from analysis_aggregates import rollup_aggregates
+    
+    aggregates = aggregate_database(
+        lambda conn, user_table, session_table, round_table, active: rollup_aggregates(conn, user_table, active),
+        needs_rollup_tables, shard_pattern, binned=True)
+    if aggregates is not None:
+        print(f"Read rollups covering {aggregates['totals']['sessions']} finished sessions")
+    return aggregates
+
+def check_and_map_reduce(patterns, mode='sql', chunk_size=50000, processes=None):
+    """Aggregate several database files in a process pool and merge them; returns None on error"""
+    try:
+        paths = expand_databases(patterns)
+    except FileNotFoundError as e:
+        print(e)
+        return None
+    
+    print(f"Analysing {len(paths)} databases:")
+    for path in paths:
+        print(f"   {path}")
+    
+    try:
+        aggregates = map_reduce(paths, mode, chunk_size, processes)
+    except (ValueError, sqlite3.Error) as e:
+        print(f"Error: {e}")
+        return None
+    
+    print(f"Merged partial aggregates from {len(paths)} databases "
+          f"({aggregates['totals']['rounds']} rounds, {aggregates['totals']['users']} users by username)")
+    return aggregates
+
+def read_session_frames(conn, user_table, session_table, round_table):
+    """Load the session and round tables joined with the user table"""
+    import pandas as pd
+    
+    sessions_df = pd.DataFrame()
+    rounds_df = pd.DataFrame()
+    
+    if session_table:
+        if user_table:
+            sessions_df = pd.read_sql_query(f"""
+                SELECT gs.*, u.username, u.age 
+                FROM {session_table} gs 
+                LEFT JOIN {user_table} u ON gs.user_id = u.id
+            """, conn)
+        else:
+            sessions_df = pd.read_sql_query(f"SELECT * FROM {session_table}", conn)
+    
+    if round_table:
+        if session_table and user_table:
+            rounds_df = pd.read_sql_query(f"""
+                SELECT gr.*, gs.user_id, u.username
+                FROM {round_table} gr
+                LEFT JOIN {session_table} gs ON gr.session_id = gs.id
+                LEFT JOIN {user_table} u ON gs.user_id = u.id
+            """, conn)
+        elif session_table:
+            rounds_df = pd.read_sql_query(f"""
+                SELECT gr.*, gs.user_id
+                FROM {round_table} gr
+                LEFT JOIN {session_table} gs ON gr.session_id = gs.id
+            """, conn)
+        else:
+            rounds_df = pd.read_sql_query(f"SELECT * FROM {round_table}", conn)
+    
+    if 'rounds_archive' in sessions_df.columns:
+        sessions_df = sessions_df.drop(columns='rounds_archive')
+    if session_table and round_table:
+        rounds_df = add_archived_rounds(conn, session_table, sessions_df, rounds_df)
+    
+    return sessions_df, rounds_df
+
+def add_archived_rounds(conn, session_table, sessions_df, rounds_df):
+    """Append the rounds the app packed into game_session.rounds_archive"""
+    import pandas as pd
+    from analysis_aggregates import archived_rounds_frame
+    
+    archived = archived_rounds_frame(conn, session_table)
+    if archived is None:
+        return rounds_df
+    
+    # Same session columns as the joined raw rows (user_id, username)
+    owner_columns = [c for c in ('user_id', 'username') if c in rounds_df.columns and c in sessions_df.columns]
+    if owner_columns:
+        owners = sessions_df[['id'] + owner_columns].rename(columns={'id': 'session_id'})
+        archived = archived.merge(owners, on='session_id', how='left')
+    print(f"Decoded {len(archived)} archived rounds")
+    return pd.concat([rounds_df, archived], ignore_index=True)
+
+def check_and_load_data(use_cache=True, cache_base='.analysis_cache', shard_pattern=None):
+    """Check database structure and load data (shards are read one by one and concatenated)"""
+    import pandas as pd
+    from analysis_cache import default_cache_dir, load_cached_frames
+    
+    db_path = find_database()
     
     if not db_path:
         print("Database file not found")
         return None, None, None
     
     print(f"Using database path: {db_path}")
+    shard_paths = find_shards(db_path, shard_pattern)
+    if shard_paths:
+        print(f"Found {len(shard_paths)} shard databases")
     
     conn = sqlite3.connect(db_path)
     
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = [table[0] for table in cursor.fetchall()]
-        
-        print(f"Found tables: {tables}")
-        
-        if not tables:
-            print("Database is empty!")
+        detected = detect_tables(conn)
+        if detected is None:
             return None, None, None
+        user_table, session_table, round_table = detected
         
-        # Detect table names
-        user_table = next((t for t in tables if 'user' in t.lower()), None)
-        session_table = next((t for t in tables if 'session' in t.lower()), None)
-        round_table = next((t for t in tables if 'round' in t.lower()), None)
-        
-        print(f"Detected tables:")
-        print(f"   User table: {user_table}")
-        print(f"   Session table: {session_table}")
-        print(f"   Round table: {round_table}")
+        # Incremental columnar cache: only rows newer than the last run are queried
+        if use_cache and shard_paths:
+            print("The incremental cache covers a single database; reading the shards directly")
+        elif use_cache and user_table and session_table and round_table:
+            users_df, sessions_df, rounds_df = load_cached_frames(
+                conn, user_table, session_table, round_table,
+                default_cache_dir(db_path, cache_base))
+            rounds_df = add_archived_rounds(conn, session_table, sessions_df, rounds_df)
+            print(f"Loaded user data: {len(users_df)} records")
+            print(f"Loaded session data: {len(sessions_df)} records")
+            print(f"Loaded round data: {len(rounds_df)} records")
+            return users_df, sessions_df, rounds_df
         
         # Load data
         users_df = pd.DataFrame()
-        sessions_df = pd.DataFrame()
-        rounds_df = pd.DataFrame()
         
         if user_table:
             users_df = pd.read_sql_query(f"SELECT * FROM {user_table}", conn)
             print(f"Loaded user data: {len(users_df)} records")
         
+        sessions_df, rounds_df = read_session_frames(conn, user_table, session_table, round_table)
+        
+        # Sharded storage: each shard holds the sessions and rounds of its users
+        session_frames, round_frames = [sessions_df], [rounds_df]
+        for shard_path in shard_paths:
+            shard_conn = connect_shard(shard_path, db_path)
+            try:
+                shard_sessions, shard_rounds = read_session_frames(
+                    shard_conn, user_table and f'directory.{user_table}', session_table, round_table)
+            finally:
+                shard_conn.close()
+            session_frames.append(shard_sessions)
+            round_frames.append(shard_rounds)
+        if shard_paths:
+            sessions_df = pd.concat(session_frames, ignore_index=True)
+            rounds_df = pd.concat(round_frames, ignore_index=True)
+        
         if session_table:
-            if user_table:
-                sessions_df = pd.read_sql_query(f"""
-                    SELECT gs.*, u.username, u.age 
-                    FROM {session_table} gs 
-                    LEFT JOIN {user_table} u ON gs.user_id = u.id
-                """, conn)
-            else:
-                sessions_df = pd.read_sql_query(f"SELECT * FROM {session_table}", conn)
             print(f"Loaded session data: {len(sessions_df)} records")
-        
         if round_table:
-            if session_table and user_table:
-                rounds_df = pd.read_sql_query(f"""
-                    SELECT gr.*, gs.user_id, u.username
-                    FROM {round_table} gr
-                    LEFT JOIN {session_table} gs ON gr.session_id = gs.id
-                    LEFT JOIN {user_table} u ON gs.user_id = u.id
-                """, conn)
-            elif session_table:
-                rounds_df = pd.read_sql_query(f"""
-                    SELECT gr.*, gs.user_id
-                    FROM {round_table} gr
-                    LEFT JOIN {session_table} gs ON gr.session_id = gs.id
-                """, conn)
-            else:
-                rounds_df = pd.read_sql_query(f"SELECT * FROM {round_table}", conn)
             print(f"Loaded round data: {len(rounds_df)} records")
         
         if not sessions_df.empty and 'start_time' in sessions_df.columns:
@@ -119,350 +335,269 @@ def check_and_load_data():
     finally:
         conn.close()
 
-# Load data
-users_df, sessions_df, rounds_df = check_and_load_data()
 
-if users_df is None:
-    exit()
 
-print("\nData Overview:")
-print(f"Number of users: {len(users_df)}")
-print(f"Number of game sessions: {len(sessions_df)}")
-print(f"Number of game rounds: {len(rounds_df)}")
+def report_formats(value):
+    """Comma separated list of output formats, e.g. png,svg,html"""
+    formats = [fmt.strip().lower() for fmt in value.split(',') if fmt.strip()]
+    unknown = sorted(set(formats) - set(REPORT_FORMATS))
+    if unknown or not formats:
+        raise argparse.ArgumentTypeError(
+            f"unknown format(s) {', '.join(unknown) or value!r}; choose from {', '.join(REPORT_FORMATS)}")
+    return formats
 
-# Create sample charts if no data
-if rounds_df.empty:
-    print("\nNo game data found, creating sample charts...")
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Reaction time analysis report')
+    parser.add_argument('--mode', choices=['pandas', 'sql', 'stream', 'rollup'], default=None,
+                        help='pandas loads the tables into memory, sql aggregates inside SQLite, '
+                             'stream reads rounds in chunks with constant memory, '
+                             'rollup reads the per-user/per-day tables kept by the app '
+                             '(default: pandas, or sql with --databases or --text)')
+    parser.add_argument('--text', action='store_true',
+                        help='print only the statistics report, computed with the standard library sqlite3 '
+                             '(no NumPy, pandas or matplotlib; fast start for health checks); '
+                             'works with --mode sql or rollup')
+    parser.add_argument('--chunk-size', type=int, default=50000,
+                        help='rows per fetch in stream mode')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='read every table from SQLite instead of the incremental cache')
+    parser.add_argument('--cache-dir', default='.analysis_cache',
+                        help='directory for the columnar snapshot cache')
+    parser.add_argument('--shards', default=None, metavar='GLOB',
+                        help='shard database files to include '
+                             '(default: reaction_game_shard*.db next to the main database)')
+    parser.add_argument('--databases', nargs='+', default=None, metavar='PATH',
+                        help='analyse several game databases (files or glob patterns, e.g. one per kiosk) '
+                             'in a process pool and merge them into one report; users are matched by username')
+    parser.add_argument('--output-dir', default=None, metavar='DIR',
+                        help='headless mode: render each chart to its own file in DIR (Agg backend, '
+                             'no window) instead of showing the combined figure')
+    parser.add_argument('--format', dest='formats', type=report_formats, default=['png', 'html'],
+                        metavar='LIST',
+                        help='comma separated output formats for --output-dir: png, svg, html '
+                             '(default: png,html)')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='worker processes for --databases and for headless chart rendering '
+                             '(default: one per database or chart, up to the CPU count; 1 runs in-process)')
+    parser.add_argument('--profile', action='store_true',
+                        help='print the wall time of each stage (load, aggregate, each chart, save) to stderr')
+    args = parser.parse_args(argv)
+    
+    if args.text:
+        if args.mode in ('pandas', 'stream'):
+            parser.error('--text needs --mode sql or rollup')
+        if args.output_dir:
+            parser.error('--text prints the report only and cannot be combined with --output-dir')
+    if args.databases:
+        if args.mode == 'pandas':
+            parser.error('--databases needs --mode sql, stream or rollup')
+        if args.shards:
+            parser.error('--shards cannot be combined with --databases')
+    if args.databases or args.text:
+        args.mode = args.mode or 'sql'
+    else:
+        args.mode = args.mode or 'pandas'
+    return args
+
+# Wall time per stage for --profile, in the order the stages ran
+stage_times = []
+
+@contextmanager
+def stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_times.append((name, time.perf_counter() - started))
+
+def print_profile(args):
+    if not args.profile:
+        return
+    print("\nProfile (wall time):", file=sys.stderr)
+    for name, seconds in stage_times:
+        print(f"   {name:<32} {seconds * 1000:10.1f} ms", file=sys.stderr)
+
+def output_images(args):
+    """Image formats to write in headless mode; the HTML report needs at least one"""
+    images = [fmt for fmt in IMAGE_FORMATS if fmt in args.formats]
+    return images or ['png']
+
+def save_figure(fig, name, args):
+    """Save a combined figure to the output directory, returning the file names"""
+    os.makedirs(args.output_dir, exist_ok=True)
+    files = []
+    for fmt in output_images(args):
+        files.append(f'{name}.{fmt}')
+        fig.savefig(os.path.join(args.output_dir, files[-1]), format=fmt)
+    return files
+
+def load_aggregates(args):
+    """Load data and run one aggregation pass shared by every chart and the report; None on error"""
+    if args.databases:
+        with stage(f'load + aggregate ({args.mode}, map-reduce)'):
+            return check_and_map_reduce(args.databases, args.mode, args.chunk_size, args.jobs)
+    if args.mode == 'sql':
+        with stage('load + aggregate (sql)'):
+            return check_and_aggregate_in_sql(args.shards)
+    if args.mode == 'rollup':
+        with stage('load + aggregate (rollup)'):
+            return check_and_read_rollups(args.shards)
+    if args.mode == 'stream':
+        with stage('load + aggregate (stream)'):
+            return check_and_stream_data(args.chunk_size, args.shards)
     
-    np.random.seed(42)
-    sample_reactions = np.random.normal(350, 80, 100)
-    sample_reactions = sample_reactions[sample_reactions > 150]
-    sample_reactions = sample_reactions[sample_reactions < 800]
+    with stage('load'):
+        users_df, sessions_df, rounds_df = check_and_load_data(not args.no_cache, args.cache_dir, args.shards)
+    if users_df is None:
+        return None
     
-    fig = plt.figure(figsize=(18, 14))
-    fig.suptitle('Reaction Time Test Data Analysis Report (Sample Data)', fontsize=20, fontweight='bold')
-    
-    gs = fig.add_gridspec(2, 2, hspace=0.35, wspace=0.3)
-    
-    # Sample chart 1
-    ax1 = fig.add_subplot(gs[0, 0])
-    sns.histplot(sample_reactions, bins=20, kde=True, alpha=0.7, color='skyblue', ax=ax1)
-    ax1.axvline(np.mean(sample_reactions), color='red', linestyle='--', linewidth=2, 
-               label=f'Mean: {np.mean(sample_reactions):.0f}ms')
-    ax1.set_title('Reaction Time Distribution (Sample)', fontsize=14, fontweight='bold')
-    ax1.set_xlabel('Reaction Time (ms)', fontsize=12)
-    ax1.set_ylabel('Density', fontsize=12)
-    ax1.legend()
-    
-    # Sample chart 2
-    ax2 = fig.add_subplot(gs[0, 1])
-    sample_accuracy = [85, 92, 78, 95, 88]
-    accuracy_labels = ['User1', 'User2', 'User3', 'User4', 'User5']
-    ax2.pie(sample_accuracy, labels=accuracy_labels, autopct='%1.1f%%', startangle=90)
-    ax2.set_title('Accuracy Distribution (Sample)', fontsize=14, fontweight='bold')
-    
-    # Sample chart 3
-    ax3 = fig.add_subplot(gs[1, 0])
-    sample_heatmap = np.random.randint(0, 10, (6, 15))
-    sns.heatmap(sample_heatmap, annot=True, fmt='d', cmap='YlOrRd', ax=ax3)
-    ax3.set_title('Round vs Reaction Time Heatmap (Sample)', fontsize=14, fontweight='bold')
-    ax3.set_xlabel('Round Number', fontsize=12)
-    ax3.set_ylabel('Reaction Time Range', fontsize=12)
-    
-    # Sample chart 4
-    ax4 = fig.add_subplot(gs[1, 1])
-    sample_plays = [1, 2, 3, 4, 5]
-    sample_avg_time = [380, 350, 330, 320, 310]
-    ax4.scatter(sample_plays, sample_avg_time, s=120, alpha=0.7)
-    ax4.plot(sample_plays, sample_avg_time, 'r--', alpha=0.8)
-    ax4.set_title('Play Count vs Avg Reaction Time (Sample)', fontsize=14, fontweight='bold')
-    ax4.set_xlabel('Number of Plays', fontsize=12)
-    ax4.set_ylabel('Average Reaction Time (ms)', fontsize=12)
+    from analysis_aggregates import compute_aggregates
     
-    plt.show()
-    print("\nThis is a sample chart. Please run the game to generate real data!")
-    exit()
-
-print("\n" + "="*50 + "\n")
+    with stage('aggregate'):
+        return compute_aggregates(users_df, sessions_df, rounds_df)
 
-# Create real data charts
-fig = plt.figure(figsize=(20, 15))
-fig.suptitle('Reaction Time Test Data Analysis Report', fontsize=22, fontweight='bold')
+def load_text_aggregates(args):
+    """Totals, summary and levels with sqlite3 only (see analysis_report); None on error"""
+    if args.databases:
+        try:
+            paths = expand_databases(args.databases)
+        except FileNotFoundError as e:
+            print(e)
+            return None
+        users_path = None
+        print(f"Analysing {len(paths)} databases")
+    else:
+        db_path = find_database()
+        if not db_path:
+            print("Database file not found")
+            return None
+        print(f"Using database path: {db_path}")
+        shard_paths = find_shards(db_path, args.shards)
+        if shard_paths:
+            print(f"Found {len(shard_paths)} shard databases")
+        paths = [db_path] + shard_paths
+        users_path = db_path
+    
+    try:
+        with stage(f'load + aggregate ({args.mode}, text)'):
+            return text_aggregates(paths, users_path, rollup=args.mode == 'rollup')
+    except (ValueError, sqlite3.Error) as e:
+        print(f"Error: {e}")
+        return None
 
-gs = fig.add_gridspec(2, 2, hspace=0.4, wspace=0.3)
+def print_overview(totals):
+    print("\nData Overview:")
+    print(f"Number of users: {totals['users']}")
+    print(f"Number of game sessions: {totals['sessions']}")
+    print(f"Number of game rounds: {totals['rounds']}")
 
-# Chart 1: Reaction Time Distribution
-ax1 = fig.add_subplot(gs[0, 0])
-if not rounds_df.empty and 'response_accuracy' in rounds_df.columns and 'reaction_time' in rounds_df.columns:
-    successful_reactions = rounds_df[
-        (rounds_df['response_accuracy'] == True) & 
-        (rounds_df['reaction_time'] < 800)
-    ]['reaction_time']
+def show_sample_report(args):
+    """Sample charts for an empty database, shown or saved like the real report"""
+    print("\nNo game data found, creating sample charts...")
+    note = "This is a sample chart. Please run the game to generate real data!"
     
-    if not successful_reactions.empty:
-        sns.histplot(successful_reactions, bins=20, kde=True, alpha=0.7, 
-                    color='skyblue', stat='density', ax=ax1)
-        
-        mean_time = successful_reactions.mean()
-        median_time = successful_reactions.median()
-        
-        ax1.axvline(mean_time, color='red', linestyle='--', linewidth=2, 
-                   label=f'Mean: {mean_time:.0f}ms')
-        ax1.axvline(median_time, color='orange', linestyle='--', linewidth=2,
-                   label=f'Median: {median_time:.0f}ms')
-        
-        ax1.set_title('Reaction Time Distribution', fontsize=16, fontweight='bold', pad=15)
-        ax1.set_xlabel('Reaction Time (ms)', fontsize=13)
-        ax1.set_ylabel('Density', fontsize=13)
-        ax1.legend(fontsize=11)
-        ax1.grid(True, alpha=0.3)
-        
-        # Statistics summary
-        stats_text = (f'Statistics Summary:\n'
-                     f'Sample Size: {len(successful_reactions)}\n'
-                     f'Fastest: {successful_reactions.min():.0f}ms\n'
-                     f'Slowest: {successful_reactions.max():.0f}ms\n'
-                     f'Std Dev: {successful_reactions.std():.0f}ms')
-        
-        ax1.text(0.02, 0.98, stats_text, transform=ax1.transAxes, fontsize=10, 
-                verticalalignment='top', 
-                bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.8))
+    import matplotlib.pyplot as plt
+    from analysis_charts import apply_style, draw_sample_report, write_html_report
+    
+    apply_style()
+    fig = plt.figure(figsize=(18, 14))
+    draw_sample_report(fig)
+    
+    if args.output_dir:
+        with stage('save'):
+            files = save_figure(fig, 'sample_report', args)
+            if 'html' in args.formats:
+                write_html_report(os.path.join(args.output_dir, 'report.html'),
+                                  'Reaction Time Test Data Analysis Report (Sample Data)', note,
+                                  [('Sample Data', files[0])])
     else:
-        ax1.text(0.5, 0.5, 'No successful reaction data', ha='center', va='center', 
-                transform=ax1.transAxes, fontsize=14)
-        ax1.set_title('Reaction Time Distribution', fontsize=16, fontweight='bold', pad=15)
-else:
-    ax1.text(0.5, 0.5, 'No data available', ha='center', va='center', 
-            transform=ax1.transAxes, fontsize=14)
-    ax1.set_title('Reaction Time Distribution', fontsize=16, fontweight='bold', pad=15)
-
-# Chart 2: Accuracy Distribution
-ax2 = fig.add_subplot(gs[0, 1])
-if not sessions_df.empty and not rounds_df.empty and 'response_accuracy' in rounds_df.columns:
-    session_accuracy = []
-    
-    for session_id in sessions_df['id']:
-        session_rounds = rounds_df[rounds_df['session_id'] == session_id]
-        if not session_rounds.empty:
-            accuracy = (session_rounds['response_accuracy'].sum() / len(session_rounds)) * 100
-            session_accuracy.append(accuracy)
-    
-    if session_accuracy:
-        accuracy_bins = [0, 40, 60, 80, 90, 100]
-        accuracy_labels = ['0-40%', '41-60%', '61-80%', '81-90%', '91-100%']
-        
-        accuracy_counts = pd.cut(session_accuracy, bins=accuracy_bins, 
-                               labels=accuracy_labels, include_lowest=True).value_counts()
-        accuracy_counts = accuracy_counts[accuracy_counts > 0]
-        
-        if not accuracy_counts.empty:
-            colors = ['#ff6b6b', '#ffa726', '#ffeb3b', '#66bb6a', '#42a5f5'][:len(accuracy_counts)]
-            wedges, texts, autotexts = ax2.pie(accuracy_counts.values, 
-                                              labels=accuracy_counts.index, 
-                                              autopct='%1.1f%%', 
-                                              startangle=90, 
-                                              colors=colors)
-            
-            ax2.set_title('Accuracy Distribution', fontsize=16, fontweight='bold', pad=15)
-            
-            # Beautify text
-            for text in texts:
-                text.set_fontsize(10)
-            for autotext in autotexts:
-                autotext.set_color('black')
-                autotext.set_fontweight('bold')
-                autotext.set_fontsize(10)
-            
-            # Statistics
-            mean_accuracy = np.mean(session_accuracy)
-            stats_text = (f'Accuracy Statistics:\n'
-                         f'Sessions: {len(session_accuracy)}\n'
-                         f'Mean Accuracy: {mean_accuracy:.1f}%\n'
-                         f'Max Accuracy: {max(session_accuracy):.1f}%\n'
-                         f'Min Accuracy: {min(session_accuracy):.1f}%')
-            
-            ax2.text(1.3, 0.5, stats_text, transform=ax2.transAxes, fontsize=10, 
-                    verticalalignment='center',
-                    bbox=dict(boxstyle='round', facecolor='lightblue', alpha=0.8))
+        plt.show()
+    print("\n" + note)
+
+def show_charts(aggregates):
+    """Draw the four charts into one interactive figure"""
+    import matplotlib.pyplot as plt
+    from analysis_charts import apply_style, draw_report
+    
+    apply_style()
+    fig = plt.figure(figsize=(20, 15))
+    fig.suptitle('Reaction Time Test Data Analysis Report', fontsize=22, fontweight='bold')
+    
+    draw_report(fig, aggregates, stage_times)
+    
+    # Show charts
+    plt.tight_layout()
+    plt.show()
+
+def main(argv=None):
+    args = parse_args(argv)
+    stage_times.clear()
+    
+    if args.output_dir:
+        # Pick the Agg backend before pyplot is first imported
+        import matplotlib
+        matplotlib.use('Agg')
+    
+    if args.text:
+        aggregates = load_text_aggregates(args)
+        if aggregates is None:
+            return
+        print_overview(aggregates['totals'])
+        if not aggregates['totals']['rounds']:
+            print("\nNo game data found.")
         else:
-            ax2.text(0.5, 0.5, 'Insufficient accuracy data', ha='center', va='center', 
-                    transform=ax2.transAxes, fontsize=14)
-            ax2.set_title('Accuracy Distribution', fontsize=16, fontweight='bold', pad=15)
-    else:
-        ax2.text(0.5, 0.5, 'No accuracy data', ha='center', va='center', 
-                transform=ax2.transAxes, fontsize=14)
-        ax2.set_title('Accuracy Distribution', fontsize=16, fontweight='bold', pad=15)
-else:
-    ax2.text(0.5, 0.5, 'No data available', ha='center', va='center', 
-            transform=ax2.transAxes, fontsize=14)
-    ax2.set_title('Accuracy Distribution', fontsize=16, fontweight='bold', pad=15)
-
-# Chart 3: Round vs Reaction Time Heatmap/Bar Chart
-ax3 = fig.add_subplot(gs[1, 0])
-if not rounds_df.empty and 'response_accuracy' in rounds_df.columns and 'reaction_time' in rounds_df.columns:
-    successful_rounds = rounds_df[
-        (rounds_df['response_accuracy'] == True) & 
-        (rounds_df['reaction_time'] < 800)
-    ].copy()
-    
-    if not successful_rounds.empty and 'round_number' in successful_rounds.columns:
-        reaction_bins = [0, 200, 300, 400, 500, 600, 800]
-        reaction_labels = ['<200ms', '200-300ms', '300-400ms', '400-500ms', '500-600ms', '>600ms']
-        
-        successful_rounds['reaction_category'] = pd.cut(
-            successful_rounds['reaction_time'], 
-            bins=reaction_bins, 
-            labels=reaction_labels, 
-            include_lowest=True
-        )
-        
-        heatmap_data = successful_rounds.groupby(['round_number', 'reaction_category']).size().unstack(fill_value=0)
+            print('\n'.join(report_lines(aggregates)))
+        print("\n" + "="*60)
+        print("Analysis complete! (text report)")
+        print_profile(args)
+        return
+    
+    aggregates = load_aggregates(args)
+    if aggregates is None:
+        return
+    
+    print_overview(aggregates['totals'])
+    
+    # Create sample charts if no data
+    if not aggregates['totals']['rounds']:
+        show_sample_report(args)
+        print_profile(args)
+        return
+    
+    print("\n" + "="*50 + "\n")
+    
+    if args.output_dir:
+        from analysis_charts import CHARTS, render_charts
         
-        if not heatmap_data.empty and heatmap_data.shape[0] > 3 and heatmap_data.shape[1] > 2:
-            # Draw heatmap
-            sns.heatmap(heatmap_data.T, annot=True, fmt='d', cmap='YlOrRd', 
-                       cbar_kws={'label': 'Reaction Count'}, ax=ax3)
-            
-            ax3.set_title('Round vs Reaction Time Heatmap', fontsize=16, fontweight='bold', pad=15)
-            ax3.set_xlabel('Round Number', fontsize=13)
-            ax3.set_ylabel('Reaction Time Range', fontsize=13)
-            ax3.tick_params(axis='x', rotation=45, labelsize=10)
-            ax3.tick_params(axis='y', rotation=0, labelsize=10)
-        else:
-            # Use bar chart when insufficient data
-            reaction_counts = successful_rounds['reaction_category'].value_counts()
-            if not reaction_counts.empty:
-                bars = ax3.bar(range(len(reaction_counts)), reaction_counts.values, 
-                              color='skyblue', alpha=0.7)
-                ax3.set_xticks(range(len(reaction_counts)))
-                ax3.set_xticklabels(reaction_counts.index, rotation=45)
-                ax3.set_title('Reaction Time Distribution', fontsize=16, fontweight='bold', pad=15)
-                ax3.set_xlabel('Reaction Time Range', fontsize=13)
-                ax3.set_ylabel('Count', fontsize=13)
-                
-                # Add values on bars
-                for bar in bars:
-                    height = bar.get_height()
-                    ax3.text(bar.get_x() + bar.get_width()/2., height,
-                            f'{int(height)}', ha='center', va='bottom', fontsize=10)
-            else:
-                ax3.text(0.5, 0.5, 'Insufficient data for chart', ha='center', va='center', 
-                        transform=ax3.transAxes, fontsize=14)
-                ax3.set_title('Reaction Time Analysis', fontsize=16, fontweight='bold', pad=15)
+        # Headless: one figure per chart, rendered in parallel and saved straight to disk
+        with stage(f'render {len(CHARTS)} charts (wall)'):
+            results = render_charts(aggregates, args.output_dir, output_images(args), args.jobs)
+        for name, paths, draw_seconds, save_seconds in results:
+            stage_times.append((f'  chart {name}', draw_seconds))
+            stage_times.append((f'  save {name}', save_seconds))
     else:
-        ax3.text(0.5, 0.5, 'No successful reaction data', ha='center', va='center', 
-                transform=ax3.transAxes, fontsize=14)
-        ax3.set_title('Round vs Reaction Time Heatmap', fontsize=16, fontweight='bold', pad=15)
-else:
-    ax3.text(0.5, 0.5, 'No data available', ha='center', va='center', 
-            transform=ax3.transAxes, fontsize=14)
-    ax3.set_title('Round vs Reaction Time Heatmap', fontsize=16, fontweight='bold', pad=15)
-
-# Chart 4: Play Count vs Reaction Time Relationship (without user IDs)
-ax4 = fig.add_subplot(gs[1, 1])
-if not sessions_df.empty and not rounds_df.empty and not users_df.empty:
-    user_stats = []
-    
-    for user_id in users_df['id']:
-        user_sessions = sessions_df[sessions_df['user_id'] == user_id]
-        play_count = len(user_sessions)
-        
-        user_rounds = rounds_df[
-            (rounds_df['user_id'] == user_id) & 
-            (rounds_df['response_accuracy'] == True) & 
-            (rounds_df['reaction_time'] < 800)
-        ]
-        
-        if not user_rounds.empty and play_count > 0:
-            avg_reaction_time = user_rounds['reaction_time'].mean()
-            user_stats.append({
-                'play_count': play_count,
-                'avg_reaction_time': avg_reaction_time,
-                'total_rounds': len(user_rounds)
-            })
-    
-    if user_stats:
-        stats_df = pd.DataFrame(user_stats)
-        
-        # Draw scatter plot without user ID labels
-        scatter = ax4.scatter(stats_df['play_count'], stats_df['avg_reaction_time'], 
-                            s=stats_df['total_rounds']*8, alpha=0.7, 
-                            c=range(len(stats_df)), cmap='viridis', 
-                            edgecolors='black', linewidth=1)
-        
-        # Trend line
-        if len(stats_df) > 1:
-            z = np.polyfit(stats_df['play_count'], stats_df['avg_reaction_time'], 1)
-            p = np.poly1d(z)
-            ax4.plot(stats_df['play_count'], p(stats_df['play_count']), 
-                    "r--", alpha=0.8, linewidth=2, 
-                    label=f'Trend Line (slope: {z[0]:.1f})')
-        
-        ax4.set_title('Play Count vs Average Reaction Time', fontsize=16, fontweight='bold', pad=15)
-        ax4.set_xlabel('Number of Plays', fontsize=13)
-        ax4.set_ylabel('Average Reaction Time (ms)', fontsize=13)
-        ax4.grid(True, alpha=0.3)
-        
-        if len(stats_df) > 1:
-            ax4.legend(fontsize=10)
+        show_charts(aggregates)
+    
+    # Statistical report
+    report = report_lines(aggregates)
+    print('\n'.join(report))
+    
+    if args.output_dir and 'html' in args.formats:
+        from analysis_charts import CHARTS, write_html_report
         
-        # Info text without specific user count
-        info_text = f'Info:\nBubble size = Total rounds\nData points: {len(stats_df)}'
-        ax4.text(0.02, 0.98, info_text, transform=ax4.transAxes, fontsize=10, 
-                verticalalignment='top',
-                bbox=dict(boxstyle='round', facecolor='lightgreen', alpha=0.8))
+        with stage('save report.html'):
+            image = output_images(args)[0]
+            write_html_report(os.path.join(args.output_dir, 'report.html'),
+                              'Reaction Time Test Data Analysis Report',
+                              '\n'.join(report).strip(),
+                              [(title, f'{name}.{image}') for name, title, _, _ in CHARTS])
+    
+    print("\n" + "="*60)
+    if args.output_dir:
+        print(f"Analysis complete! Charts written to {args.output_dir}")
     else:
-        ax4.text(0.5, 0.5, 'No user statistics data', ha='center', va='center', 
-                transform=ax4.transAxes, fontsize=14)
-        ax4.set_title('Play Count vs Average Reaction Time', fontsize=16, fontweight='bold', pad=15)
-else:
-    ax4.text(0.5, 0.5, 'No data available', ha='center', va='center', 
-            transform=ax4.transAxes, fontsize=14)
-    ax4.set_title('Play Count vs Average Reaction Time', fontsize=16, fontweight='bold', pad=15)
-
-# Show charts
-plt.tight_layout()
-plt.show()
-
-# Print statistical report
-print("\nDetailed Data Analysis Report:")
-print("="*60)
-
-if not rounds_df.empty and 'response_accuracy' in rounds_df.columns and 'reaction_time' in rounds_df.columns:
-    successful_reactions = rounds_df[
-        (rounds_df['response_accuracy'] == True) & 
-        (rounds_df['reaction_time'] < 800)
-    ]['reaction_time']
-    
-    if not successful_reactions.empty:
-        print(f"Reaction Time Statistics:")
-        print(f"   • Total successful reactions: {len(successful_reactions)}")
-        print(f"   • Average reaction time: {successful_reactions.mean():.2f} ms")
-        print(f"   • Median reaction time: {successful_reactions.median():.2f} ms")
-        print(f"   • Fastest reaction time: {successful_reactions.min()} ms")
-        print(f"   • Slowest reaction time: {successful_reactions.max()} ms")
-        print(f"   • Standard deviation: {successful_reactions.std():.2f} ms")
-        
-        # Level analysis
-        lightning = len(successful_reactions[successful_reactions < 200])
-        excellent = len(successful_reactions[(successful_reactions >= 200) & (successful_reactions < 300)])
-        good = len(successful_reactions[(successful_reactions >= 300) & (successful_reactions < 400)])
-        average = len(successful_reactions[(successful_reactions >= 400) & (successful_reactions < 500)])
-        slow = len(successful_reactions[successful_reactions >= 500])
-        
-        total = len(successful_reactions)
-        print(f"\nReaction Level Distribution:")
-        print(f"   • Lightning (<200ms): {lightning} times ({lightning/total*100:.1f}%)")
-        print(f"   • Excellent (200-300ms): {excellent} times ({excellent/total*100:.1f}%)")
-        print(f"   • Good (300-400ms): {good} times ({good/total*100:.1f}%)")
-        print(f"   • Average (400-500ms): {average} times ({average/total*100:.1f}%)")
-        print(f"   • Slow (>500ms): {slow} times ({slow/total*100:.1f}%)")
-
-if not sessions_df.empty and not rounds_df.empty and 'response_accuracy' in rounds_df.columns:
-    total_accuracy = (rounds_df['response_accuracy'].sum() / len(rounds_df)) * 100
-    print(f"\nOverall Accuracy: {total_accuracy:.2f}%")
-    print(f"Total Game Sessions: {len(sessions_df)}")
-    print(f"Total Users: {len(users_df)}")
-
-print("\n" + "="*60)
-print("Analysis complete! Charts displayed.")
\ No newline at end of file
+        print("Analysis complete! Charts displayed.")
+    print_profile(args)
+
+if __name__ == '__main__':
+    main()
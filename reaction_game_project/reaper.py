@@ -0,0 +1,122 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+class SessionReaper:
+    """定期收掉被放棄的遊戲會話
+
+    玩家關掉頁面或沒玩完時，會話不會呼叫 end_session，一直停在未結束的狀態。
+    背景執行緒每 REAPER_INTERVAL 秒找出開始超過 REAPER_STALE_MINUTES 分鐘仍未結束的
+    會話，每批最多 REAPER_BATCH_SIZE 個交給 reap_batch 處理：有回合的補上結束時間
+    並計入彙總表，沒有回合的直接刪除。
+
+    reap_batch(cutoff, limit) 由應用提供 (需要模型與分片)，回傳
+    {'finalized': 結束的會話數, 'deleted': 刪除的會話數, 'more': 是否還有下一批}。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.reap_batch = None
+        self._thread = None
+        self._pid = None
+        self._stop_event = threading.Event()
+        self._run_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._stats = {
+            'runs': 0,
+            'failures': 0,
+            'finalized': 0,
+            'deleted': 0,
+            'last_finalized': 0,
+            'last_deleted': 0,
+            'last_run_ms': 0.0,
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, reap_batch=None):
+        app.config.setdefault('REAPER_ENABLED', True)
+        app.config.setdefault('REAPER_INTERVAL', 300)
+        app.config.setdefault('REAPER_STALE_MINUTES', 120)
+        app.config.setdefault('REAPER_BATCH_SIZE', 200)
+        app.config.setdefault('REAPER_TRACK_PERCENTILES', True)
+        self.app = app
+        if reap_batch is not None:
+            self.reap_batch = reap_batch
+        app.extensions['session_reaper'] = self
+
+    @property
+    def enabled(self):
+        return self.app.config['REAPER_ENABLED'] and self.app.config['REAPER_INTERVAL'] > 0
+
+    def start(self):
+        """啟動背景執行緒；已在執行或未啟用時不做任何事"""
+        if not self.enabled:
+            return
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        self._stop_event = threading.Event()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='session-reaper', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """停止背景執行緒，正在處理的那一批會先完成"""
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+
+    def run_once(self, stale_minutes=None, batch_size=None):
+        """處理所有過期的會話直到沒有下一批，回傳這一輪 {'finalized', 'deleted'}
+
+        需要在 app context 內呼叫；同一行程同時只會有一輪在執行。
+        """
+        if stale_minutes is None:
+            stale_minutes = self.app.config['REAPER_STALE_MINUTES']
+        if batch_size is None:
+            batch_size = self.app.config['REAPER_BATCH_SIZE']
+        cutoff = datetime.utcnow() - timedelta(minutes=stale_minutes)
+
+        totals = {'finalized': 0, 'deleted': 0}
+        started = time.perf_counter()
+        with self._run_lock:
+            while True:
+                result = self.reap_batch(cutoff, batch_size)
+                totals['finalized'] += result['finalized']
+                totals['deleted'] += result['deleted']
+                if not result['more'] or self._stop_event.is_set():
+                    break
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats['runs'] += 1
+            self._stats['finalized'] += totals['finalized']
+            self._stats['deleted'] += totals['deleted']
+            self._stats['last_finalized'] = totals['finalized']
+            self._stats['last_deleted'] = totals['deleted']
+            self._stats['last_run_ms'] = elapsed_ms
+        return totals
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['running'] = self._thread is not None and self._thread.is_alive()
+        return stats
+
+    def _run(self):
+        interval = self.app.config['REAPER_INTERVAL']
+        while not self._stop_event.wait(interval):
+            try:
+                with self.app.app_context():
+                    totals = self.run_once()
+            except Exception:
+                self.app.logger.exception('收回過期的遊戲會話失敗')
+                with self._lock:
+                    self._stats['failures'] += 1
+                continue
+            if totals['finalized'] or totals['deleted']:
+                self.app.logger.info('已結束 %d 個、刪除 %d 個被放棄的遊戲會話',
+                                     totals['finalized'], totals['deleted'])
@@ -0,0 +1,81 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class ResultCache:
+    """已結束會話的結果頁快取
+
+    會話有了 end_time 之後結果就不會再變，直接保留渲染好的 HTML 與 ETag。
+    以 LRU 淘汰，總大小不超過 max_bytes。
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def init_app(self, app):
+        app.config.setdefault('RESULTS_CACHE_MAX_BYTES', self.max_bytes)
+        self.max_bytes = app.config['RESULTS_CACHE_MAX_BYTES']
+        app.extensions['result_cache'] = self
+
+    @staticmethod
+    def make_etag(body):
+        return hashlib.sha1(body).hexdigest()
+
+    def get(self, key):
+        """回傳 (body, etag)，沒有快取時回傳 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body):
+        """存入渲染好的頁面並回傳 ETag；單一頁面超過上限時不快取"""
+        etag = self.make_etag(body)
+        if len(body) > self.max_bytes:
+            return etag
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[0])
+            self._entries[key] = (body, etag)
+            self._size += len(body)
+
+            while self._size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+        return etag
+
+    def invalidate(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= len(entry[0])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
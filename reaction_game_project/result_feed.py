@@ -0,0 +1,130 @@
+import json
+import queue
+import threading
+from collections import deque
+from itertools import count
+
+# 佇列中的結束標記：伺服器關閉時讓串流馬上結束
+_CLOSE = object()
+
+
+class _Subscriber:
+    def __init__(self, buffer_size):
+        self.queue = queue.Queue(maxsize=buffer_size)
+        self.dropped = False
+
+
+class ResultFeed:
+    """已結束遊戲的即時廣播 (行程內 pub/sub)，供 /api/stream/results 的 SSE 使用
+
+    end_session commit 之後 publish 一筆結果，複製到每個訂閱者自己的有界佇列；
+    佇列滿了 (客戶端讀太慢) 就把該訂閱者踢掉，不會拖慢 end_session 或其他訂閱者。
+    最近 replay_size 筆結果留在環狀緩衝區，新連線或帶 Last-Event-ID 重連時
+    直接從記憶體補送，不需要查詢資料庫。
+
+    只廣播這個行程處理的 end_session；serve.py 有多個 worker 時各自獨立。
+    """
+
+    def __init__(self, buffer_size=64, replay_size=20, max_subscribers=500):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self._recent = deque(maxlen=replay_size)
+        self._subscribers = set()
+        self._ids = count(1)
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    def init_app(self, app):
+        app.config.setdefault('RESULTS_FEED_BUFFER', self.buffer_size)
+        app.config.setdefault('RESULTS_FEED_REPLAY', self._recent.maxlen)
+        app.config.setdefault('RESULTS_FEED_MAX_LISTENERS', self.max_subscribers)
+        self.configure(app.config['RESULTS_FEED_BUFFER'], app.config['RESULTS_FEED_REPLAY'],
+                       app.config['RESULTS_FEED_MAX_LISTENERS'])
+        app.extensions['result_feed'] = self
+
+    def configure(self, buffer_size, replay_size, max_subscribers):
+        with self._lock:
+            self.buffer_size = buffer_size
+            self.max_subscribers = max_subscribers
+            self._recent = deque(self._recent, maxlen=replay_size)
+
+    def publish(self, result):
+        """廣播一筆結果 (可轉成 JSON 的 dict)，回傳事件編號"""
+        with self._lock:
+            event_id = next(self._ids)
+            event = (event_id, json.dumps(result, ensure_ascii=False, separators=(',', ':')))
+            self._recent.append(event)
+            self.published += 1
+            for subscriber in list(self._subscribers):
+                try:
+                    subscriber.queue.put_nowait(event)
+                except queue.Full:
+                    subscriber.dropped = True
+                    self._subscribers.discard(subscriber)
+                    self.dropped += 1
+        return event_id
+
+    def subscribe(self, last_event_id=None):
+        """登記一個訂閱者並放入要補送的最近結果；訂閱者已達上限時回傳 None"""
+        subscriber = _Subscriber(self.buffer_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            # 事件編號每個行程各自從 1 開始，比最新的還大表示是別的行程給的，整個補送
+            latest = self._recent[-1][0] if self._recent else 0
+            if last_event_id is None or last_event_id > latest:
+                last_event_id = 0
+            missed = [event for event in self._recent if event[0] > last_event_id]
+            for event in missed[-self.buffer_size:]:
+                subscriber.queue.put_nowait(event)
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def close(self):
+        """結束所有串流 (伺服器關閉時)"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._subscribers.clear()
+        for subscriber in subscribers:
+            subscriber.dropped = True
+            try:
+                subscriber.queue.put_nowait(_CLOSE)
+            except queue.Full:
+                pass
+
+    def stream(self, subscriber, keepalive=15.0, retry_ms=3000):
+        """產生 SSE 格式的文字；沒有新結果時每 keepalive 秒送一行註解保持連線"""
+        try:
+            yield f'retry: {retry_ms}\n\n'
+            while True:
+                try:
+                    event = subscriber.queue.get(timeout=keepalive)
+                except queue.Empty:
+                    if subscriber.dropped:
+                        return
+                    yield ': keepalive\n\n'
+                    continue
+                if event is _CLOSE:
+                    return
+                event_id, data = event
+                yield f'id: {event_id}\nevent: result\ndata: {data}\n\n'
+                # 被踢掉的訂閱者送完已在佇列中的結果後結束，客戶端會帶 Last-Event-ID 重連
+                if subscriber.dropped and subscriber.queue.empty():
+                    yield 'event: dropped\ndata: {}\n\n'
+                    return
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'published': self.published,
+                'dropped': self.dropped,
+                'replay_buffer': len(self._recent),
+            }
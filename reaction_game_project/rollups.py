@@ -0,0 +1,96 @@
+from sqlalchemy import DateTime, bindparam, text
+
+from archive import ALL_ROUNDS, load_archived_rounds
+
+# 與分析腳本相同的「成功回合」定義：答對且在 800 ms 逾時之內
+MAX_REACTION_MS = 800
+
+# daily_stats 的直方圖以 100 ms 為一段：band_0 = [0, 100)、band_1 = [100, 200) ...
+BAND_MS = 100
+BAND_COLUMNS = [f'band_{i}' for i in range(MAX_REACTION_MS // BAND_MS)]
+
+_SUCCESSFUL = f'(gr.response_accuracy = 1 AND gr.reaction_time < {MAX_REACTION_MS})'
+
+
+def _band_expression(index):
+    # 負值 (理論上不會出現) 算進第一段
+    low = f'gr.reaction_time >= {index * BAND_MS} AND ' if index else ''
+    return (f'COALESCE(SUM(CASE WHEN {_SUCCESSFUL} AND {low}'
+            f'gr.reaction_time < {(index + 1) * BAND_MS} THEN 1 ELSE 0 END), 0)')
+
+
+# 兩張彙總表共用的回合統計欄位 (欄位名稱, 由 game_round 計算的運算式, 合併方式)
+_ROUND_COLUMNS = [
+    ('total_rounds', 'COUNT(gr.session_id)', 'sum'),
+    ('correct_count', 'COALESCE(SUM(gr.response_accuracy), 0)', 'sum'),
+    ('successful_rounds', f'COALESCE(SUM({_SUCCESSFUL}), 0)', 'sum'),
+    ('reaction_time_sum', f'COALESCE(SUM(CASE WHEN {_SUCCESSFUL} THEN gr.reaction_time END), 0)', 'sum'),
+    ('reaction_time_sq_sum',
+     f'COALESCE(SUM(CASE WHEN {_SUCCESSFUL} THEN gr.reaction_time * gr.reaction_time END), 0)', 'sum'),
+    ('best_time', f'MIN(CASE WHEN {_SUCCESSFUL} THEN gr.reaction_time END)', 'min'),
+    ('worst_time', f'MAX(CASE WHEN {_SUCCESSFUL} THEN gr.reaction_time END)', 'max'),
+]
+
+USER_STATS_COLUMNS = [('play_count', 'COUNT(DISTINCT gs.id)', 'sum')] + _ROUND_COLUMNS
+DAILY_STATS_COLUMNS = ([('sessions', 'COUNT(DISTINCT gs.id)', 'sum')] + _ROUND_COLUMNS
+                       + [(name, _band_expression(i), 'sum') for i, name in enumerate(BAND_COLUMNS)])
+
+
+def _merge(name, how):
+    if how == 'sum':
+        return f'{name} = {name} + excluded.{name}'
+    # 任一邊為 NULL (沒有成功回合) 時取另一邊
+    return (f'{name} = {how.upper()}(COALESCE({name}, excluded.{name}), '
+            f'COALESCE(excluded.{name}, {name}))')
+
+
+def _upsert_sql(table, key, key_expression, columns, where, rounds):
+    """以 INSERT ... SELECT ... GROUP BY 彙總已結束的會話，遇到既有的列就累加"""
+    names = [name for name, _, _ in columns]
+    return f"""
+        INSERT INTO {table} ({key}, {', '.join(names)}, updated_at)
+        SELECT {key_expression}, {', '.join(expression for _, expression, _ in columns)}, :now
+        FROM game_session gs
+        LEFT JOIN {rounds} gr ON gr.session_id = gs.id
+        WHERE {where}
+        GROUP BY {key_expression}
+        ON CONFLICT ({key}) DO UPDATE SET
+            {', '.join(_merge(name, how) for name, _, how in columns)},
+            updated_at = excluded.updated_at
+    """
+
+
+def _rollup_statements(where, rounds='game_round'):
+    return [
+        _upsert_sql('user_stats', 'user_id', 'gs.user_id', USER_STATS_COLUMNS, where, rounds),
+        _upsert_sql('daily_stats', 'day', 'date(gs.end_time)', DAILY_STATS_COLUMNS, where, rounds),
+    ]
+
+
+SESSION_ROLLUP_SQL = _rollup_statements('gs.id = :session_id AND gs.end_time IS NOT NULL')
+# 重建時要包含已封存的回合 (archive.py)
+REBUILD_ROLLUP_SQL = _rollup_statements('gs.end_time IS NOT NULL', ALL_ROUNDS)
+
+
+def _text(statement):
+    # updated_at 與 ORM 寫入的 DateTime 欄位用相同格式儲存
+    return text(statement).bindparams(bindparam('now', type_=DateTime()))
+
+
+def apply_session_rollup(connection, session_id, now):
+    """把剛結束的會話併入 user_stats 與 daily_stats
+
+    在呼叫端的交易內執行，和寫入 end_time 一起 commit；
+    每個會話只能呼叫一次，否則會重複累加。
+    """
+    for statement in SESSION_ROLLUP_SQL:
+        connection.execute(_text(statement), {'session_id': session_id, 'now': now})
+
+
+def rebuild_rollups(connection, now):
+    """清空彙總表並從 game_session / game_round (含封存) 重新計算"""
+    load_archived_rounds(connection)
+    connection.execute(text('DELETE FROM user_stats'))
+    connection.execute(text('DELETE FROM daily_stats'))
+    for statement in REBUILD_ROLLUP_SQL:
+        connection.execute(_text(statement), {'now': now})
@@ -0,0 +1,190 @@
+"""正式環境啟動程式：一個主行程加上多個 worker 行程
+
+主行程先建立一次應用完成資料表與索引的初始化，接著綁定監聽 socket，
+再以 fork + exec 啟動 worker；每個 worker 是全新的直譯器，自己呼叫
+create_app() 建立引擎與連線池，不會共用任何 SQLAlchemy 狀態。
+所有 worker 在同一個 socket 上 accept，由核心分配連線。
+
+    python serve.py --workers 4 --bind 0.0.0.0:5000 --config production
+
+訊號：
+    SIGHUP          平滑重啟：先啟動新的一批 worker，再讓舊的處理完手上的請求後結束
+    SIGTERM/SIGINT  停止：worker 處理完手上的請求、寫完佇列中的回合後結束
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+# worker 結束時不各自寫名次快照，避免彼此覆蓋；由主行程在最後統一寫入
+os.environ['PERCENTILE_SNAPSHOT_SAVE'] = '0'
+# 回合佇列是每個行程各自一份，要等 commit 後才回應，end_session 才看得到所有回合
+os.environ['INGEST_WAIT'] = '1'
+# 被放棄會話的清理只在主行程執行；結束的會話由主行程最後的 catch_up 併入名次快照
+os.environ['REAPER_TRACK_PERCENTILES'] = '0'
+
+RESPAWN_DELAY = 1.0
+
+
+def parse_bind(bind):
+    host, _, port = bind.rpartition(':')
+    return host or '0.0.0.0', int(port)
+
+
+def run_worker(config_name, host, port, fd):
+    """worker：在主行程傳下來的 socket 上提供服務，收到 SIGTERM 時平滑結束"""
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    app = create_app(config_name)
+    result_feed = app.extensions['result_feed']
+    server = make_server(host, port, app, threaded=True, fd=fd)
+    # 結束時等待處理中的請求完成
+    server.daemon_threads = False
+    server.block_on_close = True
+
+    def stop(signum, frame):
+        # SSE 串流不會自己結束，先關掉才不會卡住平滑結束
+        result_feed.close()
+        # serve_forever 跑在主執行緒，shutdown 必須由另一個執行緒呼叫
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    app.logger.info('worker %s serving on %s:%s', os.getpid(), host, port)
+    server.serve_forever()
+    server.server_close()
+    # 正常結束後 atexit 會把佇列中剩餘的回合寫入
+
+
+class Arbiter:
+    """管理 worker 行程：啟動、重生、平滑重啟與停止"""
+
+    def __init__(self, config_name, host, port, workers, graceful_timeout):
+        self.config_name = config_name
+        self.host = host
+        self.port = port
+        self.size = workers
+        self.graceful_timeout = graceful_timeout
+        self.workers = {}
+        self.socket = None
+        self._reload = False
+        self._stop = False
+
+    def spawn(self):
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--worker',
+             '--config', self.config_name,
+             '--bind', f'{self.host}:{self.port}',
+             '--fd', str(self.socket.fileno())],
+            pass_fds=(self.socket.fileno(),),
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=dict(os.environ, REAPER_ENABLED='0'),
+        )
+        self.workers[process.pid] = (process, time.monotonic())
+        return process
+
+    def terminate(self, processes):
+        """送 SIGTERM 後等待結束，超過 graceful_timeout 就強制結束"""
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout
+        for process in processes:
+            try:
+                process.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    def reload(self):
+        old = [process for process, _ in self.workers.values()]
+        self.workers = {}
+        for _ in range(self.size):
+            self.spawn()
+        self.terminate(old)
+        print(f'[serve] reloaded {self.size} workers', file=sys.stderr)
+
+    def reap(self):
+        """重生意外結束的 worker；啟動後馬上結束的稍等一下再試，避免不停重啟"""
+        for pid, (process, started) in list(self.workers.items()):
+            if process.poll() is None:
+                continue
+            del self.workers[pid]
+            print(f'[serve] worker {pid} exited with {process.returncode}', file=sys.stderr)
+            if time.monotonic() - started < RESPAWN_DELAY:
+                time.sleep(RESPAWN_DELAY)
+            self.spawn()
+
+    def run(self):
+        from app import create_app, db, percentile_service, shard_router
+
+        # fork 之前只做一次資料表初始化，worker 啟動時就不會同時執行 DDL；
+        # create_app 也在主行程啟動被放棄會話的清理執行緒
+        app = create_app(self.config_name)
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+
+        self.socket = socket.create_server((self.host, self.port), backlog=2048)
+        self.socket.set_inheritable(True)
+        self.port = self.socket.getsockname()[1]
+
+        signal.signal(signal.SIGHUP, lambda signum, frame: setattr(self, '_reload', True))
+        signal.signal(signal.SIGTERM, lambda signum, frame: setattr(self, '_stop', True))
+        signal.signal(signal.SIGINT, lambda signum, frame: setattr(self, '_stop', True))
+
+        for _ in range(self.size):
+            self.spawn()
+        print(f'[serve] {self.size} workers listening on {self.host}:{self.port} '
+              f'(config={self.config_name}, pid={os.getpid()})', file=sys.stderr)
+
+        try:
+            while not self._stop:
+                if self._reload:
+                    self._reload = False
+                    self.reload()
+                self.reap()
+                time.sleep(0.2)
+        finally:
+            self.terminate([process for process, _ in self.workers.values()])
+            self.socket.close()
+            app.extensions['session_reaper'].stop()
+
+        # 所有 worker 都已結束：從資料庫補上它們寫入的資料後存下名次快照
+        with app.app_context(), shard_router.connect_all() as connections:
+            for name, connection in connections.items():
+                percentile_service.catch_up(connection, name)
+        app.extensions['percentile_service'].save(app.config['PERCENTILE_SNAPSHOT'])
+        print('[serve] stopped', file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the reaction game with a pool of worker processes')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='number of worker processes (default: CPU count)')
+    parser.add_argument('--bind', default='0.0.0.0:5000', help='host:port to listen on')
+    parser.add_argument('--config', default=os.environ.get('FLASK_CONFIG') or 'production',
+                        help='config name from config.py')
+    parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                        help='seconds to wait for a worker to finish before killing it')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--fd', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    host, port = parse_bind(args.bind)
+    if args.worker:
+        run_worker(args.config, host, port, args.fd)
+        return
+
+    Arbiter(args.config, host, port, max(1, args.workers), args.graceful_timeout).run()
+
+
+if __name__ == '__main__':
+    main()
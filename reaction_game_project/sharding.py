@@ -0,0 +1,138 @@
+import zlib
+from contextlib import ExitStack, contextmanager
+
+from flask.globals import app_ctx
+from sqlalchemy import MetaData, text
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+
+# 分片檔裡的 id 從 (shard + 1) << SHARD_ID_SHIFT 開始遞增，由 id 就能算出所在的分片；
+# 小於 1 << SHARD_ID_SHIFT 的 id 是分片之前就寫在主資料庫的資料
+SHARD_ID_SHIFT = 40
+
+# 放在分片檔的表格；user 留在主資料庫
+SHARDED_TABLES = ('game_session', 'game_round', 'user_stats', 'daily_stats')
+SEQUENCED_TABLES = ('game_session', 'game_round')
+
+
+def shard_bind_key(index):
+    return f'shard{index}'
+
+
+def shard_binds(count, uri_template):
+    """SQLALCHEMY_BINDS 設定：shard0 ... shard{count-1}"""
+    return {shard_bind_key(i): uri_template.format(index=i) for i in range(count)}
+
+
+def shard_for_user(user_id, count):
+    return zlib.crc32(str(user_id).encode('ascii')) % count
+
+
+def shard_for_id(row_id):
+    """id 所在的分片；主資料庫 (分片之前) 的 id 回傳 None"""
+    shard = (int(row_id) >> SHARD_ID_SHIFT) - 1
+    return shard if shard >= 0 else None
+
+
+def shard_metadata(metadata):
+    """分片用的 schema：複製模型的表格，game_session / game_round 改用 AUTOINCREMENT
+
+    AUTOINCREMENT 的序號記在 sqlite_sequence，可以事先設定起點。
+    """
+    copy = MetaData()
+    for table in metadata.sorted_tables:
+        shard_table = table.to_metadata(copy)
+        if shard_table.name in SEQUENCED_TABLES:
+            shard_table.dialect_kwargs['sqlite_autoincrement'] = True
+    return copy
+
+
+def init_shard(engine, index, metadata):
+    """建立分片的表格並設定 id 起點；可重複執行"""
+    metadata.create_all(engine, tables=[metadata.tables[name] for name in SHARDED_TABLES])
+    with engine.begin() as connection:
+        for name in SEQUENCED_TABLES:
+            connection.execute(text("""
+                INSERT INTO sqlite_sequence (name, seq)
+                SELECT :name, :base
+                WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)
+            """), {'name': name, 'base': (index + 1) << SHARD_ID_SHIFT})
+
+
+def _app_ctx_id():
+    # 與 Flask-SQLAlchemy 的 db.session 相同：每個 app context 一個 session
+    return id(app_ctx._get_current_object())
+
+
+class ShardRouter:
+    """依 user_id 把 game_session / game_round 分散到 K 個 SQLite 檔
+
+    每個分片是一個 SQLALCHEMY_BINDS 引擎，各自有寫入鎖，不同分片的寫入可以同時進行。
+    玩家以 user_id 的 hash 決定分片，會話與回合的 id 本身就帶有分片編號。
+    SHARD_COUNT = 0 (預設) 時不分片，所有方法都回傳主資料庫的 db.session / db.engine。
+    分片編號 None 代表主資料庫：分片之前寫入的會話與回合留在原處，不搬移。
+    """
+
+    def __init__(self, db=None):
+        self.db = db
+        self.count = 0
+        self._sessions = {}
+
+    def init_app(self, app, db=None):
+        if db is not None:
+            self.db = db
+        self.count = app.config.get('SHARD_COUNT') or 0
+        self._sessions = {}
+        with app.app_context():
+            for index in range(self.count):
+                factory = sessionmaker(bind=self.db.engines[shard_bind_key(index)], class_=Session)
+                self._sessions[index] = scoped_session(factory, scopefunc=_app_ctx_id)
+        app.teardown_appcontext(self._remove_sessions)
+        app.extensions['shard_router'] = self
+
+    def _remove_sessions(self, exc):
+        for scoped in self._sessions.values():
+            scoped.remove()
+
+    @property
+    def enabled(self):
+        return self.count > 0
+
+    def shards(self):
+        """所有存放會話與回合的資料庫：主資料庫 (None) 加上各分片"""
+        return [None] + list(range(self.count))
+
+    def shard_for_user(self, user_id):
+        return shard_for_user(user_id, self.count) if self.enabled else None
+
+    def shard_for_id(self, row_id):
+        return shard_for_id(row_id) if self.enabled else None
+
+    def session_for_shard(self, shard):
+        if shard is None:
+            return self.db.session
+        return self._sessions[shard]
+
+    def session_for_user(self, user_id):
+        return self.session_for_shard(self.shard_for_user(user_id))
+
+    def session_for_id(self, row_id):
+        """game_session / game_round 的 id 所在資料庫的 session；id 超出範圍時回傳 None"""
+        shard = self.shard_for_id(row_id)
+        if shard is not None and shard not in self._sessions:
+            return None
+        return self.session_for_shard(shard)
+
+    @contextmanager
+    def connect_all(self):
+        """同時開啟每個資料庫的連線，產生 {shard_name: connection}"""
+        with ExitStack() as stack:
+            yield {self.shard_name(shard): stack.enter_context(self.engine_for_shard(shard).connect())
+                   for shard in self.shards()}
+
+    def engine_for_shard(self, shard):
+        if shard is None:
+            return self.db.engine
+        return self.db.engines[shard_bind_key(shard)]
+
+    def shard_name(self, shard):
+        return 'default' if shard is None else shard_bind_key(shard)
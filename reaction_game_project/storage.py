@@ -0,0 +1,68 @@
+# 這個模組只在 configure_sqlite_engine 裡用到 SQLAlchemy，check_tables.py 可以直接匯入下面的清單
+
+# SQLite 連線參數：WAL 讓讀寫互不阻塞，synchronous=NORMAL 在 WAL 下只在 checkpoint 時 fsync
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,          # 毫秒，等待寫入鎖而不是直接報 database is locked
+    'cache_size': -64000,          # 負數代表 KiB，約 64 MB 的 page cache
+    'mmap_size': 268435456,        # 256 MB 記憶體映射讀取
+    'temp_store': 'MEMORY',
+}
+
+# 應用程式查詢會用到的索引 (名稱, 表格, 欄位, 部分索引的 WHERE 條件或 None)
+SQLITE_INDEXES = [
+    ('ix_game_round_session_round', 'game_round', ('session_id', 'round_number'), None),
+    ('ix_game_session_user_start', 'game_session', ('user_id', 'start_time'), None),
+    # 清理程式只找未結束的會話；部分索引只收未結束的列，大小與已結束的會話數無關
+    ('ix_game_session_open', 'game_session', ('start_time',), 'end_time IS NULL'),
+]
+
+
+def apply_pragmas(dbapi_connection, pragmas=SQLITE_PRAGMAS):
+    """在一條新的 DBAPI 連線上設定 PRAGMA"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def ensure_indexes(dbapi_connection, indexes=SQLITE_INDEXES):
+    """替既有的資料庫檔補上缺少的索引，可重複執行；回傳新建立的索引名稱"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'index')")
+        existing = {row[0] for row in cursor.fetchall()}
+
+        created = []
+        for name, table, columns, where in indexes:
+            # 表格還沒建立 (全新的資料庫) 時交給 create_all 處理
+            if table not in existing or name in existing:
+                continue
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({", ".join(columns)})'
+                           + (f' WHERE {where}' if where else ''))
+            created.append(name)
+        dbapi_connection.commit()
+        return created
+    finally:
+        cursor.close()
+
+
+def configure_sqlite_engine(engine, pragmas=SQLITE_PRAGMAS, indexes=SQLITE_INDEXES):
+    """透過連線事件套用 SQLite 儲存設定；非 SQLite 的引擎不做任何事"""
+    from sqlalchemy import event
+
+    if engine.dialect.name != 'sqlite':
+        return False
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, pragmas)
+
+    @event.listens_for(engine, 'first_connect')
+    def _on_first_connect(dbapi_connection, connection_record):
+        ensure_indexes(dbapi_connection, indexes)
+
+    return True
@@ -0,0 +1,100 @@
+"""測試共用的 fixture：每個測試一個暫存資料庫與自己的應用
+
+專案的模組以頂層名稱互相匯入 (from app import ...)，所以先把專案目錄放進 sys.path。
+資料庫一律用暫存目錄下的絕對路徑，不會碰到 instance/reaction_game.db。
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+import generate_data  # noqa: E402
+from app import create_app  # noqa: E402
+from archive import archive_sessions  # noqa: E402
+from config import config  # noqa: E402
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """回傳 make_app(**overrides)：以暫存資料庫建立應用，overrides 覆寫設定值"""
+    apps = []
+
+    def factory(**overrides):
+        name = f'test{len(apps)}'
+        settings = {
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / f"{name}.db"}',
+            'PERCENTILE_SNAPSHOT': str(tmp_path / f'{name}-percentiles.json'),
+            'PERCENTILE_SNAPSHOT_SAVE': False,
+            'REAPER_ENABLED': False,
+            'SHARD_COUNT': 0,
+            'EXPORT_API_TOKEN': None,
+        }
+        settings.update(overrides)
+        monkeypatch.setitem(config, name, type(name, (config['default'],), settings))
+        app = create_app(name)
+        apps.append(app)
+        return app
+
+    yield factory
+
+    for app in apps:
+        app.extensions['round_writer'].stop()
+        app.extensions['session_reaper'].stop()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+def start_game(app, username):
+    """註冊一位玩家並開始一局遊戲，回傳這位玩家的 test client"""
+    client = app.test_client()
+    client.post('/register', data={'username': username, 'age': 20})
+    client.get('/simple_reaction_game')
+    return client
+
+
+def make_rounds(count, reaction_time=300):
+    return [{'round_number': i + 1, 'stimulus_color': 'red', 'reaction_time': reaction_time,
+             'response_accuracy': True} for i in range(count)]
+
+
+@pytest.fixture
+def analysis_db(tmp_path, monkeypatch):
+    """在暫存目錄產生 instance/reaction_game.db (部分會話已封存)，並切換到該目錄"""
+    path = tmp_path / 'instance' / 'reaction_game.db'
+    path.parent.mkdir()
+    generate_data.create_schema(str(path))
+    options = argparse.Namespace(sessions_per_user=3.0, median_ms=420.0, days=30.0, gap_hours=36.0,
+                                 start_us=int(datetime(2025, 1, 1).timestamp() * 1e6))
+    generate_data.generate(str(path), 1, 25, options, 7)
+
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.connect() as connection:
+        assert archive_sessions(connection, datetime(2025, 1, 15))['archived'] > 0
+    engine.dispose()
+
+    monkeypatch.chdir(tmp_path)
+    return path
+
+
+def assert_same_aggregates(expected, actual):
+    """compute_aggregates 的結果逐項相同 (表格忽略索引與型別)"""
+    assert expected.keys() == actual.keys()
+    for key, value in expected.items():
+        other = actual[key]
+        if isinstance(value, pd.DataFrame):
+            pd.testing.assert_frame_equal(value.reset_index(drop=True), other.reset_index(drop=True),
+                                          check_dtype=False, obj=key)
+        else:
+            assert other == pytest.approx(value), key
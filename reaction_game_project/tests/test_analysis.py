@@ -0,0 +1,92 @@
+"""分析的不同讀取方式 (pandas、SQL 彙總、串流) 在同一個資料庫上算出相同的結果"""
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import analysis_aggregates
+import analysis_report
+import reaction_analysis_fixed as analysis
+from analysis_aggregates import compute_aggregates
+from archive import PackedRounds
+from conftest import PROJECT_DIR, assert_same_aggregates
+
+
+@pytest.fixture
+def expected(analysis_db):
+    aggregates = compute_aggregates(*analysis.check_and_load_data(use_cache=False))
+    assert aggregates['totals']['rounds'] > 0
+    return aggregates
+
+
+def test_sql_matches_pandas(expected):
+    assert_same_aggregates(expected, analysis.check_and_aggregate_in_sql())
+
+
+def test_stream_matches_pandas(expected):
+    # 區塊刻意取小，跨區塊的會話與玩家也要合併正確
+    assert_same_aggregates(expected, analysis.check_and_stream_data(chunk_size=7))
+
+
+@pytest.fixture
+def archive_batches(monkeypatch):
+    """Sizes of the archived round batches decoded while the test runs"""
+    sizes = []
+    decode = analysis_aggregates._archived_frame
+
+    def spy(archives):
+        frame = decode(archives)
+        sizes.append(len(frame))
+        return frame
+
+    monkeypatch.setattr(analysis_aggregates, '_archived_frame', spy)
+    return sizes
+
+
+@pytest.mark.parametrize('mode', ['sql', 'stream'])
+def test_archives_are_decoded_in_batches(analysis_db, expected, archive_batches, monkeypatch, mode):
+    def load_all(*args):
+        raise AssertionError('archived rounds loaded into one frame')
+
+    monkeypatch.setattr(analysis_aggregates, 'archived_rounds_frame', load_all)
+    monkeypatch.setattr(analysis_aggregates, 'ARCHIVE_BATCH_ROUNDS', 40)
+    if mode == 'sql':
+        limit = 40
+        assert_same_aggregates(expected, analysis.check_and_aggregate_in_sql())
+    else:
+        limit = 7
+        assert_same_aggregates(expected, analysis.check_and_stream_data(chunk_size=limit))
+
+    with sqlite3.connect(analysis_db) as conn:
+        raw_rounds = conn.execute('SELECT COUNT(*) FROM game_round').fetchone()[0]
+        longest = max(len(PackedRounds(blob)) for blob, in conn.execute(
+            'SELECT rounds_archive FROM game_session WHERE rounds_archive IS NOT NULL'))
+    # 每批以整個會話為單位，最多超出上限一個會話的回合數
+    assert len(archive_batches) > 1
+    assert max(archive_batches) < limit + longest
+    assert sum(archive_batches) == expected['totals']['rounds'] - raw_rounds
+
+
+def test_text_mode_matches_pandas(analysis_db, expected):
+    aggregates = analysis_report.text_aggregates([str(analysis_db)])
+    assert aggregates['totals'] == expected['totals']
+    assert aggregates['summary'] == pytest.approx(expected['summary'])
+    assert [level.count for level in aggregates['levels']] == expected['levels']['count'].tolist()
+
+
+def test_text_mode_does_not_import_numpy(analysis_db):
+    script = ('import sys, analysis_report; '
+              f'analysis_report.text_aggregates([{str(analysis_db)!r}]); '
+              "print(sorted({'numpy', 'pandas', 'sqlalchemy'} & set(sys.modules)))")
+    output = subprocess.run([sys.executable, '-c', script], cwd=PROJECT_DIR, check=True,
+                            capture_output=True, text=True).stdout
+    assert output.strip() == '[]'
+
+
+def test_text_mode_rejects_unknown_archive_version(analysis_db):
+    with sqlite3.connect(analysis_db) as conn:
+        conn.execute("UPDATE game_session SET rounds_archive = X'52410900000000000000' "
+                     "WHERE id = (SELECT MIN(id) FROM game_session WHERE rounds_archive IS NOT NULL)")
+    with pytest.raises(ValueError, match='not a rounds archive'):
+        analysis_report.text_aggregates([str(analysis_db)])
@@ -0,0 +1,90 @@
+"""分析的增量欄式快取 (analysis_cache)：只讀新資料，結果與直接讀資料庫相同"""
+import re
+import sqlite3
+from datetime import datetime
+
+from sqlalchemy import create_engine
+
+import reaction_analysis_fixed as analysis
+from analysis_aggregates import compute_aggregates
+from archive import archive_sessions
+from conftest import assert_same_aggregates
+
+
+def _aggregates(cache_dir, use_cache=True):
+    return compute_aggregates(*analysis.check_and_load_data(use_cache=use_cache, cache_base=str(cache_dir)))
+
+
+def _cache_counts(output):
+    """各表 (快取中的列數, 這次新讀的列數)"""
+    return {name: (int(cached), int(new))
+            for name, cached, new in re.findall(r'Cache (\w+): (\d+) cached \+ (\d+) new rows', output)}
+
+
+def _open_session(path, rounds):
+    """替第一位玩家加一局還沒結束的會話與其回合，回傳會話 id"""
+    with sqlite3.connect(path) as conn:
+        session_id = conn.execute('SELECT MAX(id) FROM game_session').fetchone()[0] + 1
+        round_id = conn.execute('SELECT MAX(id) FROM game_round').fetchone()[0]
+        conn.execute('INSERT INTO game_session (id, user_id, start_time, total_rounds, correct_responses)'
+                     " VALUES (?, 1, '2025-02-10 10:00:00.000000', 0, 0)", (session_id,))
+        conn.executemany(
+            'INSERT INTO game_round (id, session_id, round_number, stimulus_color, reaction_time,'
+            " response_accuracy) VALUES (?, ?, ?, 'red', ?, 1)",
+            [(round_id + i + 1, session_id, i + 1, 300 + i) for i in range(rounds)])
+    return session_id
+
+
+def test_cache_matches_direct_read(analysis_db, tmp_path, capsys):
+    expected = _aggregates(tmp_path / 'cache', use_cache=False)
+    assert_same_aggregates(expected, _aggregates(tmp_path / 'cache'))
+    first = _cache_counts(capsys.readouterr().out)
+    assert all(cached == 0 for cached, _ in first.values())
+
+    # 第二次全部來自快取
+    assert_same_aggregates(expected, _aggregates(tmp_path / 'cache'))
+    second = _cache_counts(capsys.readouterr().out)
+    assert second == {name: (new, 0) for name, (_, new) in first.items()}
+
+
+def test_new_rows_and_open_sessions(analysis_db, tmp_path, capsys):
+    _aggregates(tmp_path / 'cache')
+    before = _cache_counts(capsys.readouterr().out)
+
+    session_id = _open_session(analysis_db, 4)
+    assert_same_aggregates(_aggregates(tmp_path / 'cache', use_cache=False), _aggregates(tmp_path / 'cache'))
+    counts = _cache_counts(capsys.readouterr().out)
+    assert counts['sessions'] == (before['sessions'][1], 1)
+    assert counts['rounds'] == (before['rounds'][1], 4)
+
+    # 快取時還沒結束的會話在下次讀取時更新
+    with sqlite3.connect(analysis_db) as conn:
+        conn.execute("UPDATE game_session SET end_time = '2025-02-10 10:05:00.000000', total_rounds = 4,"
+                     ' correct_responses = 4, average_reaction_time = 301.5 WHERE id = ?', (session_id,))
+    expected = _aggregates(tmp_path / 'cache', use_cache=False)
+    assert_same_aggregates(expected, _aggregates(tmp_path / 'cache'))
+    assert _cache_counts(capsys.readouterr().out)['sessions'][1] == 0
+    assert expected['totals']['sessions'] == before['sessions'][1] + 1
+
+
+def test_rounds_archived_after_caching(analysis_db, tmp_path, capsys):
+    _aggregates(tmp_path / 'cache')
+    engine = create_engine(f'sqlite:///{analysis_db}')
+    with engine.connect() as connection:
+        assert archive_sessions(connection, datetime(2025, 1, 25))['archived'] > 0
+    engine.dispose()
+
+    # 已快取的回合被封存刪除：不能少算也不能與解開的封存重複計算
+    expected = _aggregates(tmp_path / 'cache', use_cache=False)
+    assert_same_aggregates(expected, _aggregates(tmp_path / 'cache'))
+    assert_same_aggregates(expected, _aggregates(tmp_path / 'cache'))
+
+
+def test_replaced_database_resets_the_cache(analysis_db, tmp_path, capsys):
+    _aggregates(tmp_path / 'cache')
+    with sqlite3.connect(analysis_db) as conn:
+        conn.execute('DELETE FROM game_round WHERE id > (SELECT MIN(id) + 9 FROM game_round)')
+    capsys.readouterr()
+
+    assert_same_aggregates(_aggregates(tmp_path / 'cache', use_cache=False), _aggregates(tmp_path / 'cache'))
+    assert _cache_counts(capsys.readouterr().out)['rounds'] == (0, 10)
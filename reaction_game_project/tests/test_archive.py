@@ -0,0 +1,51 @@
+"""回合封存格式 (archive.pack_rounds / PackedRounds)"""
+import numpy as np
+
+from archive import ArchivedRound, PackedRounds, pack_rounds
+
+
+def test_round_trip():
+    numbers = [1, 2, 3, 4, 5, 6, 7, 8, 9]
+    colors = ['red', 'green', None, 'red', 'blue', 'green', 'red', None, 'blue']
+    times = [310, None, 0, 32767, 250, 400, 199, None, 801]
+    accuracies = [True, False, 1, 0, None, True, True, False, True]
+
+    packed = PackedRounds(pack_rounds(numbers, colors, times, accuracies))
+
+    assert len(packed) == 9
+    assert packed.rounds() == [ArchivedRound(n, c, t, bool(a))
+                               for n, c, t, a in zip(numbers, colors, times, accuracies)]
+    assert packed.reaction_time_null.tolist() == [t is None for t in times]
+    # 數值陣列直接指向 BLOB，不是複本
+    assert not packed.round_number.flags.owndata
+    assert packed.round_number.dtype == np.dtype('<i2')
+
+
+def test_single_round_without_colors():
+    packed = PackedRounds(pack_rounds([1], [None], [None], [False]))
+    assert packed.colors == []
+    assert packed.rounds() == [ArchivedRound(1, None, None, False)]
+
+
+def test_values_that_cannot_be_packed():
+    assert pack_rounds([], [], [], []) is None
+    # 超出 int16 或與 NULL 標記衝突
+    assert pack_rounds([0x8000], ['red'], [300], [True]) is None
+    assert pack_rounds([1], ['red'], [-32768], [True]) is None
+    # SQLite 不強制欄位型別，舊資料可能是 TEXT 或 REAL
+    assert pack_rounds(['1'], ['red'], [300], [True]) is None
+    assert pack_rounds([1], ['red'], ['300'], [True]) is None
+    assert pack_rounds([1], ['red'], [300.5], [True]) is None
+    assert pack_rounds([1], [3], [300], [True]) is None
+    assert pack_rounds([1], ['red'], [300], ['1']) is None
+    # 顏色名稱含有字典的分隔字元
+    assert pack_rounds([1], ['re\x1fd'], [300], [True]) is None
+
+
+def test_round_ids():
+    blob = pack_rounds([1, 2, 3], ['red'] * 3, [300, 310, 320], [True] * 3, round_ids=(70, 12, 4000000000))
+    assert PackedRounds(blob).round_ids.tolist() == [70, 12, 4000000000]
+    # 沒有 id 的舊格式 (版本 1) 仍然讀得出來
+    assert PackedRounds(pack_rounds([1], ['red'], [300], [True])).round_ids is None
+    # 差距超過 uint32
+    assert pack_rounds([1, 2], ['red'] * 2, [300, 300], [True] * 2, round_ids=(1, 2 ** 33)) is None
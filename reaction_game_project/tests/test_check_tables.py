@@ -0,0 +1,48 @@
+"""唯讀的資料庫檢查 (check_tables.py)"""
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import check_tables
+from conftest import PROJECT_DIR
+from storage import SQLITE_INDEXES
+
+
+def test_does_not_import_sqlalchemy():
+    script = "import sys, check_tables; print('sqlalchemy' in sys.modules)"
+    output = subprocess.run([sys.executable, '-c', script], cwd=PROJECT_DIR, check=True,
+                            capture_output=True, text=True).stdout
+    assert output.strip() == 'False'
+
+
+def test_app_database_has_indexes_and_no_full_scans(app, capsys):
+    path = app.config['SQLALCHEMY_DATABASE_URI'].removeprefix('sqlite:///')
+    with sqlite3.connect(path) as conn:
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {name for name, _, _, _ in SQLITE_INDEXES} <= existing
+
+    assert check_tables.inspect(path) == 0
+    output = capsys.readouterr().out
+    assert '缺少索引' not in output
+    assert 'ix_game_session_open' in output
+
+
+def test_reports_missing_indexes(app, capsys):
+    path = app.config['SQLALCHEMY_DATABASE_URI'].removeprefix('sqlite:///')
+    with sqlite3.connect(path) as conn:
+        conn.execute('DROP INDEX ix_game_session_open')
+
+    # 沒有部分索引時清理程式的查詢只能掃描整個 game_session
+    assert check_tables.inspect(path) > 0
+    output = capsys.readouterr().out
+    assert '缺少索引 ix_game_session_open (game_session)' in output
+    assert '全表掃描' in output
+
+
+def test_missing_file_is_not_created(tmp_path):
+    path = tmp_path / 'missing.db'
+    with pytest.raises(FileNotFoundError):
+        check_tables.inspect(str(path))
+    assert not path.exists()
@@ -0,0 +1,59 @@
+"""反應時間分布：每毫秒的計數、1 ms 直方圖與以 FFT 計算的 KDE"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis_aggregates import (binned_kde, distribution_summary, reaction_distribution,
+                                 reaction_histogram)
+
+
+@pytest.fixture
+def reactions():
+    rng = np.random.default_rng(3)
+    return np.clip(rng.lognormal(np.log(400), 0.25, 5000), 100, 799).astype(np.int64)
+
+
+def _direct_kde(samples, grid, bandwidth):
+    """逐一加總每個樣本的高斯核 (gaussian_kde 的定義)"""
+    z = (grid[:, None] - samples[None, :]) / bandwidth
+    return np.exp(-0.5 * z ** 2).sum(axis=1) / (len(samples) * bandwidth * np.sqrt(2 * np.pi))
+
+
+def test_summary_matches_the_raw_samples(reactions):
+    summary = distribution_summary(reaction_distribution(reactions))
+    assert summary['count'] == len(reactions)
+    assert summary['mean'] == pytest.approx(reactions.mean())
+    assert summary['median'] == np.median(reactions)
+    assert summary['std'] == pytest.approx(reactions.std(ddof=1))
+    assert (summary['min'], summary['max']) == (reactions.min(), reactions.max())
+
+
+def test_histogram_has_fixed_1ms_bins():
+    distribution = pd.DataFrame({'reaction_time': [0, 12.7, 799, 800, -3], 'count': [1, 2, 3, 4, 5]})
+    histogram = reaction_histogram(distribution)
+    # [800, ∞) 與負值不在圖表範圍內
+    assert len(histogram) == 800 and histogram.sum() == 6
+    assert (histogram[0], histogram[12], histogram[799]) == (1, 2, 3)
+
+
+@pytest.mark.parametrize('cut', [0, 3])
+def test_binned_kde_equals_kde_of_the_samples(reactions, cut):
+    summary = distribution_summary(reaction_distribution(reactions))
+    grid, density = binned_kde(reaction_histogram(reaction_distribution(reactions)),
+                               summary['count'], summary['std'], cut=cut)
+
+    bandwidth = reactions.std(ddof=1) * len(reactions) ** (-1 / 5)
+    assert grid[0] == reactions.min() - np.ceil(cut * bandwidth)
+    assert grid[-1] == reactions.max() + np.ceil(cut * bandwidth)
+    np.testing.assert_allclose(density, _direct_kde(reactions, grid, bandwidth), rtol=0, atol=1e-12)
+    if cut:
+        # 往外延伸 3 個頻寬後，曲線下的面積接近 1
+        assert density.sum() == pytest.approx(1, abs=1e-3)
+
+
+def test_binned_kde_needs_spread():
+    histogram = np.zeros(800, dtype=np.int64)
+    assert binned_kde(histogram, 0, float('nan')) is None
+    histogram[300] = 5
+    assert binned_kde(histogram, 5, 0.0) is None
+    assert binned_kde(histogram, 1, float('nan')) is None
@@ -0,0 +1,126 @@
+"""原始資料匯出 (export.py)：/api/export 的權限、篩選、格式與 gzip"""
+import csv
+import gzip
+import io
+import json
+import zlib
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from archive import archive_sessions
+from conftest import make_rounds, start_game
+
+TOKEN = 'secret-token'
+
+
+@pytest.fixture
+def export_app(make_app):
+    """alice 三個回合 (已封存)、bob 兩個回合 (第二個答錯)"""
+    app = make_app(EXPORT_API_TOKEN=TOKEN)
+    alice = start_game(app, 'alice')
+    alice.post('/api/record_rounds', json={'rounds': make_rounds(3, 250)})
+    alice.post('/api/end_session')
+    bob = start_game(app, 'bob')
+    rounds = make_rounds(2, 400)
+    rounds[1]['response_accuracy'] = False
+    bob.post('/api/record_rounds', json={'rounds': rounds})
+    bob.post('/api/end_session')
+
+    with app.app_context():
+        # bob 的會話有最大的回合 id，不會被封存
+        assert archive_sessions(db.session, datetime.utcnow() + timedelta(hours=1))['archived'] == 1
+    return app
+
+
+def _get(app, path, token=TOKEN):
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    return app.test_client().get(path, headers=headers)
+
+
+def _csv(response):
+    return list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+
+
+def test_disabled_without_token(app):
+    assert app.test_client().get('/api/export/rounds').status_code == 404
+
+
+def test_requires_bearer_token(export_app):
+    for token in (None, 'wrong'):
+        response = _get(export_app, '/api/export/rounds', token)
+        assert response.status_code == 401
+        assert response.headers['WWW-Authenticate'] == 'Bearer'
+    assert _get(export_app, '/api/export/rounds').status_code == 200
+
+
+def test_rounds_include_archived_sessions(export_app):
+    response = _get(export_app, '/api/export/rounds')
+    assert response.mimetype == 'text/csv'
+    assert response.headers['Content-Disposition'] == 'attachment; filename=rounds.csv'
+    rows = _csv(response)
+    assert [(row['username'], row['round_number'], row['reaction_time'], row['response_accuracy'])
+            for row in rows] == [('alice', '1', '250', '1'), ('alice', '2', '250', '1'), ('alice', '3', '250', '1'),
+                                 ('bob', '1', '400', '1'), ('bob', '2', '400', '0')]
+    assert rows[0]['age'] == '20' and rows[0]['session_end']
+
+
+def test_ndjson(export_app):
+    response = _get(export_app, '/api/export/rounds?format=ndjson')
+    assert response.mimetype == 'application/x-ndjson'
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [record['response_accuracy'] for record in records] == [True, True, True, True, False]
+
+    sessions = _get(export_app, '/api/export/sessions?format=ndjson').get_data(as_text=True).splitlines()
+    assert [(s['username'], s['total_rounds'], s['correct_responses'], s['average_reaction_time'])
+            for s in map(json.loads, sessions)] == [('alice', 3, 3, 250), ('bob', 2, 1, 400)]
+
+
+def test_gzip_streams_the_same_content(export_app):
+    plain = _get(export_app, '/api/export/sessions').data
+    response = _get(export_app, '/api/export/sessions?gzip=1')
+    assert response.mimetype == 'application/gzip'
+    assert response.headers['Content-Disposition'] == 'attachment; filename=sessions.csv.gz'
+    assert gzip.decompress(response.data) == plain
+
+    # 表頭在第一段就能解壓出來，不必等整個檔案
+    chunks = iter(_get(export_app, '/api/export/sessions?gzip=1').response)
+    decompressor = zlib.decompressobj(31)
+    header = decompressor.decompress(next(chunks) + next(chunks))
+    assert header.startswith(b'user_id,username,age,session_id')
+
+
+def test_filters(export_app):
+    assert {row['username'] for row in _csv(_get(export_app, '/api/export/rounds?username=bob'))} == {'bob'}
+    assert len(_csv(_get(export_app, '/api/export/sessions?user_id=1'))) == 1
+
+    today = datetime.utcnow().date()
+    yesterday = (today - timedelta(days=1)).isoformat()
+    assert len(_csv(_get(export_app, f'/api/export/sessions?since={today}&until={today}'))) == 2
+    # 篩掉所有會話時仍有表頭
+    response = _get(export_app, f'/api/export/rounds?until={yesterday}')
+    assert response.get_data(as_text=True).splitlines() == [','.join(
+        ['user_id', 'username', 'age', 'session_id', 'session_start', 'session_end',
+         'round_number', 'stimulus_color', 'reaction_time', 'response_accuracy'])]
+
+
+@pytest.mark.parametrize('path, status, error', [
+    ('/api/export/users', 404, 'Unknown export kind'),
+    ('/api/export/rounds?format=xml', 400, 'Invalid format'),
+    ('/api/export/rounds?since=2025-13-01', 400, 'Invalid date, expected YYYY-MM-DD'),
+    ('/api/export/rounds?username=nobody', 400, 'User not found'),
+])
+def test_invalid_requests(export_app, path, status, error):
+    response = _get(export_app, path)
+    assert response.status_code == status
+    assert response.json == {'success': False, 'error': error}
+
+
+def test_cli_matches_api(export_app, tmp_path):
+    output = tmp_path / 'rounds.ndjson.gz'
+    result = export_app.test_cli_runner().invoke(
+        args=['export', 'rounds', '--format', 'ndjson', '--gzip', '--username', 'alice', '-o', str(output)])
+    assert result.exit_code == 0, result.output
+    assert gzip.decompress(output.read_bytes()) == \
+        _get(export_app, '/api/export/rounds?format=ndjson&username=alice').data
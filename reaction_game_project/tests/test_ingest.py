@@ -0,0 +1,100 @@
+"""回合延後寫入佇列 (ingest.RoundWriter) 與 /api/record_round(s) 的驗證"""
+import pytest
+
+from app import GameRound, db
+from conftest import make_rounds, start_game
+
+
+def test_end_session_flushes_queued_rounds(make_app):
+    # 間隔拉長，回合在 end_session 時一定還在佇列中
+    app = make_app(INGEST_FLUSH_INTERVAL=2.0, INGEST_FLUSH_TIMEOUT=10.0)
+    client = start_game(app, 'alice')
+
+    response = client.post('/api/record_rounds', json={'rounds': make_rounds(5)}).json
+    assert response['success'] and response['queued']
+
+    result = client.post('/api/end_session').json
+    assert result['success']
+    assert result['total_rounds'] == 5
+    assert result['correct_responses'] == 5
+    assert app.extensions['round_writer'].stats()['queue_depth'] == 0
+
+
+def test_failed_submission_does_not_drop_others(make_app):
+    app = make_app(INGEST_FLUSH_INTERVAL=0.5)
+    writer = app.extensions['round_writer']
+    good, bad = start_game(app, 'good'), start_game(app, 'bad')
+    session_id = good.post('/api/record_round', json=make_rounds(1)[0]).json['session_id']
+    bad_session = bad.post('/api/record_round', json=make_rounds(1)[0]).json['session_id']
+
+    # 略過 API 的驗證，直接放進一筆寫不進 SQLite 的回合，與其他會話的回合合併成同一個交易
+    with app.app_context():
+        writer.submit([dict(make_rounds(1)[0], round_number=2, session_id=bad_session, stimulus_color=['x'])])
+    assert good.post('/api/end_session').json['total_rounds'] == 1
+
+    stats = writer.stats()
+    assert stats['rows_failed'] == 1
+    assert stats['rows_written'] == 2
+    with app.app_context():
+        assert db.session.query(GameRound).filter_by(session_id=session_id).count() == 1
+        assert db.session.query(GameRound).filter_by(session_id=bad_session).count() == 1
+
+    # 失敗的回合已經回應過成功：end_session 拒絕結束缺少回合的會話，直到清理程式接手
+    assert bad.post('/api/end_session').json == {
+        'success': False, 'error': 'Some rounds were not saved', 'rounds_failed': 1}
+    assert stats['sessions_with_failures'] == 1
+    with app.app_context():
+        assert app.extensions['session_reaper'].run_once(stale_minutes=0)['finalized'] == 1
+    assert writer.failed_rounds(bad_session) == 0
+
+
+def test_waiting_caller_gets_the_failure(make_app):
+    app = make_app(INGEST_WAIT=True)
+    client = start_game(app, 'alice')
+    session_id = client.post('/api/record_round', json=make_rounds(1)[0]).json['session_id']
+
+    with app.app_context(), pytest.raises(RuntimeError):
+        app.extensions['round_writer'].submit([dict(make_rounds(1)[0], session_id=session_id, stimulus_color=['x'])])
+    # 呼叫端已經知道失敗，不再記到會話上
+    assert client.post('/api/end_session').json['success']
+
+
+def test_overflow_writes_synchronously(make_app):
+    app = make_app(INGEST_QUEUE_SIZE=3)
+    client = start_game(app, 'alice')
+
+    response = client.post('/api/record_rounds', json={'rounds': make_rounds(4)}).json
+    assert response['success'] and not response['queued']
+    stats = app.extensions['round_writer'].stats()
+    assert stats['overflow_writes'] == 1
+    assert stats['queue_capacity'] == 3
+
+
+@pytest.mark.parametrize('field, value, error', [
+    ('round_number', 'x', 'Invalid round_number'),
+    ('round_number', 0x8000, 'round_number out of range'),
+    ('reaction_time', 1e30, 'reaction_time out of range'),
+    ('reaction_time', -1, 'reaction_time out of range'),
+    ('reaction_time', True, 'Invalid reaction_time'),
+    ('stimulus_color', ['x'], 'Invalid stimulus_color'),
+    ('stimulus_color', 'x' * 21, 'Invalid stimulus_color'),
+    ('response_accuracy', 'yes', 'Invalid response_accuracy'),
+])
+def test_invalid_round_is_rejected(app, field, value, error):
+    client = start_game(app, 'alice')
+    round_data = dict(make_rounds(1)[0], **{field: value})
+
+    assert client.post('/api/record_round', json=round_data).json == {'success': False, 'error': error}
+    # 批次中任何一筆不合法時整批拒絕
+    response = client.post('/api/record_rounds', json={'rounds': make_rounds(2) + [round_data]}).json
+    assert response == {'success': False, 'error': error}
+    assert app.extensions['round_writer'].stats()['rows_written'] == 0
+
+
+def test_too_many_rounds_per_request(make_app):
+    app = make_app(INGEST_MAX_ROUNDS_PER_REQUEST=10)
+    client = start_game(app, 'alice')
+
+    response = client.post('/api/record_rounds', json={'rounds': make_rounds(11)}).json
+    assert response == {'success': False, 'error': 'Too many rounds'}
+    assert client.post('/api/record_rounds', json={'rounds': make_rounds(10)}).json['recorded'] == 10
@@ -0,0 +1,124 @@
+"""多個資料庫的 map-reduce 分析 (analysis_parallel)：合併結果等於把各檔依序併成一個資料庫再分析"""
+import argparse
+import sqlite3
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+
+import generate_data
+import reaction_analysis_fixed as analysis
+from analysis_aggregates import rollup_aggregates, sql_aggregates, stream_aggregates, with_archived_rounds
+from analysis_parallel import expand_databases, map_reduce
+from archive import archive_sessions
+from conftest import assert_same_aggregates
+
+
+def _generate(path, first_user_id, n_users, seed):
+    generate_data.create_schema(str(path))
+    options = argparse.Namespace(sessions_per_user=3.0, median_ms=420.0, days=30.0, gap_hours=36.0,
+                                 start_us=int(datetime(2025, 1, 1).timestamp() * 1e6))
+    generate_data.generate(str(path), first_user_id, n_users, options, seed)
+
+
+def _append(combined, part):
+    """把 part 接在 combined 後面：玩家依名稱合併，會話與回合的 id 往後平移"""
+    conn = sqlite3.connect(combined)
+    conn.execute('ATTACH DATABASE ? AS part', (str(part),))
+    session_offset = conn.execute('SELECT COALESCE(MAX(id), 0) FROM main.game_session').fetchone()[0]
+    round_offset = conn.execute('SELECT COALESCE(MAX(id), 0) FROM main.game_round').fetchone()[0]
+    conn.execute("""
+        INSERT INTO main.user (username, age, created_at)
+        SELECT username, age, created_at FROM part.user
+        WHERE username NOT IN (SELECT username FROM main.user) ORDER BY id
+    """)
+    columns = [row[1] for row in conn.execute('PRAGMA part.table_info(game_session)')
+               if row[1] not in ('id', 'user_id')]
+    conn.execute(f"""
+        INSERT INTO main.game_session (id, user_id, {', '.join(columns)})
+        SELECT gs.id + ?, u.id, {', '.join(f'gs.{name}' for name in columns)}
+        FROM part.game_session gs
+        JOIN part.user pu ON pu.id = gs.user_id
+        JOIN main.user u ON u.username = pu.username
+        ORDER BY gs.id
+    """, (session_offset,))
+    conn.execute("""
+        INSERT INTO main.game_round (id, session_id, round_number, stimulus_color, reaction_time,
+                                     response_accuracy)
+        SELECT id + ?, session_id + ?, round_number, stimulus_color, reaction_time, response_accuracy
+        FROM part.game_round ORDER BY id
+    """, (round_offset, session_offset))
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def kiosks(tmp_path):
+    """三台機器各一個資料庫，以及依序併成的單一資料庫 combined.db
+
+    kiosk2 與 kiosk1 有同名玩家但 id 不同，kiosk3 的玩家只在那裡；kiosk1 有封存的會話。
+    """
+    paths = [tmp_path / f'kiosk{i}.db' for i in (1, 2, 3)]
+    _generate(paths[0], 1, 12, 1)
+    _generate(paths[1], 6, 10, 2)
+    _generate(paths[2], 40, 4, 3)
+    with sqlite3.connect(paths[1]) as conn:
+        conn.execute('UPDATE game_session SET user_id = user_id + 100')
+        conn.execute('UPDATE user SET id = id + 100')
+    engine = create_engine(f'sqlite:///{paths[0]}')
+    with engine.connect() as connection:
+        assert archive_sessions(connection, datetime(2025, 1, 15))['archived'] > 0
+    engine.dispose()
+
+    combined = tmp_path / 'combined.db'
+    generate_data.create_schema(str(combined))
+    for path in paths:
+        _append(combined, path)
+    for path in paths + [combined]:
+        generate_data.rebuild_rollups(str(path))
+    return [str(path) for path in paths], str(combined)
+
+
+def _single_pass(path, mode):
+    with sqlite3.connect(path) as conn:
+        if mode == 'rollup':
+            return rollup_aggregates(conn, 'user')
+        if mode == 'stream':
+            return stream_aggregates(conn, 'user', 'game_session', 'game_round', 50)
+        return sql_aggregates(conn, 'user', 'game_session', with_archived_rounds(conn, 'game_session', 'game_round'))
+
+
+@pytest.mark.parametrize('mode', ['sql', 'stream', 'rollup'])
+@pytest.mark.parametrize('processes', [1, 3])
+def test_merged_equals_single_pass(kiosks, mode, processes):
+    paths, combined = kiosks
+    expected = _single_pass(combined, mode)
+    # kiosk2 的 10 位玩家有 7 位也在 kiosk1
+    assert expected['totals']['users'] == 12 + 3 + 4
+
+    assert_same_aggregates(expected, map_reduce(paths, mode, chunk_size=50, processes=processes))
+
+
+def test_expand_databases(kiosks, tmp_path, monkeypatch):
+    paths, _ = kiosks
+    monkeypatch.chdir(tmp_path)
+    # 依參數順序、去掉重複；glob 依自然順序
+    assert expand_databases(['kiosk2.db', 'kiosk*.db']) == ['kiosk2.db', 'kiosk1.db', 'kiosk3.db']
+    with pytest.raises(FileNotFoundError, match='No database matches missing'):
+        expand_databases(['kiosk1.db', 'missing*.db'])
+
+
+def test_report_with_databases(kiosks, tmp_path, capsys):
+    paths, combined = kiosks
+    aggregates = analysis.check_and_map_reduce(paths, 'sql', processes=2)
+    assert 'Merged partial aggregates from 3 databases' in capsys.readouterr().out
+    assert aggregates['totals'] == _single_pass(combined, 'sql')['totals']
+
+    # 缺少表格的檔案回報錯誤而不是中斷
+    empty = tmp_path / 'empty.db'
+    sqlite3.connect(empty).close()
+    with sqlite3.connect(paths[2]) as conn:
+        conn.execute('DROP TABLE daily_stats')
+    assert analysis.check_and_map_reduce([str(empty)]) is None
+    assert analysis.check_and_map_reduce(paths, 'rollup') is None
+    assert 'needs the user_stats and daily_stats tables' in capsys.readouterr().out
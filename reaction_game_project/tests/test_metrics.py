@@ -0,0 +1,76 @@
+"""請求耗時拆解 (metrics.RequestMetrics) 與 /metrics 輸出"""
+import logging
+
+from conftest import make_rounds, start_game
+from metrics import Histogram, _labels
+
+
+def _samples(text):
+    """/metrics 的樣本：{'名稱{標籤}': 數值}"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_histogram_is_cumulative():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    # 超過最後一個上界的值只算進 count (+Inf)
+    assert list(histogram.cumulative()) == [(0.1, 2), (1.0, 3)]
+    assert histogram.count == 4 and histogram.sum == 3.65
+
+
+def test_labels_are_escaped():
+    assert _labels(endpoint='a"b\\c\nd') == '{endpoint="a\\"b\\\\c\\nd"}'
+
+
+def test_request_breakdown(app):
+    client = start_game(app, 'alice')
+    client.post('/api/record_rounds', json={'rounds': make_rounds(3)})
+    client.post('/api/end_session')
+    client.get('/no-such-page')
+
+    response = app.test_client().get('/metrics')
+    assert response.headers['Content-Type'] == 'text/plain; version=0.0.4; charset=utf-8'
+    text = response.get_data(as_text=True)
+    samples = _samples(text)
+
+    end_session = _labels(method='POST', endpoint='/api/end_session')
+    assert samples[f'app_requests_total{_labels(method="POST", endpoint="/api/end_session", status=200)}'] == 1
+    assert samples[f'app_requests_total{_labels(method="GET", endpoint="unmatched", status=404)}'] == 1
+    assert samples[f'app_request_duration_seconds_count{end_session}'] == 1
+    assert samples['app_request_duration_seconds_bucket'
+                   f'{_labels(method="POST", endpoint="/api/end_session", le="+Inf")}'] == 1
+    # 結束會話要查詢、更新並計入彙總表，在同一個交易內 commit
+    assert samples[f'app_sql_statements_total{end_session}'] >= 3
+    assert samples[f'app_db_commits_total{end_session}'] == 1
+    assert samples[f'app_template_seconds_total{_labels(method="GET", endpoint="/simple_reaction_game")}'] > 0
+
+    # 延後寫入佇列在背景執行緒寫入
+    assert samples[f'app_sql_statements_total{_labels(method="-", endpoint="background")}'] > 0
+    assert samples[f'app_ingest{_labels(name="rows_written")}'] == 3
+    assert '# TYPE app_percentile_population gauge' in text
+
+
+def test_slow_requests_are_logged(make_app, caplog):
+    app = make_app(METRICS_SLOW_REQUEST_MS=0, METRICS_SLOW_QUERY_LIMIT=1)
+    with caplog.at_level(logging.WARNING):
+        start_game(app, 'alice')
+
+    [message] = [record.getMessage() for record in caplog.records
+                 if record.getMessage().startswith('slow request POST /register')]
+    # 只列出前 METRICS_SLOW_QUERY_LIMIT 條 SQL
+    assert len(message.splitlines()) == 2
+    assert ' ms  ' in message.splitlines()[1]
+
+
+def test_disabled(make_app):
+    app = make_app(METRICS_ENABLED=False)
+    start_game(app, 'alice')
+    samples = _samples(app.test_client().get('/metrics').get_data(as_text=True))
+    assert not any(name.startswith('app_requests_total') for name in samples)
+    assert not any(name.startswith('app_sql_statements_total') for name in samples)
@@ -0,0 +1,95 @@
+"""反應時間名次 (percentiles.PercentileService) 的快照與水位線"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import GameRound, db
+from archive import archive_sessions
+from conftest import make_rounds, start_game
+from percentiles import PercentileService, ReactionHistogram
+
+
+def _play(app, username, count, reaction_time, end=True):
+    client = start_game(app, username)
+    client.post('/api/record_rounds', json={'rounds': make_rounds(count, reaction_time)})
+    if end:
+        client.post('/api/end_session')
+
+
+def test_histogram_rank_and_quantile():
+    histogram = ReactionHistogram(max_ms=1000)
+    assert histogram.rank(300) is None and histogram.quantile(0.5) is None
+    for ms in (100, 200, 200, 300, 2500):
+        histogram.add(ms)
+
+    # 比 200 ms 慢的有 2 個，同分的 2 個算一半
+    assert histogram.rank(200) == pytest.approx((2 + 1) / 5 * 100)
+    assert histogram.rank(50) == 100
+    assert histogram.quantile(0.5) == 200
+    # 超過上限的值放進最後一格
+    assert histogram.counts[1000] == 1 and histogram.quantile(1.0) == 1000
+
+    restored = ReactionHistogram.from_dict(histogram.to_dict())
+    assert restored.counts == histogram.counts and restored.total == 5
+
+
+def test_percentile_api(app):
+    for name, reaction_time in (('a', 250), ('b', 350), ('c', 450)):
+        _play(app, name, 2, reaction_time)
+
+    response = app.test_client().get('/api/percentile?ms=300').json
+    assert response['population'] == 3
+    assert response['faster_than'] == pytest.approx(2 / 3 * 100)
+    assert app.test_client().get('/api/percentile?ms=300&kind=round').json['population'] == 6
+    assert app.test_client().get('/api/percentile?ms=-1').json['error'] == 'Invalid ms'
+    assert app.test_client().get('/api/percentile?ms=1&kind=x').json['error'] == 'Invalid kind'
+
+
+def test_restart_from_snapshot_equals_rebuild(make_app, tmp_path):
+    settings = {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "game.db"}',
+                'PERCENTILE_SNAPSHOT': str(tmp_path / 'percentiles.json')}
+    _play(make_app(**settings), 'alice', 3, 300)
+    app = make_app(**settings)
+    app.extensions['percentile_service'].save(settings['PERCENTILE_SNAPSHOT'])
+
+    # 快照只含啟動時讀到的資料，之後的增量由下次啟動的 catch_up 補上
+    _play(app, 'bob', 2, 400)
+    restarted = make_app(**settings).extensions['percentile_service']
+
+    rebuilt = PercentileService()
+    with app.app_context():
+        with db.engine.connect() as connection:
+            rebuilt.rebuild({'default': connection})
+    for kind in PercentileService.KINDS:
+        assert restarted.histograms[kind].counts == rebuilt.histograms[kind].counts
+    assert restarted.histograms['round'].total == 5
+
+
+def test_rounds_archived_after_snapshot_are_not_lost(make_app, tmp_path):
+    settings = {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "game.db"}',
+                'PERCENTILE_SNAPSHOT': str(tmp_path / 'percentiles.json')}
+    _play(make_app(**settings), 'alice', 3, 300)
+
+    # 重新啟動：快照涵蓋 alice 的回合
+    app = make_app(**settings)
+    service = app.extensions['percentile_service']
+    service.save(app.config['PERCENTILE_SNAPSHOT'])
+    assert service.snapshot['round'].total == 3
+
+    # 快照之後寫入的回合只在記憶體裡，下次啟動前就被封存
+    _play(app, 'bob', 4, 500)
+    _play(app, 'carol', 1, 700, end=False)
+    assert app.extensions['round_writer'].flush()
+    with app.app_context():
+        assert archive_sessions(db.session, datetime.utcnow() + timedelta(hours=1))['archived'] == 2
+        assert db.session.query(GameRound).count() == 1
+
+    restarted = make_app(**settings).extensions['percentile_service']
+    histogram = restarted.histograms['round']
+    assert histogram.total == 8
+    assert [histogram.counts[ms] for ms in (300, 500, 700)] == [3, 4, 1]
+    assert restarted.histograms['session'].total == 2
+
+    # 再啟動一次 (快照已含封存的回合) 不會重複計入
+    restarted.save(settings['PERCENTILE_SNAPSHOT'])
+    assert make_app(**settings).extensions['percentile_service'].histograms['round'].total == 8
@@ -0,0 +1,61 @@
+"""分析報告的無視窗模式 (--output-dir)：每張圖各自輸出、平行繪製、--profile 計時"""
+import pytest
+
+import generate_data
+import reaction_analysis_fixed as analysis
+from analysis_aggregates import compute_aggregates
+from analysis_charts import CHARTS, render_charts
+
+CHART_NAMES = [name for name, _, _, _ in CHARTS]
+
+
+def test_headless_report(analysis_db, tmp_path, capsys):
+    output_dir = tmp_path / 'report'
+    analysis.main(['--output-dir', str(output_dir), '--format', 'png,svg,html', '--profile', '--no-cache'])
+    captured = capsys.readouterr()
+
+    for name in CHART_NAMES:
+        assert (output_dir / f'{name}.png').read_bytes().startswith(b'\x89PNG')
+        assert b'<svg' in (output_dir / f'{name}.svg').read_bytes()
+    page = (output_dir / 'report.html').read_text(encoding='utf-8')
+    assert all(f'src="{name}.png"' in page for name in CHART_NAMES)
+    assert 'Reaction Time Statistics' in captured.out and 'Reaction Time Statistics' in page
+    assert f'Charts written to {output_dir}' in captured.out
+
+    # --profile 的計時寫到 stderr，包含每張圖的繪製與存檔
+    assert 'Profile (wall time):' in captured.err
+    for stage in ['load', 'aggregate', 'save report.html'] + [f'chart {name}' for name in CHART_NAMES]:
+        assert f' {stage} ' in captured.err, stage
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_render_charts_in_order(analysis_db, tmp_path, processes):
+    aggregates = compute_aggregates(*analysis.check_and_load_data(use_cache=False))
+    results = render_charts(aggregates, str(tmp_path / 'charts'), ['png'], processes)
+    assert [name for name, _, _, _ in results] == CHART_NAMES
+    for name, paths, draw_seconds, save_seconds in results:
+        assert paths == [str(tmp_path / 'charts' / f'{name}.png')]
+        assert draw_seconds > 0 and save_seconds > 0
+
+
+def test_empty_database_writes_sample_report(tmp_path, monkeypatch, capsys):
+    (tmp_path / 'instance').mkdir()
+    generate_data.create_schema(str(tmp_path / 'instance' / 'reaction_game.db'))
+    monkeypatch.chdir(tmp_path)
+
+    analysis.main(['--output-dir', 'out', '--format', 'svg,html', '--no-cache'])
+    assert 'creating sample charts' in capsys.readouterr().out
+    assert (tmp_path / 'out' / 'sample_report.svg').exists()
+    assert 'src="sample_report.svg"' in (tmp_path / 'out' / 'report.html').read_text(encoding='utf-8')
+
+
+@pytest.mark.parametrize('argv', [
+    ['--format', 'png,gif'],
+    ['--format', ''],
+    ['--text', '--output-dir', 'out'],
+    ['--text', '--mode', 'stream'],
+])
+def test_invalid_arguments(argv, capsys):
+    with pytest.raises(SystemExit):
+        analysis.parse_args(argv)
+    assert 'error:' in capsys.readouterr().err
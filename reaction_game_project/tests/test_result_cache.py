@@ -0,0 +1,55 @@
+"""結果頁快取 (result_cache.ResultCache) 與 /results/<id> 的 ETag"""
+from conftest import make_rounds, start_game
+from result_cache import ResultCache
+
+
+def test_lru_eviction_by_size():
+    cache = ResultCache(max_bytes=10)
+    cache.put(1, b'aaaa')
+    cache.put(2, b'bbbb')
+    assert cache.get(1)[0] == b'aaaa'
+
+    # 2 最久沒用到，先被淘汰
+    cache.put(3, b'cccc')
+    assert cache.get(2) is None
+    assert cache.get(1) is not None and cache.get(3) is not None
+
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes'], stats['evictions']) == (2, 8, 1)
+    assert (stats['hits'], stats['misses']) == (3, 1)
+
+
+def test_oversized_page_is_not_cached():
+    cache = ResultCache(max_bytes=4)
+    assert cache.put(1, b'12345') == ResultCache.make_etag(b'12345')
+    assert cache.get(1) is None
+    assert cache.stats()['bytes'] == 0
+
+
+def test_put_replaces_entry():
+    cache = ResultCache(max_bytes=100)
+    cache.put(1, b'old')
+    etag = cache.put(1, b'newer')
+    assert cache.get(1) == (b'newer', etag)
+    assert cache.stats()['bytes'] == 5
+
+
+def test_results_page_etag_and_304(app):
+    client = start_game(app, 'alice')
+    session_id = client.post('/api/record_rounds', json={'rounds': make_rounds(3)}).json['session_id']
+
+    # 尚未結束的會話不快取
+    response = client.get(f'/results/{session_id}')
+    assert response.status_code == 200 and response.headers.get('ETag') is None
+
+    client.post('/api/end_session')
+    first = client.get(f'/results/{session_id}')
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and 'public' in first.headers['Cache-Control']
+
+    second = client.get(f'/results/{session_id}', headers={'If-None-Match': etag})
+    assert second.status_code == 304 and second.data == b''
+    assert client.get(f'/results/{session_id}').data == first.data
+
+    stats = app.extensions['result_cache'].stats()
+    assert stats['entries'] == 1 and stats['hits'] == 2
@@ -0,0 +1,92 @@
+"""已結束遊戲的即時廣播 (result_feed.ResultFeed) 與 /api/stream/results"""
+import json
+
+from conftest import make_rounds, start_game
+from result_feed import ResultFeed
+
+
+def _events(chunks):
+    """SSE 文字中的 (id, event, data)，略過 retry 與註解"""
+    events = []
+    for chunk in chunks:
+        fields = dict(line.split(': ', 1) for line in chunk.strip().splitlines() if not line.startswith(':'))
+        if 'event' in fields:
+            events.append((int(fields['id']) if 'id' in fields else None, fields['event'],
+                           json.loads(fields['data'])))
+    return events
+
+
+def _take(stream, n):
+    """從串流讀出 n 個事件 (不含 retry 與保持連線的註解)"""
+    chunks = []
+    while len(_events(chunks)) < n:
+        chunks.append(next(stream))
+    return _events(chunks)
+
+
+def test_replay_and_last_event_id():
+    feed = ResultFeed(replay_size=3)
+    for i in range(5):
+        feed.publish({'n': i})
+
+    # 只留最近 3 筆；帶 Last-Event-ID 時只補送之後的
+    assert _take(feed.stream(feed.subscribe()), 3) == [(3, 'result', {'n': 2}), (4, 'result', {'n': 3}),
+                                                       (5, 'result', {'n': 4})]
+    assert [event[0] for event in _take(feed.stream(feed.subscribe(4)), 1)] == [5]
+    # 比最新的還大 (別的行程或重新啟動前的編號) 時整個補送
+    assert len(feed.subscribe(99).queue.queue) == 3
+
+
+def test_slow_subscriber_is_dropped():
+    feed = ResultFeed(buffer_size=2)
+    slow, fast = feed.subscribe(), feed.subscribe()
+    fast_stream = feed.stream(fast, keepalive=0.01)
+    for i in range(3):
+        feed.publish({'n': i})
+        assert _take(fast_stream, 1)[0][2] == {'n': i}
+
+    assert slow.dropped and feed.stats()['dropped'] == 1
+    # 送完佇列中的結果後告知被踢掉，客戶端再帶 Last-Event-ID 重連
+    assert [event[1] for event in _take(feed.stream(slow), 3)] == ['result', 'result', 'dropped']
+    assert feed.stats()['subscribers'] == 1
+
+
+def test_close_ends_streams():
+    feed = ResultFeed()
+    stream = feed.stream(feed.subscribe(), keepalive=0.01)
+    assert next(stream).startswith('retry:')
+    assert next(stream) == ': keepalive\n\n'
+    feed.close()
+    assert list(stream) == []
+    assert feed.stats()['subscribers'] == 0
+
+
+def test_end_session_is_streamed(make_app):
+    app = make_app(RESULTS_FEED_KEEPALIVE=0.01)
+    client = start_game(app, 'alice')
+    session_id = client.post('/api/record_rounds', json={'rounds': make_rounds(3, 250)}).json['session_id']
+    assert client.post('/api/end_session').json['success']
+    # 重複呼叫不會再廣播一次
+    client.post('/api/end_session')
+
+    response = app.test_client().get('/api/stream/results')
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    stream = (chunk.decode('utf-8') for chunk in response.response)
+    [(event_id, kind, data)] = _take(stream, 1)
+    assert (event_id, kind) == (1, 'result')
+    assert data['session_id'] == session_id and data['username'] == 'alice'
+    assert (data['total_rounds'], data['average_reaction_time']) == (3, 250)
+    assert data['url'] == f'/results/{session_id}'
+
+    assert next(stream) == ': keepalive\n\n'
+    response.close()
+    assert app.extensions['result_feed'].stats() == {
+        'subscribers': 0, 'published': 1, 'dropped': 0, 'replay_buffer': 1}
+
+
+def test_too_many_listeners(make_app):
+    app = make_app(RESULTS_FEED_MAX_LISTENERS=0)
+    response = app.test_client().get('/api/stream/results')
+    assert response.status_code == 503
+    assert response.json == {'success': False, 'error': 'Too many listeners'}
@@ -0,0 +1,66 @@
+"""彙總表 (rollups.py)：逐局累加的結果與重新計算相同，分析的 rollup 模式與逐回合計算一致"""
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import generate_data
+import reaction_analysis_fixed as analysis
+from analysis_aggregates import compute_aggregates
+from app import db
+from conftest import start_game
+from rollups import rebuild_rollups
+
+
+def _play(client, rounds, end=True):
+    client.get('/simple_reaction_game')
+    client.post('/api/record_rounds', json={'rounds': [
+        {'round_number': i + 1, 'stimulus_color': 'red', 'reaction_time': ms, 'response_accuracy': correct}
+        for i, (ms, correct) in enumerate(rounds)]})
+    if end:
+        assert client.post('/api/end_session').json['success']
+
+
+def _rollup_rows():
+    return {table: [dict(row._mapping, updated_at=None) for row in db.session.execute(
+                db.text(f'SELECT * FROM {table} ORDER BY {key}'))]
+            for table, key in (('user_stats', 'user_id'), ('daily_stats', 'day'))}
+
+
+def test_incremental_rollups_equal_rebuild(app):
+    # 答錯與超過 800 ms 的回合只計入 total_rounds / correct_count
+    alice = start_game(app, 'alice')
+    _play(alice, [(150, True), (250, True), (900, True), (400, False)])
+    _play(alice, [(350, True)])
+    _play(start_game(app, 'bob'), [(120, True)])
+    _play(start_game(app, 'carol'), [(200, True)], end=False)
+
+    with app.app_context():
+        incremental = _rollup_rows()
+        rebuild_rollups(db.session, datetime.utcnow())
+        assert _rollup_rows() == incremental
+
+    assert len(incremental['user_stats']) == 2
+    me = alice.get('/api/stats/me').json
+    assert (me['play_count'], me['total_rounds'], me['correct_count'], me['successful_rounds']) == (2, 5, 4, 3)
+    assert (me['average_reaction_time'], me['best_time'], me['worst_time']) == (250, 150, 350)
+    assert me['std_reaction_time'] == pytest.approx(100)
+
+    [day] = app.test_client().get('/api/stats/daily').json['days']
+    assert day['sessions'] == 3 and day['total_rounds'] == 6
+    assert day['bands'][:4] == [0, 2, 1, 1]
+
+
+def test_rollup_mode_matches_pandas(analysis_db):
+    generate_data.rebuild_rollups(str(analysis_db))
+    expected = compute_aggregates(*analysis.check_and_load_data(use_cache=False))
+    actual = analysis.check_and_read_rollups()
+
+    assert actual['totals'] == expected['totals']
+    summary = expected['summary']
+    for key in ('count', 'mean', 'min', 'max', 'std'):
+        assert actual['summary'][key] == pytest.approx(summary[key]), key
+    # 中位數只能在所在的 100 ms 區段內內插
+    assert abs(actual['summary']['median'] - summary['median']) < 100
+    assert actual['levels']['count'].tolist() == expected['levels']['count'].tolist()
+    pd.testing.assert_frame_equal(actual['user_stats'], expected['user_stats'], check_dtype=False)
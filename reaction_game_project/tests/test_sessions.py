@@ -0,0 +1,51 @@
+"""end_session 與清理程式 (reaper) 結束同一個會話時，彙總表只累加一次"""
+from app import GameSession, UserStats, db
+from conftest import make_rounds, start_game
+
+
+def _play(app, username):
+    client = start_game(app, username)
+    session_id = client.post('/api/record_rounds', json={'rounds': make_rounds(3)}).json['session_id']
+    return client, session_id
+
+
+def _user_stats(app, session_id):
+    with app.app_context():
+        game_session = db.session.get(GameSession, session_id)
+        stats = db.session.get(UserStats, game_session.user_id)
+        return game_session.end_time, stats.play_count, stats.total_rounds
+
+
+def test_end_session_then_reaper(app):
+    client, session_id = _play(app, 'alice')
+    assert client.post('/api/end_session').json['success']
+
+    with app.app_context():
+        assert app.extensions['session_reaper'].run_once(stale_minutes=0)['finalized'] == 0
+    end_time, play_count, total_rounds = _user_stats(app, session_id)
+    assert end_time is not None
+    assert (play_count, total_rounds) == (1, 3)
+
+
+def test_reaper_then_end_session(app):
+    client, session_id = _play(app, 'alice')
+    with app.app_context():
+        assert app.extensions['session_reaper'].run_once(stale_minutes=0)['finalized'] == 1
+
+    # 玩家之後才送出 end_session：仍然成功，但不會再累加一次
+    result = client.post('/api/end_session').json
+    assert result['success'] and result['total_rounds'] == 3
+    assert client.post('/api/end_session').json['success']
+    assert _user_stats(app, session_id)[1:] == (1, 3)
+
+
+def test_reaper_deletes_sessions_without_rounds(app):
+    client = start_game(app, 'alice')
+    # 只在第一批回合送來時才建立會話，所以直接建立一個空的會話
+    with app.app_context():
+        user_id = db.session.execute(db.text('SELECT id FROM user')).scalar_one()
+        db.session.add(GameSession(user_id=user_id))
+        db.session.commit()
+        assert app.extensions['session_reaper'].run_once(stale_minutes=0) == {'finalized': 0, 'deleted': 1}
+        assert db.session.query(GameSession).count() == 0
+    assert client.post('/api/end_session').json['error'] == 'No rounds recorded'
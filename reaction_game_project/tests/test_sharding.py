@@ -0,0 +1,95 @@
+"""依玩家分片 (sharding.ShardRouter)：會話與回合寫進玩家所在的分片，id 帶有分片編號"""
+import sqlite3
+
+import pytest
+
+import reaction_analysis_fixed as analysis
+from app import GameSession, User, db
+from conftest import make_rounds, start_game
+from sharding import SHARD_ID_SHIFT, shard_for_id, shard_for_user
+
+
+@pytest.fixture
+def sharded(make_app, tmp_path, monkeypatch):
+    """回傳 sharded(count)：主資料庫與分片檔放在 tmp/instance，檔名是分析腳本預設找的名稱"""
+    directory = tmp_path / 'instance'
+    directory.mkdir()
+    monkeypatch.chdir(tmp_path)
+
+    def factory(count):
+        return make_app(SQLALCHEMY_DATABASE_URI=f'sqlite:///{directory / "reaction_game.db"}',
+                        SHARD_COUNT=count,
+                        SHARD_URI_TEMPLATE=f'sqlite:///{directory}/reaction_game_shard{{index}}.db')
+    return factory
+
+
+def _play(app, username, count):
+    client = start_game(app, username)
+    session_id = client.post('/api/record_rounds', json={'rounds': make_rounds(count)}).json['session_id']
+    assert client.post('/api/end_session').json['success']
+    return client, session_id
+
+
+def _count(path, table):
+    with sqlite3.connect(path) as conn:
+        return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+def test_shard_for_id():
+    assert shard_for_id(12345) is None
+    assert shard_for_id(1 << SHARD_ID_SHIFT) == 0
+    assert shard_for_id((3 << SHARD_ID_SHIFT) + 7) == 2
+
+
+def test_sessions_are_written_to_the_users_shard(sharded, tmp_path):
+    app = sharded(2)
+    played = {name: _play(app, name, 3) for name in ('alice', 'bob', 'carol', 'dave', 'erin')}
+
+    with app.app_context():
+        users = {user.username: user.id for user in db.session.query(User)}
+        assert db.session.query(GameSession).count() == 0
+    shards = {name: shard_for_user(users[name], 2) for name in played}
+    assert set(shards.values()) == {0, 1}
+
+    for name, (client, session_id) in played.items():
+        assert shard_for_id(session_id) == shards[name]
+        assert client.get(f'/results/{session_id}').status_code == 200
+        assert client.get('/api/stats/me').json['total_rounds'] == 3
+
+    for shard in (0, 1):
+        path = tmp_path / 'instance' / f'reaction_game_shard{shard}.db'
+        sessions = sum(1 for value in shards.values() if value == shard)
+        assert _count(path, 'game_session') == sessions
+        assert _count(path, 'game_round') == 3 * sessions
+        # 每個分片有自己的彙總表
+        assert _count(path, 'user_stats') == sessions
+
+
+def _play_again(client, count):
+    client.get('/simple_reaction_game')
+    client.post('/api/record_rounds', json={'rounds': make_rounds(count)})
+    assert client.post('/api/end_session').json['success']
+
+
+def test_rows_written_before_sharding_stay_in_place(sharded, tmp_path):
+    alice, old_session = _play(sharded(0), 'alice', 2)
+    _play_again(alice, 2)
+    assert shard_for_id(old_session) is None
+
+    app = sharded(2)
+    assert alice.get(f'/results/{old_session}').status_code == 200
+    bob, new_session = _play(app, 'bob', 4)
+    _play_again(bob, 4)
+    assert new_session >= 1 << SHARD_ID_SHIFT
+    # id 超出分片數的範圍時當成找不到
+    assert app.test_client().get(f'/results/{5 << SHARD_ID_SHIFT}').status_code == 302
+
+    # 主資料庫與分片各封存一個會話 (各自保留回合 id 最大的會話)
+    result = app.test_cli_runner().invoke(args=['archive-sessions', '--older-than-hours', '-1'])
+    assert '已封存 2 個會話' in result.output
+    assert _count(tmp_path / 'instance' / 'reaction_game.db', 'game_round') == 2
+    assert app.test_client().get(f'/results/{new_session}').status_code == 200
+
+    # 分析腳本合併主資料庫與各分片 (含封存的回合)
+    aggregates = analysis.check_and_aggregate_in_sql()
+    assert aggregates['totals'] == {'users': 2, 'sessions': 4, 'rounds': 12, 'correct': 12}